@@ -3,70 +3,172 @@ import os
 import pandas as pd
 from wcvpy.wcvp_download import get_all_taxa, add_authors_to_col
 
-from chaining_methods import compare_two_versions, chain_two_databases, get_direct_name_updates, compare_and_output_chained_and_direct_updates, \
-    summarise_results, get_overrepresented_genera
+from chaining_methods import compare_all_version_pairs, get_direct_name_updates, compare_chained_and_direct_updates, \
+    get_overrepresented_genera, encode_all_versions, TransitivityIndex, ResolutionGraph, compare_all_version_paths, \
+    get_reachable_names
+from chaining_methods.drift_rollups import get_drift_rollups
+from chaining_methods.name_flags import NameFlagMatrix
+from chaining_methods.name_history import NameHistory
+from chaining_methods.name_stability import get_stability_profiles, rank_by_instability
+from chaining_methods.new_release import append_release, get_registered_releases, get_registered_release_dates
+from chaining_methods.result_store import pair_dataset_name
+from chaining_methods.summaries import summarise_columns
+from chaining_methods.version_cache import load_cached_version
+from chaining_methods.version_deltas import write_version_store
 
 repo_path = os.environ.get('KEWSCRATCHPATH')
 this_repo_path = os.path.join(repo_path, 'TaxoDrift')
 _output_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
 _input_path = os.path.join(this_repo_path, 'WCVP_versions', 'inputs')
+# Pair results are also written as parquet, partitioned by taxonomy and versions
+_parquet_path = os.path.join(_output_path, pair_dataset_name)
 
 wcvp_version_order = ['v10', 'v11', 'v12', 'v13', 'v14']
+wcvp_release_dates = {'v10': '2022-10', 'v11': '2023-04', 'v12': '2023-09', 'v13': '2024-05', 'v14': '2025-05'}
 
 if not os.path.isdir(_output_path):
     os.mkdir(_output_path)
 
 
-def compare_all_pairs():
-    v10_taxa, v11_taxa, v12_taxa, v13_taxa, v14_taxa = get_all_databases()
+def compare_all_pairs(detail_pairs: list = None, n_workers: int = 1):
+    taxa_versions = get_release_versions()
+    # One name dictionary for all versions, so joins in each comparison are on int codes
+    name_dictionary = encode_all_versions(list(taxa_versions.values()))
 
-    compare_two_versions(v10_taxa, v11_taxa,
-                         'v10', 'v11', _output_path)
-    compare_two_versions(v10_taxa, v12_taxa,
-                         'v10', 'v12', _output_path)
-    compare_two_versions(v10_taxa, v13_taxa,
-                         'v10', 'v13', _output_path)
+    # Each version is preprocessed once, then result summaries are written for every pair.
+    # Full outputs are only written for detail_pairs
+    return compare_all_version_pairs(taxa_versions, _output_path, name_dictionary=name_dictionary, detail_pairs=detail_pairs,
+                                     n_workers=n_workers, parquet_path=_parquet_path, taxonomy='wcvp')
 
-    compare_two_versions(v11_taxa, v12_taxa,
-                         'v11', 'v12', _output_path)
-    compare_two_versions(v11_taxa, v13_taxa,
-                         'v11', 'v13', _output_path)
 
-    compare_two_versions(v12_taxa, v13_taxa, 'v12', 'v13', _output_path)
+def compare_all_paths():
+    # Every path of versions from the first to the latest release, e.g. skipping v11 and v13
+    tags = get_release_order()
+    return compare_all_version_paths(get_release_versions(), tags[0], tags[-1], os.path.join(_output_path, 'all_paths'))
 
-    ## 14
-    compare_two_versions(v10_taxa, v14_taxa, 'v10', 'v14', _output_path)
-    compare_two_versions(v11_taxa, v14_taxa, 'v11', 'v14', _output_path)
-    compare_two_versions(v12_taxa, v14_taxa, 'v12', 'v14', _output_path)
-    compare_two_versions(v13_taxa, v14_taxa, 'v13', 'v14', _output_path)
+
+def _get_chain_tag(tags: list) -> str:
+    # Tag of the accepted names at the end of a chain through the given versions, e.g. v10_11_12_13
+    return '_'.join([tags[0]] + [t[1:] for t in tags[1:]])
 
 
 def full_chain_results():
     # Note when chaining like this, in intermediary steps ambiguous/non resolving names may be dropped.
     # This may somewhat reflect real world situations but is optimistic about the chaining process
     out_dir = os.path.join('outputs', 'full_chain')
-    v10_taxa, v11_taxa, v12_taxa, v13_taxa, v14_taxa = get_all_databases()
-    # Start with 10 -> 11
-    v10_11_chained = chain_two_databases(v10_taxa, v11_taxa, 'v10', 'v11', out_dir)
-    v10_11_chained = v10_11_chained.rename(columns={'v11_chained_accepted_name_w_author': 'accepted_name_w_author'})
-    v10_11_chained = v10_11_chained[['taxon_name_w_authors', 'accepted_name_w_author']]
+    tags = get_release_order()
+    taxa_versions = get_release_versions()
+    name_dictionary = encode_all_versions(list(taxa_versions.values()))
+    # Chain from the first release through every release to the latest, e.g. 10 -> 11 -> 12 -> 13 -> 14,
+    # with the resolution graph of all versions
+    graph = ResolutionGraph(tags, taxa_versions, name_dictionary=name_dictionary)
+    chain_tag = _get_chain_tag(tags[:-1])
+    full_chain = graph.get_chained_records(tags[0], out_dir, chain_tag=chain_tag)
+    cycles = graph.find_cycles()
+    print(f'{len(cycles)} names resolve back to themselves across versions')
+    cycles.to_csv(os.path.join(out_dir, 'resolution_cycles.csv'))
+
+    direct_updated_records = get_direct_name_updates(graph.maps[tags[0]], graph.maps[tags[-1]], tags[-1], out_dir)
+    # The pessimistic counterpart, following every resolution of ambiguous names
+    get_reachable_names(graph.maps[tags[0]], [graph.maps[tag] for tag in tags[1:]], tags[-1], out_dir, chain_tag=chain_tag)
+    # Also writes the result summary
+    return compare_chained_and_direct_updates(full_chain, direct_updated_records, chain_tag, tags[-1], out_dir,
+                                              parquet_path=_parquet_path, taxonomy='wcvp', start_map=graph.maps[tags[0]])
+
+
+def build_transitivity_index(index_dir: str = None):
+    # Index of all versions, used to resolve user datasets with chaining_methods.resolve_dataset
+    if index_dir is None:
+        index_dir = os.path.join(_output_path, 'transitivity_index')
+    TransitivityIndex(get_release_versions()).save(index_dir)
+    return index_dir
+
+
+def build_version_store(store_dir: str = None):
+    # The first release in full and the changes in each later release, see chaining_methods.version_deltas
+    if store_dir is None:
+        store_dir = os.path.join(_output_path, 'version_store')
+    write_version_store(get_release_versions(), store_dir)
+    return store_dir
+
+
+def get_release_order():
+    # wcvp_version_order followed by any releases added with add_release
+    return get_registered_releases(_output_path, wcvp_version_order)
+
+
+def get_release_dates():
+    return get_registered_release_dates(_output_path, wcvp_release_dates)
+
+
+def get_release_versions() -> dict:
+    # Parsed taxa of every release, in release order
+    return {tag: get_version_taxa(tag) for tag in get_release_order()}
+
+
+def add_release(tag: str, release_date: str, n_workers: int = 1):
+    """
+    Compare a new release with every registered release and extend the full chain to it, without recomputing existing pairs.
+    The release must already be in the inputs, e.g. from get_all_taxa(version=None, output_csv=.., get_new_version=True).
+
+    :param tag: e.g. 'v15'.
+    :param release_date: e.g. '2026-05'.
+    """
+    tags = get_release_order()
+    # As in full_chain_results, e.g. v10_11_12_13_14 for the chain ending in v15
+    chain_tag = _get_chain_tag(tags)
+    return append_release(get_version_taxa, tag, _output_path, tags, release_date, n_workers=n_workers, parquet_path=_parquet_path,
+                          taxonomy='wcvp', full_chain_dir=os.path.join('outputs', 'full_chain'), chain_tag=chain_tag)
+
+
+def build_name_history(history_dir: str = None):
+    # Resolutions of every name over the release dates, for point in time queries with chaining_methods.name_history
+    if history_dir is None:
+        history_dir = os.path.join(_output_path, 'name_history')
+    NameHistory(get_release_versions(), get_release_dates()).save(history_dir)
+    return history_dir
 
-    # Then chain -> 12
-    v10_11_12_chained = chain_two_databases(v10_11_chained, v12_taxa, 'v10_11', 'v12', out_dir)
-    v10_11_12_chained = v10_11_12_chained.rename(columns={'v12_chained_accepted_name_w_author': 'accepted_name_w_author'})
-    v10_11_12_chained = v10_11_12_chained[['taxon_name_w_authors', 'accepted_name_w_author']]
 
-    # Then -> 13
-    v10_11_12_13_chained = chain_two_databases(v10_11_12_chained, v13_taxa, 'v10_11_12', 'v13', out_dir)
-    v10_11_12_13_chained = v10_11_12_13_chained.rename(columns={'v13_chained_accepted_name_w_author': 'accepted_name_w_author'})
-    v10_11_12_13_chained = v10_11_12_13_chained[['taxon_name_w_authors', 'accepted_name_w_author']]
+def build_name_flags(matrix_dir: str = None):
+    # Bit packed flags of every name in every version, for set counts across versions with chaining_methods.name_flags
+    if matrix_dir is None:
+        matrix_dir = os.path.join(_output_path, 'name_flags')
+    NameFlagMatrix(get_release_versions()).save(matrix_dir)
+    return matrix_dir
 
-    v10_11_12_13_14_chained = chain_two_databases(v10_11_12_13_chained, v14_taxa, 'v10_11_12_13', 'v14', out_dir)
 
-    direct_updated_records = get_direct_name_updates(v10_taxa, v14_taxa, 'v14', out_dir)
-    results_df = compare_and_output_chained_and_direct_updates(v10_11_12_13_14_chained, direct_updated_records,
-                                                               'v10_11_12_13', 'v14', out_dir)
-    pass
+def build_name_stability(outfile: str = None) -> pd.DataFrame:
+    # Stability of every name over all versions, least stable first, see chaining_methods.name_stability
+    if outfile is None:
+        outfile = os.path.join(_output_path, 'name_stability.parquet')
+    profiles = get_stability_profiles(get_release_versions())
+    profiles = rank_by_instability(profiles)
+    profiles.to_parquet(outfile, compression='zstd')
+    return profiles
+
+
+def build_drift_rollups(outfile: str = None) -> pd.DataFrame:
+    # Disagreements per genus and family for every pair and full chain, see chaining_methods.drift_rollups
+    if outfile is None:
+        outfile = os.path.join(_output_path, 'drift_rollups.parquet')
+    rollups = get_drift_rollups(get_release_versions(), 'wcvp')
+    rollups.to_parquet(outfile, compression='zstd')
+    return rollups
+
+
+def get_input_file(tag: str) -> str:
+    return os.path.join(_input_path, f'{tag}_taxa.csv')
+
+
+def _parse_version(tag: str):
+    taxa = pd.read_csv(os.path.join(_input_path, f'{tag}_taxa.csv'), index_col=0)
+    taxa['taxon_name_w_authors'] = add_authors_to_col(taxa, 'taxon_name')
+    return taxa
+
+
+def get_version_taxa(tag: str):
+    # Parsed versions are cached, and reparsed when the csv or parsing code changes
+    return load_cached_version(tag, get_input_file(tag), lambda: _parse_version(tag), [_parse_version, add_authors_to_col])
 
 
 def get_all_databases(do_summaries=False):
@@ -76,46 +178,39 @@ def get_all_databases(do_summaries=False):
     # v13_taxa = get_all_taxa(version='13', output_csv=os.path.join(_input_path, 'v13_taxa.csv'))
     # v14_taxa = get_all_taxa(version=None, output_csv=os.path.join(_input_path, 'v14_taxa.csv'), get_new_version=True)
 
-    v10_taxa = pd.read_csv(os.path.join(_input_path, 'v10_taxa.csv'), index_col=0)
-    v11_taxa = pd.read_csv(os.path.join(_input_path, 'v11_taxa.csv'), index_col=0)
-    v12_taxa = pd.read_csv(os.path.join(_input_path, 'v12_taxa.csv'), index_col=0)
-    v13_taxa = pd.read_csv(os.path.join(_input_path, 'v13_taxa.csv'), index_col=0)
-    v14_taxa = pd.read_csv(os.path.join(_input_path, 'v14_taxa.csv'), index_col=0)
-
-    v10_taxa['taxon_name_w_authors'] = add_authors_to_col(v10_taxa, 'taxon_name')
-    v11_taxa['taxon_name_w_authors'] = add_authors_to_col(v11_taxa, 'taxon_name')
-    v12_taxa['taxon_name_w_authors'] = add_authors_to_col(v12_taxa, 'taxon_name')
-    v13_taxa['taxon_name_w_authors'] = add_authors_to_col(v13_taxa, 'taxon_name')
-    v14_taxa['taxon_name_w_authors'] = add_authors_to_col(v14_taxa, 'taxon_name')
+    v10_taxa = get_version_taxa('v10')
+    v11_taxa = get_version_taxa('v11')
+    v12_taxa = get_version_taxa('v12')
+    v13_taxa = get_version_taxa('v13')
+    v14_taxa = get_version_taxa('v14')
 
     if do_summaries:
-        v10_taxa.describe(include='all').to_csv(os.path.join(_input_path, 'v10_taxa_summary.csv'))
-        v11_taxa.describe(include='all').to_csv(os.path.join(_input_path, 'v11_taxa_summary.csv'))
-        v12_taxa.describe(include='all').to_csv(os.path.join(_input_path, 'v12_taxa_summary.csv'))
-        v13_taxa.describe(include='all').to_csv(os.path.join(_input_path, 'v13_taxa_summary.csv'))
-        v14_taxa.describe(include='all').to_csv(os.path.join(_input_path, 'v14_taxa_summary.csv'))
+        summarise_columns(v10_taxa).to_csv(os.path.join(_input_path, 'v10_taxa_summary.csv'))
+        summarise_columns(v11_taxa).to_csv(os.path.join(_input_path, 'v11_taxa_summary.csv'))
+        summarise_columns(v12_taxa).to_csv(os.path.join(_input_path, 'v12_taxa_summary.csv'))
+        summarise_columns(v13_taxa).to_csv(os.path.join(_input_path, 'v13_taxa_summary.csv'))
+        summarise_columns(v14_taxa).to_csv(os.path.join(_input_path, 'v14_taxa_summary.csv'))
 
     return v10_taxa, v11_taxa, v12_taxa, v13_taxa, v14_taxa
 
 
+def get_genus_results():
+    # Uses the v10 -> v14 outputs
+    genus_counts = get_overrepresented_genera(_output_path, 'v10', 'v14', get_version_taxa('v10'))
+    print(genus_counts)
+    genus_counts.to_csv(os.path.join(_output_path, f'v10_v14', 'genus_counts.csv'))
+    return genus_counts
+
+
 def main():
     get_all_databases(do_summaries=True)
 
-    compare_all_pairs()
+    # v10 -> v14 outputs are used in the genus results and other analyses
+    compare_all_pairs(detail_pairs=[('v10', 'v14')])
     full_chain_results()
-    summarise_results(os.path.join(_output_path, f'full_chain'), f'v10_11_12_13_v14', old_tag='v10')
-    for w in wcvp_version_order:
-        for w2 in wcvp_version_order:
-            try:
-                summarise_results(os.path.join(_output_path, f'{w}_{w2}'), f'{w}_{w2}', old_tag=w)
-            except:
-                print(f'Could not summarise {w}, {w2}')
-
-    # Genus results
-    v10_taxa, v11_taxa, v12_taxa, v13_taxa, v14_taxa = get_all_databases()
-    genus_counts = get_overrepresented_genera(_output_path, 'v10', 'v14', v10_taxa)
-    print(genus_counts)
-    genus_counts.to_csv(os.path.join(_output_path, f'v10_v14', 'genus_counts.csv'))
+    compare_all_paths()
+
+    get_genus_results()
 
 
 if __name__ == '__main__':
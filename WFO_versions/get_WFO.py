@@ -9,6 +9,11 @@ import pandas as pd
 from wcvpy.wcvp_download import clean_whitespaces_in_names
 from wcvpy.wcvp_name_matching import remove_spacelike_chars, add_space_around_hybrid_chars_and_infraspecific_epithets
 
+from chaining_methods.name_cleaning import clean_names, clean_name
+from chaining_methods.summaries import summarise_columns, StreamingSummary
+from chaining_methods.transitivity_index import TransitivityIndex
+from chaining_methods.version_cache import load_cached_version, write_cached_version
+
 _wfo_downloads_path = os.path.join(Path.home(), '.wfo_downloads')
 
 _all_ranks = list(sorted(
@@ -28,8 +33,11 @@ class WFO_Version():
         self.extension = extension
         self.DOI = DOI
 
+    def get_zip_file_path(self):
+        return os.path.join(_wfo_downloads_path, f'WFOTaxonomicBackbone_{self.tag}.zip')
+
     def get_csv_file(self):
-        input_zip_file = os.path.join(_wfo_downloads_path, f'WFOTaxonomicBackbone_{self.tag}.zip')
+        input_zip_file = self.get_zip_file_path()
         zf = zipfile.ZipFile(input_zip_file)
         csv_file = zf.open(f'classification.{self.extension}')
         return csv_file
@@ -58,10 +66,15 @@ WFO_VERSIONS = all_versions()
 
 latest_wfo_version_string = WFO_VERSIONS[-1].tag
 oldest_wfo_version_string = WFO_VERSIONS[0].tag
-other_version_strings = ['201905', '202112', '202204','202207','202212','202306','202312','202306','202406']
+other_version_strings = ['201905', '202112', '202204','202207','202212','202306','202312','202406']
 all_wfo_version_strings = [oldest_wfo_version_string] + other_version_strings + [latest_wfo_version_string]
 wfo_version_comparable_to_v10_string = '202212'
-wfo_version_strings_after_v10 = ['202306','202312','202306','202406']
+wfo_version_strings_after_v10 = ['202306','202312','202406']
+
+
+def get_release_date(tag: str) -> str:
+    # WFO tags are the release year and month, e.g. 202412 -> 2024-12
+    return tag[:4] + '-' + tag[4:]
 
 
 def get_version_from_tag(tag:str):
@@ -133,10 +146,12 @@ def wfo_sanity_checks(all_wfo_data_untouched, all_wfo_data, accepted_data, resol
         assert 'Accepted' not in what_are_these['taxonomicStatus'].values
 
 
-def parse_wfo_data(all_wfo_data):
-    ## Get a copy that wont be edited, just for sanity checks
-    all_wfo_data_untouched = all_wfo_data.copy(deep=True)
+# Columns returned by parse_wfo_data
+wfo_output_columns = ['taxonID', 'taxon_name', 'taxon_name_w_authors', 'accepted_name', 'accepted_name_w_author', 'accepted_name_id',
+                      'accepted_species', 'accepted_species_w_author', 'accepted_genus', 'taxon_rank', 'taxon_status']
+
 
+def add_wfo_name_columns(all_wfo_data):
     # restrict to genus and lower
     # some genus names werent correctly set
     all_wfo_data['genus'] = np.where(all_wfo_data['taxonRank'] == 'Genus', all_wfo_data['scientificName'], all_wfo_data['genus'])
@@ -147,7 +162,6 @@ def parse_wfo_data(all_wfo_data):
     all_wfo_data['taxon_name_w_authors'] = all_wfo_data['taxon_name'] + ' ' + all_wfo_data['scientificNameAuthorship'].fillna('').astype(str)
 
     ## Add a species name
-    print(all_wfo_data['taxonRank'].unique().tolist())
     all_wfo_data['species_name'] = np.where(all_wfo_data['taxonRank'] == 'Genus', np.nan,
                                             all_wfo_data['genus'] + ' ' + all_wfo_data['specificEpithet'].fillna('').astype(str))
     all_wfo_data['species_name_w_author'] = np.where(all_wfo_data['species_name'].isna(), np.nan,
@@ -157,10 +171,10 @@ def parse_wfo_data(all_wfo_data):
     ### Set accepted_name_ids either from taxonID (for accepted names) or acceptedNameUsageID
     all_wfo_data['accepted_name_id'] = np.where(all_wfo_data['taxonomicStatus'] == 'Accepted', all_wfo_data['taxonID'],
                                                 all_wfo_data['acceptedNameUsageID'])
-    ### Remove instances without accepted ids
-    resolved_wfo_data = all_wfo_data.dropna(subset=['accepted_name_id'])
+    return all_wfo_data
 
-    ### Use the accepted IDs to get accepted names from the original dataframe
+
+def get_accepted_wfo_data(all_wfo_data):
     accepted_data = all_wfo_data[all_wfo_data['taxonomicStatus'] == 'Accepted'][
         ['taxonID', 'taxon_name', 'taxon_name_w_authors', 'species_name', 'species_name_w_author', 'genus']]
     accepted_data = accepted_data.dropna(subset=['taxonID'])
@@ -169,10 +183,29 @@ def parse_wfo_data(all_wfo_data):
                  'species_name': 'accepted_species',
                  'species_name_w_author': 'accepted_species_w_author',
                  'genus': 'accepted_genus'})
+    return accepted_data
+
 
+def add_accepted_wfo_data(resolved_wfo_data, accepted_data):
     resolved_wfo_data = pd.merge(resolved_wfo_data, accepted_data, how='left', left_on=['accepted_name_id'], right_on=['acc_id'])
     resolved_wfo_data['taxon_rank'] = resolved_wfo_data['taxonRank']
     resolved_wfo_data['taxon_status'] = resolved_wfo_data['taxonomicStatus']
+    return resolved_wfo_data
+
+
+def parse_wfo_data(all_wfo_data):
+    ## Get a copy that wont be edited, just for sanity checks
+    all_wfo_data_untouched = all_wfo_data.copy(deep=True)
+
+    all_wfo_data = add_wfo_name_columns(all_wfo_data)
+    print(all_wfo_data['taxonRank'].unique().tolist())
+
+    ### Remove instances without accepted ids
+    resolved_wfo_data = all_wfo_data.dropna(subset=['accepted_name_id'])
+
+    ### Use the accepted IDs to get accepted names from the original dataframe
+    accepted_data = get_accepted_wfo_data(all_wfo_data)
+    resolved_wfo_data = add_accepted_wfo_data(resolved_wfo_data, accepted_data)
 
     wfo_sanity_checks(all_wfo_data_untouched, all_wfo_data, accepted_data, resolved_wfo_data)
 
@@ -181,10 +214,7 @@ def parse_wfo_data(all_wfo_data):
 
     ### and only return used columns
 
-    return resolved_wfo_data[
-        ['taxonID', 'taxon_name', 'taxon_name_w_authors', 'accepted_name', 'accepted_name_w_author', 'accepted_name_id', 'accepted_species',
-         'accepted_species_w_author', 'accepted_genus',
-         'taxon_rank', 'taxon_status']]
+    return resolved_wfo_data[wfo_output_columns]
 
 
 def clean_columns(all_wfo_data):
@@ -194,22 +224,42 @@ def clean_columns(all_wfo_data):
                                                all_wfo_data['taxonomicStatus'])  # spelling mistake
 
     ## Fix some issues around hybrid characters and generally clean
-    all_wfo_data['scientificName'] = all_wfo_data['scientificName'].apply(remove_spacelike_chars)
-    all_wfo_data['scientificName'] = all_wfo_data['scientificName'].apply(add_space_around_hybrid_chars_and_infraspecific_epithets)
-    all_wfo_data['scientificName'] = all_wfo_data['scientificName'].apply(clean_whitespaces_in_names)
+    all_wfo_data['scientificName'] = clean_names(all_wfo_data['scientificName'])
 
     return all_wfo_data
 
 
-def get_version_data(version: WFO_Version):
-    csv_file = version.get_csv_file()
+def get_version_data(version: WFO_Version, memory_budget_mb: int = None):
+    """
+    Parsed data for the version, which is cached and reparsed when the zip file or parsing code changes.
 
-    all_wfo_data = pd.read_csv(csv_file, sep='\t', encoding='latin1')
+    :param memory_budget_mb: if given, the version is parsed in chunks with stream_version_data, so that parsing fits in roughly this much
+        memory. Use this for the largest releases.
+    """
+    parsing_functions = [parse_version_data, stream_version_data, repair_encoding, clean_columns, parse_wfo_data, add_wfo_name_columns,
+                         get_accepted_wfo_data, add_accepted_wfo_data, clean_names, clean_name, remove_spacelike_chars,
+                         add_space_around_hybrid_chars_and_infraspecific_epithets, clean_whitespaces_in_names]
+    if memory_budget_mb is None:
+        return load_cached_version(version.tag, version.get_zip_file_path(), lambda: parse_version_data(version), parsing_functions)
+    cache_file = write_cached_version(version.tag, version.get_zip_file_path(),
+                                      lambda out_file: stream_version_data(version, out_file, memory_budget_mb), parsing_functions)
+    return pd.read_parquet(cache_file)
 
+
+def repair_encoding(all_wfo_data):
     all_wfo_data = all_wfo_data.rename(columns={'ï»¿taxonID': 'taxonID'})  ## This was a weird error in the earliest version
 
     all_wfo_data['scientificName'] = all_wfo_data['scientificName'].str.encode('latin1').str.decode('utf-8', errors='replace')
     all_wfo_data['scientificNameAuthorship'] = all_wfo_data['scientificNameAuthorship'].str.encode('latin1').str.decode('utf-8', errors='replace')
+    return all_wfo_data
+
+
+def parse_version_data(version: WFO_Version):
+    csv_file = version.get_csv_file()
+
+    all_wfo_data = pd.read_csv(csv_file, sep='\t', encoding='latin1')
+
+    all_wfo_data = repair_encoding(all_wfo_data)
     cleaned = clean_columns(all_wfo_data)
     resolved = parse_wfo_data(cleaned)
 
@@ -217,6 +267,97 @@ def get_version_data(version: WFO_Version):
 
     return resolved
 
+
+# Columns kept from each chunk in the first pass of stream_version_data
+_streamed_columns = ['taxonID', 'taxon_name', 'taxon_name_w_authors', 'species_name', 'species_name_w_author', 'genus', 'accepted_name_id',
+                     'taxonRank', 'taxonomicStatus']
+
+
+def _get_chunk_size(version: WFO_Version, memory_budget_mb: int) -> int:
+    # Estimate the peak memory of a row from a sample parsed as in the first pass of stream_version_data. While a chunk is parsed it
+    # is held as read, as parsed, and as the arrow table that is written, so all three count towards each row
+    import pyarrow as pa
+
+    csv_file = version.get_csv_file()
+    sample = pd.read_csv(csv_file, sep='\t', encoding='latin1', dtype=str, nrows=10000)
+    csv_file.close()
+    read_bytes = sample.memory_usage(deep=True).sum()
+    parsed = add_wfo_name_columns(clean_columns(repair_encoding(sample.copy())))
+    parsed_bytes = parsed.memory_usage(deep=True).sum()
+    table_bytes = pa.Table.from_pandas(parsed[_streamed_columns], preserve_index=False).nbytes
+    bytes_per_row = (read_bytes + parsed_bytes + table_bytes) / max(len(sample), 1)
+    return max(int(memory_budget_mb * 1e6 / bytes_per_row), 1000)
+
+
+def stream_version_data(version: WFO_Version, out_file: str, memory_budget_mb: int = 4000, summary: StreamingSummary = None):
+    """
+    Chunked equivalent of parse_version_data, for releases too large to load at once (e.g. 201904).
+    The zip member is read in chunks which are cleaned and written to a temporary parquet file. Accepted names are then read back from it
+    and joined to each chunk in turn, writing the parsed version to out_file.
+    Only the status and rank checks from wfo_sanity_checks are run, as the others need the whole version in memory.
+
+    :param memory_budget_mb: approximate peak memory to use while parsing. Chunks are sized with _get_chunk_size. The table of accepted
+        names is needed for every chunk of the second pass, so it is held in memory throughout and counts against the budget, and a
+        ValueError is raised if it leaves too little of the budget for the chunks.
+    :param summary: if given, updated with each chunk of the parsed version.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    chunk_size = _get_chunk_size(version, memory_budget_mb)
+    print(f'Parsing {version.tag} in chunks of {chunk_size} rows')
+    streamed_file = out_file + '.streamed'
+    streamed_schema = pa.schema([(c, pa.string()) for c in _streamed_columns])
+    statuses = set()
+    ranks = set()
+    csv_file = version.get_csv_file()
+    try:
+        with pq.ParquetWriter(streamed_file, streamed_schema, compression='zstd') as writer:
+            for chunk in pd.read_csv(csv_file, sep='\t', encoding='latin1', dtype=str, chunksize=chunk_size):
+                # Names are only deduplicated within the chunk (clean_names is given no cache), so memory doesn't grow with the release
+                chunk = clean_columns(repair_encoding(chunk))
+                statuses.update(chunk['taxonomicStatus'].dropna().unique())
+                chunk = add_wfo_name_columns(chunk)
+                ranks.update(chunk['taxonRank'].unique())
+                writer.write_table(pa.Table.from_pandas(chunk[_streamed_columns], schema=streamed_schema, preserve_index=False))
+
+        print(list(statuses))
+        for c in statuses:
+            assert c in ['Synonym', 'Doubtful', 'Accepted', 'Heterotypicsynonym', 'Homotypicsynonym', 'Unchecked', 'Ambiguous']
+        for a in ranks:
+            assert a in ranks_to_use
+
+        accepted_data = get_accepted_wfo_data(pd.read_parquet(streamed_file, filters=[('taxonomicStatus', '==', 'Accepted')]))
+        accepted_bytes = accepted_data.memory_usage(deep=True).sum()
+        remaining_budget = memory_budget_mb * 1e6 - accepted_bytes
+        if remaining_budget < memory_budget_mb * 1e5:
+            raise ValueError(f'Accepted names of {version.tag} use {accepted_bytes / 1e6:.0f}MB, leaving too little of the memory budget '
+                             f'of {memory_budget_mb}MB to parse in chunks')
+        chunk_size = max(int(chunk_size * remaining_budget / (memory_budget_mb * 1e6)), 1000)
+
+        output_schema = pa.schema([(c, pa.string()) for c in wfo_output_columns] + [('__index_level_0__', pa.int64())])
+        # Take the pandas metadata from an empty frame, so that the index is restored when reading
+        output_schema = pa.Table.from_pandas(pd.DataFrame(columns=wfo_output_columns, index=pd.Index([], dtype='int64')), schema=output_schema,
+                                             preserve_index=True).schema
+        # Row labels match those from parse_version_data, i.e. positions after merging in accepted names
+        offset = 0
+        with pq.ParquetWriter(out_file, output_schema, compression='zstd') as writer:
+            for batch in pq.ParquetFile(streamed_file).iter_batches(batch_size=chunk_size):
+                chunk = batch.to_pandas().dropna(subset=['accepted_name_id'])
+                chunk = add_accepted_wfo_data(chunk, accepted_data)
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                chunk = chunk.dropna(subset=['accepted_name_w_author'])[wfo_output_columns]
+                if summary is not None:
+                    summary.update(chunk)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=output_schema, preserve_index=True))
+    finally:
+        csv_file.close()
+        if os.path.isfile(streamed_file):
+            os.remove(streamed_file)
+    return out_file
+
+
 def get_latest_version():
     version = get_version_from_tag(latest_wfo_version_string)
     return get_version_data(version), latest_wfo_version_string
@@ -247,34 +388,35 @@ def get_versions_after_v10(other_versions:dict):
             out_dict[v] = other_versions[v]
     return out_dict
 
-def look_at_example(old_wfo_data, new_wfo_data, taxon_name_w_authors):
-    example = old_wfo_data[old_wfo_data['taxon_name_w_authors'] == taxon_name_w_authors]
-    new_example = new_wfo_data[new_wfo_data['taxon_name_w_authors'] == taxon_name_w_authors]
+def look_at_examples(old_wfo_data, new_wfo_data, taxon_names_w_authors: list):
+    # Names are looked up in an index of both versions rather than scanning the data for each name
+    index = TransitivityIndex({'old': old_wfo_data, 'new': new_wfo_data})
+    old_resolution = index.resolve_direct(taxon_names_w_authors, 'old')
+    chained_resolution = index.resolve_chained(taxon_names_w_authors, ['old', 'new'])
+    direct_resolution = index.resolve_direct(taxon_names_w_authors, 'new')
+    for i, taxon_name_w_authors in enumerate(taxon_names_w_authors):
+        if direct_resolution['status'].iloc[i] != 'resolved':
+            print(f'No direct resolution found for {taxon_name_w_authors} ({direct_resolution["status"].iloc[i]})')
+        print(
+            f'Name: {taxon_name_w_authors} resolves to {old_resolution["accepted_name_w_author"].iloc[i]} and then '
+            f'{chained_resolution["accepted_name_w_author"].iloc[i]} ({chained_resolution["status"].iloc[i]}). '
+            f'Direct resolution is {direct_resolution["accepted_name_w_author"].iloc[i]}')
 
-    acc_name_from_old = example['accepted_name_w_author'].iloc[0]
-    chained_example = new_wfo_data[new_wfo_data['taxon_name_w_authors'] == acc_name_from_old]
 
-    try:
-        direct_resolution = new_example['accepted_name_w_author'].iloc[0]
-    except IndexError:
-        direct_resolution = None
-        print(f'No direct resolution found for {taxon_name_w_authors}')
-    print(
-        f'Name: {taxon_name_w_authors} resolves to {acc_name_from_old} and then {chained_example["accepted_name_w_author"].iloc[0]}. Direct resolution is {direct_resolution}')
+def look_at_example(old_wfo_data, new_wfo_data, taxon_name_w_authors):
+    look_at_examples(old_wfo_data, new_wfo_data, [taxon_name_w_authors])
 
 
 if __name__ == '__main__':
     oversions = get_other_versions()
     for v in oversions:
-        oversions[v].describe(include='all').to_csv(os.path.join('inputs', f'{v}_summary.csv'))
+        summarise_columns(oversions[v]).to_csv(os.path.join('inputs', f'{v}_summary.csv'))
     new, new_tag = get_latest_version()
-    new.describe(include='all').to_csv(os.path.join('inputs', f'{new_tag}_summary.csv'))
+    summarise_columns(new).to_csv(os.path.join('inputs', f'{new_tag}_summary.csv'))
     old, old_tag = get_oldest_version()
-    old.describe(include='all').to_csv(os.path.join('inputs', f'{old_tag}_summary.csv'))
+    summarise_columns(old).to_csv(os.path.join('inputs', f'{old_tag}_summary.csv'))
 
-    look_at_example(old, new, 'Senecio bowenkampi Phil.')
-    look_at_example(old, new, 'Haplopappus wigginsii S.F.Blake')
-    look_at_example(old, new, 'Helichrysum leptolepis DC.')
+    look_at_examples(old, new, ['Senecio bowenkampi Phil.', 'Haplopappus wigginsii S.F.Blake', 'Helichrysum leptolepis DC.'])
     #
     # get_other_versions()
     # get_latest_version()
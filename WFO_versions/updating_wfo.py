@@ -1,108 +1,198 @@
 import os
 
-from WFO_versions.get_WFO import get_latest_version, get_oldest_version, get_other_versions, other_version_strings, all_wfo_version_strings, \
-    oldest_wfo_version_string, get_version_comparable_to_v10, wfo_version_comparable_to_v10_string, get_versions_after_v10, \
-    wfo_version_strings_after_v10
-from chaining_methods import compare_two_versions, summarise_results, chain_two_databases, get_direct_name_updates, \
-    compare_and_output_chained_and_direct_updates
+import pandas as pd
+
+from WFO_versions.get_WFO import all_wfo_version_strings, wfo_version_comparable_to_v10_string, get_release_date, get_version_data, \
+    get_version_from_tag, WFO_Version
+from chaining_methods import compare_two_versions, compare_all_version_pairs, get_direct_name_updates, \
+    compare_chained_and_direct_updates, encode_all_versions, TransitivityIndex, ResolutionMap, ResolutionGraph, compare_all_version_paths, \
+    get_reachable_names
+from chaining_methods.drift_rollups import get_drift_rollups
+from chaining_methods.name_flags import NameFlagMatrix
+from chaining_methods.name_history import NameHistory
+from chaining_methods.name_stability import get_stability_profiles, rank_by_instability
+from chaining_methods.new_release import append_release, get_registered_releases, get_release_details
+from chaining_methods.result_store import pair_dataset_name
+from chaining_methods.version_deltas import write_version_store
 
 repo_path = os.environ.get('KEWSCRATCHPATH')
 this_repo_path = os.path.join(repo_path, 'TaxoDrift')
 _output_path = os.path.join(this_repo_path, 'WFO_versions', 'outputs')
+# Pair results are also written as parquet, partitioned by taxonomy and versions
+_parquet_path = os.path.join(_output_path, pair_dataset_name)
 
 
 def main_case():
-    compare_two_versions(oldest_version, latest_version, old_wfo_tag, new_wfo_tag, _output_path)
-    path_tag = f'{old_wfo_tag}_{new_wfo_tag}'
-    summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=old_wfo_tag)
+    # Result summaries are written by compare_two_versions
+    return compare_two_versions(oldest_version, latest_version, old_wfo_tag, new_wfo_tag, _output_path, name_dictionary=name_dictionary,
+                                parquet_path=_parquet_path, taxonomy='wfo')
 
 
 def main_case_v10_equivalent():
-    compare_two_versions(v10_equiv, latest_version, v10_equiv_tag, new_wfo_tag, _output_path)
-    path_tag = f'{v10_equiv_tag}_{new_wfo_tag}'
-    summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=v10_equiv_tag)
+    return compare_two_versions(v10_equiv, latest_version, v10_equiv_tag, new_wfo_tag, _output_path, name_dictionary=name_dictionary,
+                                parquet_path=_parquet_path, taxonomy='wfo')
 
 
-def compare_all_pairs():
-    for other_version in other_versions:
-        print(f'Running {other_version}')
-        compare_two_versions(oldest_version, other_versions[other_version], old_wfo_tag, other_version, _output_path)
-        path_tag = f'{old_wfo_tag}_{other_version}'
-        summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=old_wfo_tag)
-
-        compare_two_versions(other_versions[other_version], latest_version, other_version, new_wfo_tag, _output_path)
-        path_tag = f'{other_version}_{new_wfo_tag}'
-        summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=other_version)
-
-        for other_version2 in other_versions:
-            # Get all combinations of other versions (if possible)
-            if other_version2 !=other_version and other_version2 < other_version:
-                try:
-                    compare_two_versions(other_versions[other_version2], other_versions[other_version], other_version2, other_version, _output_path)
-                    path_tag = f'{other_version2}_{other_version}'
-                    summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=other_version2)
-                except:
-                    print(f'Could not compare {other_version2} to {other_version}')
+def compare_all_pairs(detail_pairs: list = None, n_workers: int = 1):
+    # Each version is preprocessed once, then result summaries are written for every pair of versions.
+    # Full outputs are only written for detail_pairs
+    return compare_all_version_pairs(release_versions, _output_path, name_dictionary=name_dictionary, detail_pairs=detail_pairs,
+                                     n_workers=n_workers, parquet_path=_parquet_path, taxonomy='wfo')
 
 
 def compare_pairs_to_v10_equivalent():
+    # v10_equiv is deduplicated once for all pairs
+    v10_equiv_map = ResolutionMap(v10_equiv, name_dictionary, tag=v10_equiv_tag)
     for other_version in versions_after_v10:
         print(f'Running {other_version}')
-        compare_two_versions(v10_equiv, other_versions[other_version], v10_equiv_tag, other_version, _output_path)
-        path_tag = f'{v10_equiv_tag}_{other_version}'
-        summarise_results(os.path.join(_output_path, path_tag), path_tag, old_tag=v10_equiv_tag)
+        compare_two_versions(v10_equiv_map, other_versions[other_version], v10_equiv_tag, other_version, _output_path,
+                             name_dictionary=name_dictionary, parquet_path=_parquet_path, taxonomy='wfo')
+
+
+def compare_all_paths():
+    # Every path of versions from the oldest to the latest version. Prefixes shared by paths are only chained once
+    return compare_all_version_paths(release_versions, old_wfo_tag, new_wfo_tag, os.path.join(_output_path, 'all_paths'),
+                                     name_dictionary=name_dictionary)
 
 
-def full_chain_results(old_df, old_tag_, dict_of_other_versions, ordered_keys, out_dir):
+def full_chain_results(start_tag, out_dir):
     # Note when chaining like this, in intermediary steps ambiguous/non resolving names may be dropped.
     # This may somewhat reflect real world situations but is optimistic about the chaining process
-    first_key = ordered_keys[0]
-    # Start with 1 -> 2
-    vold_next_chained = chain_two_databases(old_df, dict_of_other_versions[first_key], old_tag_, first_key, out_dir)
-    vold_next_chained = vold_next_chained.rename(columns={f'{first_key}_chained_accepted_name_w_author': 'accepted_name_w_author'})
-    v_next_chained = vold_next_chained[['taxon_name_w_authors', 'accepted_name_w_author']]
+    # Chain from the start version through each of the later versions and then the latest version, using the resolution graph
+    full_chain = graph.get_chained_records(start_tag, out_dir, chain_tag='previous_chain')
+
+    direct_updated_records = get_direct_name_updates(graph.maps[start_tag], graph.maps[new_wfo_tag], new_wfo_tag, out_dir)
+    # The pessimistic counterpart, following every resolution of ambiguous names
+    later_tags = graph.tags[graph.tags.index(start_tag) + 1:]
+    get_reachable_names(graph.maps[start_tag], [graph.maps[tag] for tag in later_tags], new_wfo_tag, out_dir, chain_tag='previous_chain')
+    # Also writes the result summary
+    return compare_chained_and_direct_updates(full_chain, direct_updated_records, 'previous_chain', new_wfo_tag, out_dir,
+                                              start_map=graph.maps[start_tag])
+
+
+def build_transitivity_index(index_dir: str = None):
+    # Index of all versions, used to resolve user datasets with chaining_methods.resolve_dataset
+    if index_dir is None:
+        index_dir = os.path.join(_output_path, 'transitivity_index')
+    TransitivityIndex(get_release_versions()).save(index_dir)
+    return index_dir
+
+
+def get_release_order():
+    # all_wfo_version_strings followed by any releases added with add_release
+    return get_registered_releases(_output_path, all_wfo_version_strings)
+
+
+def get_release_version(tag: str) -> WFO_Version:
+    details = get_release_details(_output_path, tag)
+    if len(details) > 0:
+        return WFO_Version(tag, details['extension'], details['DOI'])
+    return get_version_from_tag(tag)
+
+
+def get_release_versions() -> dict:
+    # Parsed data of every release, in release order
+    return {tag: get_version_data(get_release_version(tag)) for tag in get_release_order()}
+
+
+def add_release(version: WFO_Version, n_workers: int = 1):
+    """
+    Compare a new release with every registered release and extend the full chain to it, without recomputing existing pairs.
+    The release zip must already be downloaded to the WFO downloads path.
+
+    :param version: e.g. WFO_Version('202506', 'csv', DOI).
+    """
+    def get_taxa(tag):
+        return get_version_data(version if tag == version.tag else get_release_version(tag))
 
-    previous_tag = first_key
-    for key in ordered_keys:
-        if key != first_key:
-            vold_next_chained = chain_two_databases(v_next_chained, dict_of_other_versions[key], previous_tag, key, out_dir)
-            vold_next_chained = vold_next_chained.rename(columns={f'{key}_chained_accepted_name_w_author': 'accepted_name_w_author'})
-            v_next_chained = vold_next_chained[['taxon_name_w_authors', 'accepted_name_w_author']]
-            previous_tag = key
+    return append_release(get_taxa, version.tag, _output_path, get_release_order(), get_release_date(version.tag), n_workers=n_workers,
+                          parquet_path=_parquet_path, taxonomy='wfo', full_chain_dir=os.path.join(_output_path, 'wfo_full_chain'),
+                          details={'extension': version.extension, 'DOI': version.DOI})
 
-    # Then final case
-    full_chain = chain_two_databases(v_next_chained, latest_version, 'previous_chain', new_wfo_tag, out_dir)
 
-    direct_updated_records = get_direct_name_updates(old_df, latest_version, new_wfo_tag, out_dir)
-    results_df = compare_and_output_chained_and_direct_updates(full_chain, direct_updated_records, 'previous_chain', new_wfo_tag, out_dir)
-    pass
+def build_name_history(history_dir: str = None):
+    # Resolutions of every name over the release dates, for point in time queries with chaining_methods.name_history
+    if history_dir is None:
+        history_dir = os.path.join(_output_path, 'name_history')
+    taxa_versions = get_release_versions()
+    NameHistory(taxa_versions, {tag: get_release_date(tag) for tag in taxa_versions}).save(history_dir)
+    return history_dir
+
+
+def build_name_flags(matrix_dir: str = None):
+    # Bit packed flags of every name in every version, for set counts across versions with chaining_methods.name_flags
+    if matrix_dir is None:
+        matrix_dir = os.path.join(_output_path, 'name_flags')
+    NameFlagMatrix(get_release_versions()).save(matrix_dir)
+    return matrix_dir
+
+
+def build_name_stability(outfile: str = None) -> pd.DataFrame:
+    # Stability of every name over all versions, least stable first, see chaining_methods.name_stability
+    if outfile is None:
+        outfile = os.path.join(_output_path, 'name_stability.parquet')
+    profiles = get_stability_profiles(get_release_versions())
+    profiles = rank_by_instability(profiles)
+    profiles.to_parquet(outfile, compression='zstd')
+    return profiles
+
+
+def build_drift_rollups(outfile: str = None) -> pd.DataFrame:
+    # Disagreements per genus and family for every pair and full chain, see chaining_methods.drift_rollups
+    if outfile is None:
+        outfile = os.path.join(_output_path, 'drift_rollups.parquet')
+    rollups = get_drift_rollups(get_release_versions(), 'wfo')
+    rollups.to_parquet(outfile, compression='zstd')
+    return rollups
+
+
+def build_version_store(store_dir: str = None):
+    # The oldest release in full and the changes in each later release, see chaining_methods.version_deltas
+    if store_dir is None:
+        store_dir = os.path.join(_output_path, 'version_store')
+    write_version_store(get_release_versions(), store_dir)
+    return store_dir
+
+
+def summarise_chains():
+    # Both full chains are read from one resolution graph
+    full_chain_results(old_wfo_tag, os.path.join(_output_path, 'wfo_full_chain'))
+    cycles = graph.find_cycles()
+    print(f'{len(cycles)} names resolve back to themselves across versions')
+    cycles.to_csv(os.path.join(_output_path, 'wfo_full_chain', 'resolution_cycles.csv'))
+    compare_all_paths()
+
+    main_case_v10_equivalent()
+    compare_pairs_to_v10_equivalent()
+    full_chain_results(v10_equiv_tag, os.path.join(_output_path, 'wfo_full_chain_after_v10'))
 
 
 def main():
     main_case()
     compare_all_pairs()
-    full_chain_results(oldest_version, old_wfo_tag, other_versions, other_version_strings, os.path.join(_output_path, 'wfo_full_chain'))
-    summarise_results(os.path.join(_output_path, 'wfo_full_chain'), 'previous_chain_202406', old_tag=old_wfo_tag)
+    summarise_chains()
 
-    main_case_v10_equivalent()
-    compare_pairs_to_v10_equivalent()
-    full_chain_results(v10_equiv, v10_equiv_tag, versions_after_v10, wfo_version_strings_after_v10,
-                       os.path.join(_output_path, 'wfo_full_chain_after_v10'))
-    for y in all_wfo_version_strings:
-        for y2 in all_wfo_version_strings:
-            try:
-                summarise_results(os.path.join(_output_path, f'{y2}_{y}'), f'{y2}_{y}',
-                                  old_tag=y2)
-            except:
-                print(f'Could not summarise {y}, {y2}')
 
+def load_versions():
+    # Versions used by the functions above, as module level names
+    global other_versions, versions_after_v10, latest_version, new_wfo_tag, oldest_version, old_wfo_tag, v10_equiv, v10_equiv_tag, \
+        name_dictionary, graph, release_versions
+    # Every registered release, including those added with add_release, in chain order
+    release_versions = get_release_versions()
+    tags = list(release_versions)
+    old_wfo_tag, new_wfo_tag = tags[0], tags[-1]
+    oldest_version, latest_version = release_versions[old_wfo_tag], release_versions[new_wfo_tag]
+    other_versions = {tag: release_versions[tag] for tag in tags[1:-1]}
 
-if __name__ == '__main__':
-    other_versions = get_other_versions()
-    versions_after_v10 = get_versions_after_v10(other_versions)
+    v10_equiv_tag = wfo_version_comparable_to_v10_string
+    v10_equiv = release_versions[v10_equiv_tag]
+    versions_after_v10 = {tag: other_versions[tag] for tag in tags[tags.index(v10_equiv_tag) + 1:-1]}
+    # One name dictionary for all versions, so joins in each comparison are on int codes
+    name_dictionary = encode_all_versions(list(release_versions.values()))
+    # Versions in chain order, from the oldest through each of the other versions to the latest
+    graph = ResolutionGraph(tags, release_versions, name_dictionary=name_dictionary)
 
-    latest_version, new_wfo_tag = get_latest_version()
-    oldest_version, old_wfo_tag = get_oldest_version()
-    v10_equiv, v10_equiv_tag = get_version_comparable_to_v10()
 
+if __name__ == '__main__':
+    load_versions()
     main()
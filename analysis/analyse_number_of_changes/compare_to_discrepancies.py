@@ -6,6 +6,7 @@ from matplotlib import pyplot as plt
 from scipy import stats
 
 from analysis.analyse_number_of_changes.helper_functions import this_repo_path
+from chaining_methods import read_pair_result
 
 
 def get_data_for_pair(folder):
@@ -31,8 +32,7 @@ def get_species_discrepancies_for_pair(folder, taxonomy_name:str):
     if taxonomy_name == 'wfo':
         value_dir = os.path.join(this_repo_path, 'WFO_versions', 'outputs', folder)
 
-    sp_disagreements_df = pd.read_csv(os.path.join(value_dir, 'result_summary.csv'), index_col=0)
-    number = sp_disagreements_df[['Percentages']].loc['species_disagreements'].iloc[0]
+    number = read_pair_result(value_dir).get_percentage('species_disagreements')
     return number
 
 
@@ -1,25 +1,45 @@
 import os
+import tempfile
 
+import numpy as np
 import pandas as pd
 from wcvpy.wcvp_download import wcvp_columns, wcvp_accepted_columns
 
-from WCVP_versions.updating_wcvp import wcvp_version_order
+from WCVP_versions.updating_wcvp import get_release_order as get_wcvp_release_order
+from chaining_methods.pair_scheduler import publish_tables, get_worker_table, run_pairs
+from chaining_methods.resolution_map import ResolutionMap
 
 repo_path = os.environ.get('KEWSCRATCHPATH')
 this_repo_path = os.path.join(repo_path, 'TaxoDrift')
 _output_path = os.path.join(this_repo_path, 'analysis','analyse_number_of_changes', 'outputs')
 
+# Columns used in the analyses, which are shared with worker processes in do_all_analyses_for_pairs
+analysis_columns = ['taxon_name', 'taxon_name_w_authors', wcvp_accepted_columns['name'], 'accepted_species',
+                    wcvp_accepted_columns['species_w_author'], wcvp_columns['rank'], wcvp_columns['status'], 'homotypic_synonym']
+_accepted_statuses = ['Accepted', 'Artificial Hybrid']
+# Resolution maps of the versions used by a worker process, so each version is only deduplicated once per worker
+_worker_maps = {}
+
+
+def get_resolution_map(taxa) -> ResolutionMap:
+    # Analyses accept taxa dataframes or resolution maps, whose unique values and record masks are kept between analyses
+    if isinstance(taxa, ResolutionMap):
+        return taxa
+    return ResolutionMap(taxa)
+
+
 def get_out_dir(old_tag: str, new_tag: str):
     tag = '_'.join([old_tag, new_tag])
-    if old_tag in wcvp_version_order:
+    if old_tag in get_wcvp_release_order():
         out_dir = os.path.join(_output_path, 'wcvp', tag)
     else:
         out_dir = os.path.join(_output_path, 'wfo', tag)
     os.makedirs(out_dir, exist_ok=True)
     return out_dir, tag
 
-def get_species_differences(df1: pd.DataFrame, df2: pd.DataFrame, old_tag: str, new_tag: str, with_authorship: bool = False, output_list=False):
+def get_species_differences(df1, df2, old_tag: str, new_tag: str, with_authorship: bool = False, output_list=False):
     out_dir, tag = get_out_dir(old_tag, new_tag)
+    old_map, new_map = get_resolution_map(df1), get_resolution_map(df2)
 
     if with_authorship:
         acc_species_col = 'accepted_species_w_author'
@@ -32,21 +52,21 @@ def get_species_differences(df1: pd.DataFrame, df2: pd.DataFrame, old_tag: str,
         addendum = ''
         file_tag = ''
 
-    old_accepted_species = df1[acc_species_col].dropna().unique().tolist()
-    new_accepted_species = df2[acc_species_col].dropna().unique().tolist()
+    old_accepted_species = old_map.get_unique_values(acc_species_col).tolist()
+    new_accepted_species = new_map.get_unique_values(acc_species_col).tolist()
 
     print(
         f'New has {len(new_accepted_species)} accepted species names, old has {len(old_accepted_species)} accepted species names')
 
-    new_accepted_species_that_were_published_in_old = df1[df1[name_col].isin(new_accepted_species)][
-        name_col].dropna().unique().tolist()
+    old_names = pd.Series(old_map.get_unique_values(name_col))
+    new_accepted_species_that_were_published_in_old = old_names[old_names.isin(new_accepted_species)].tolist()
     print(f'New has {len(new_accepted_species_that_were_published_in_old)} accepted species names which were previously published')
 
     new_species_not_in_old = set(new_accepted_species) - set(old_accepted_species)
     old_species_not_in_new = set(old_accepted_species) - set(new_accepted_species)
 
-    old_species = df1[df1[wcvp_columns['rank']] == 'Species'][name_col].unique().tolist()
-    new_species = df2[df2[wcvp_columns['rank']] == 'Species'][name_col].unique().tolist()
+    old_species = old_map.get_unique_values(name_col, rank='Species', dropna=False).tolist()
+    new_species = new_map.get_unique_values(name_col, rank='Species', dropna=False).tolist()
 
     new_species_not_in_old = set(new_species) - set(old_species)
     old_species_not_in_new = set(old_species) - set(new_species)
@@ -70,11 +90,12 @@ def get_species_differences(df1: pd.DataFrame, df2: pd.DataFrame, old_tag: str,
     out_df.to_csv(os.path.join(out_dir, f'species_differences_summary_{file_tag}.csv'))
 
     if output_list:
-        df1[df1[name_col].isin(old_species_not_in_new)].to_csv(os.path.join(out_dir, f'dissappeared_species_{file_tag}.csv'))
+        old_map.taxa[old_map.taxa[name_col].isin(old_species_not_in_new)].to_csv(os.path.join(out_dir, f'dissappeared_species_{file_tag}.csv'))
 
 
 def get_accepted_species_that_become_unaccepted(df1, df2, old_tag: str, new_tag: str, with_authorship: bool = True, output_list=False):
     base_out_dir, tag = get_out_dir(old_tag, new_tag)
+    old_map, new_map = get_resolution_map(df1), get_resolution_map(df2)
 
     out_dir = os.path.join(base_out_dir, 'accepted_species_that_become_unaccepted')
     os.makedirs(out_dir, exist_ok=True)
@@ -85,9 +106,9 @@ def get_accepted_species_that_become_unaccepted(df1, df2, old_tag: str, new_tag:
     else:
         raise ValueError('I think with_authorship should be True for this particular analysis')
 
-    old_accepted_species = df1[wcvp_accepted_columns['species_w_author']].dropna().unique().tolist()
+    old_accepted_species = old_map.get_unique_values(wcvp_accepted_columns['species_w_author']).tolist()
 
-    non_accepted_new_df = df2[~df2[wcvp_columns['status']].isin(['Accepted', 'Artificial Hybrid'])]
+    non_accepted_new_df = new_map.taxa[new_map.get_record_mask(exclude_statuses=_accepted_statuses)]
 
     old_names_that_are_no_longer_accepted_df = non_accepted_new_df[non_accepted_new_df['taxon_name_w_authors'].isin(old_accepted_species)]
     old_names_that_are_no_longer_accepted = old_names_that_are_no_longer_accepted_df['taxon_name_w_authors'].unique().tolist()
@@ -125,6 +146,7 @@ def get_accepted_species_that_become_unaccepted(df1, df2, old_tag: str, new_tag:
 
 def get_unaccepted_species_that_become_accepted(df1, df2, old_tag: str, new_tag: str, with_authorship: bool = True, output_list=False):
     base_out_dir, tag = get_out_dir(old_tag, new_tag)
+    old_map, new_map = get_resolution_map(df1), get_resolution_map(df2)
 
     out_dir = os.path.join(base_out_dir, 'unaccepted_species_that_become_accepted')
     os.makedirs(out_dir, exist_ok=True)
@@ -135,9 +157,8 @@ def get_unaccepted_species_that_become_accepted(df1, df2, old_tag: str, new_tag:
     else:
         raise ValueError('I think with_authorship should be True for this particular analysis')
 
-    old_species = df1[df1[wcvp_columns['rank']] == 'Species']
-    old_non_accepted_species_df = old_species[~old_species[wcvp_columns['status']].isin(['Accepted', 'Artificial Hybrid'])]
-    new_accepted_species = df2[wcvp_accepted_columns['species_w_author']].dropna().unique().tolist()
+    old_non_accepted_species_df = old_map.taxa[old_map.get_record_mask(rank='Species', exclude_statuses=_accepted_statuses)]
+    new_accepted_species = new_map.get_unique_values(wcvp_accepted_columns['species_w_author']).tolist()
     old_non_accepted_species_that_become_accepted_df = old_non_accepted_species_df[
         old_non_accepted_species_df['taxon_name_w_authors'].isin(new_accepted_species)]
 
@@ -165,7 +186,7 @@ def get_unaccepted_species_that_become_accepted(df1, df2, old_tag: str, new_tag:
     out_df.to_csv(os.path.join(out_dir, f'unaccepted_species_that_become_accepted_summary_{file_tag}.csv'))
 
 
-def get_names_that_resolve_in_old_but_not_in_new(v12_taxa: pd.DataFrame, v13_taxa: pd.DataFrame, old_tag: str, new_tag: str,
+def get_names_that_resolve_in_old_but_not_in_new(v12_taxa, v13_taxa, old_tag: str, new_tag: str,
                                                  with_authorship: bool = False, output_list=False):
     """
     Identify taxon names that resolve in the earlier dataset (v12) but not in the newer dataset (v13).
@@ -174,9 +195,9 @@ def get_names_that_resolve_in_old_but_not_in_new(v12_taxa: pd.DataFrame, v13_tax
     Ozanonia alpina where the author is (L. ex Hartm.) Gand. in the old but (L.) Gand. in the new
 
     :param v12_taxa: Dataset containing taxon information for the older dataset.
-    :type v12_taxa: pd.DataFrame
+    :type v12_taxa: pd.DataFrame or ResolutionMap
     :param v13_taxa: Dataset containing taxon information for the newer dataset.
-    :type v13_taxa: pd.DataFrame
+    :type v13_taxa: pd.DataFrame or ResolutionMap
     :return: A set of taxon names resolved in the v12 dataset but not in the v13 dataset.
     :rtype: set
     """
@@ -187,13 +208,12 @@ def get_names_that_resolve_in_old_but_not_in_new(v12_taxa: pd.DataFrame, v13_tax
     else:
         taxon_name_col = 'taxon_name'
 
-    v12_with_resolution = v12_taxa[~v12_taxa[wcvp_accepted_columns['name']].isna()]
+    v12_map, v13_map = get_resolution_map(v12_taxa), get_resolution_map(v13_taxa)
+    v12_taxa = v12_map.taxa
 
-    names_that_resolve_in_v12 = v12_with_resolution[taxon_name_col].unique().tolist()
+    names_that_resolve_in_v12 = v12_map.get_unique_values(taxon_name_col, notna_column=wcvp_accepted_columns['name'], dropna=False).tolist()
 
-    v13_with_resolution = v13_taxa[~v13_taxa[wcvp_accepted_columns['name']].isna()]
-
-    names_that_resolve_in_v13 = v13_with_resolution[taxon_name_col].unique().tolist()
+    names_that_resolve_in_v13 = v13_map.get_unique_values(taxon_name_col, notna_column=wcvp_accepted_columns['name'], dropna=False).tolist()
 
     names_that_resolve_in_old_but_not_in_new = set(names_that_resolve_in_v12) - set(names_that_resolve_in_v13)
     # print(names_that_resolve_in_old_but_not_in_new)
@@ -215,11 +235,160 @@ def get_names_that_resolve_in_old_but_not_in_new(v12_taxa: pd.DataFrame, v13_tax
     return names_that_resolve_in_old_but_not_in_new_df
 
 
+def _get_pair_value_codes(old_map: ResolutionMap, new_map: ResolutionMap, columns: list):
+    """
+    Codes of the values of the given columns in both versions, in one set of values shared by the versions.
+    Each version is factorized once and kept in its map, so for a pair only the values of the new version are looked up in the old.
+
+    :return: (old codes, new codes, mask of the code of missing values, number of codes)
+    """
+    old_codes, old_values = old_map.get_value_codes(columns)
+    new_codes, new_values = new_map.get_value_codes(columns)
+    # Values only in the new version are coded after the old values and the missing value
+    new_value_codes = old_values.get_indexer(new_values)
+    only_in_new = new_value_codes < 0
+    new_value_codes[only_in_new] = len(old_values) + 1 + np.arange(only_in_new.sum())
+    n_codes = len(old_values) + 1 + only_in_new.sum()
+    missing = np.zeros(n_codes, dtype=bool)
+    missing[len(old_values)] = True
+    return old_codes, np.append(new_value_codes, len(old_values)).take(new_codes), missing, n_codes
+
+
+def _present(codes: np.ndarray, n_codes: int) -> np.ndarray:
+    # Mask of the codes which appear
+    present = np.zeros(n_codes, dtype=bool)
+    present[codes] = True
+    return present
+
+
+def _count_names_by_status(names: np.ndarray, status_codes: np.ndarray, statuses, n_codes: int, selected: np.ndarray) -> list:
+    """
+    Statuses of the selected records in the order they first appear, with the number of unique names of each status.
+    Records without a status are not counted, as they don't match their status.
+    """
+    status_order = pd.unique(status_codes[selected])
+    has_status = selected & (status_codes >= 0)
+    pair_keys = np.unique(status_codes[has_status].astype(np.int64) * n_codes + names[has_status])
+    counts = np.bincount(pair_keys // n_codes, minlength=len(statuses))
+    return [(statuses[code] if code >= 0 else np.nan, counts[code] if code >= 0 else 0) for code in status_order]
+
+
+def get_pair_changes(old_taxa, new_taxa, tag: str) -> dict:
+    """
+    The summaries of get_species_differences (with and without authorship), get_accepted_species_that_become_unaccepted,
+    get_unaccepted_species_that_become_accepted and get_names_that_resolve_in_old_but_not_in_new in one pass.
+    Values are coded once per version, so set differences are comparisons of code masks rather than python sets.
+
+    :return: dict of (subdirectory, file name) -> summary dataframe, as written by the separate analyses.
+    """
+    old_map, new_map = get_resolution_map(old_taxa), get_resolution_map(new_taxa)
+    old_species_mask, new_species_mask = old_map.get_record_mask(rank='Species'), new_map.get_record_mask(rank='Species')
+    summaries = {}
+
+    for with_authorship in [False, True]:
+        if with_authorship:
+            columns = ['taxon_name_w_authors', wcvp_accepted_columns['species_w_author']]
+            addendum, file_tag = 'but this could be due to orthographic changes with authorship', 'w_author'
+        else:
+            columns = ['taxon_name', wcvp_accepted_columns['species']]
+            addendum, file_tag = '', ''
+        (old_names, old_accepted), (new_names, new_accepted), missing, n_codes = _get_pair_value_codes(old_map, new_map, columns)
+        old_accepted_species = _present(old_accepted, n_codes) & ~missing
+        new_accepted_species = _present(new_accepted, n_codes) & ~missing
+        old_species = _present(old_names[old_species_mask], n_codes)
+        new_species = _present(new_names[new_species_mask], n_codes)
+        previously_published = _present(old_names, n_codes) & ~missing & new_accepted_species
+
+        out_df = pd.DataFrame([new_accepted_species.sum(), old_accepted_species.sum(), previously_published.sum(),
+                               new_species.sum(), old_species.sum(), (new_species & ~old_species).sum(), (old_species & ~new_species).sum()])
+        out_df.columns = [tag]
+        out_df.index = ['number of new accepted species names', 'number of old accepted species names',
+                        'new accepted species names which were previously published',
+                        'number of new species names', 'number of old species names',
+                        'new species names not in old', 'species names have disappeared' + addendum]
+        summaries[('', f'species_differences_summary_{file_tag}.csv')] = out_df
+
+        if not with_authorship:
+            # Names with an accepted name in the old version which have none in the new version
+            old_resolved = _present(old_names[old_map.get_record_mask(notna_column=wcvp_accepted_columns['name'])], n_codes)
+            new_resolved = _present(new_names[new_map.get_record_mask(notna_column=wcvp_accepted_columns['name'])], n_codes)
+            num_of_original_names = old_resolved.sum()
+            out_df = pd.DataFrame([num_of_original_names, (old_resolved & ~new_resolved).sum()])
+            out_df.columns = [tag]
+            out_df.index = ['number of original_names', 'names_that_resolve_in_old_but_not_in_new']
+            out_df['Percentages'] = 100 * out_df[tag] / num_of_original_names
+            summaries[('', 'names_that_resolve_in_old_but_not_in_new_summary.csv')] = out_df
+            continue
+
+        # Synonymisations: old accepted species whose names are not accepted in the new version
+        status_codes, statuses = new_map.status_codes
+        synonymised = new_map.get_record_mask(exclude_statuses=_accepted_statuses) & old_accepted_species[new_names]
+        out_list = [str(old_accepted_species.sum()), str(_present(new_names[synonymised], n_codes).sum())]
+        out_index = ['number of old accepted species names', 'old accepted species names are no longer accepted']
+        if 'homotypic_synonym' in new_map.taxa.columns:
+            homotypic = (new_map.taxa['homotypic_synonym'] == 'T').to_numpy(dtype=bool, na_value=False)
+            homotypic_counts = dict(_count_names_by_status(new_names, status_codes, statuses, n_codes, synonymised & homotypic))
+            heterotypic_counts = dict(_count_names_by_status(new_names, status_codes, statuses, n_codes, synonymised & ~homotypic))
+            for status, count in _count_names_by_status(new_names, status_codes, statuses, n_codes, synonymised):
+                out_list.append('/'.join([str(count), str(homotypic_counts.get(status, 0)), str(heterotypic_counts.get(status, 0))]))
+                out_index.append(f'Number which are now {status} of which (homotypic)/(heterotypic)')
+        else:
+            for status, count in _count_names_by_status(new_names, status_codes, statuses, n_codes, synonymised):
+                out_list.append(str(count))
+                out_index.append(f'Number which are now {status}')
+        out_df = pd.DataFrame(out_list)
+        out_df.columns = [tag]
+        out_df.index = out_index
+        summaries[('accepted_species_that_become_unaccepted', f'accepted_species_that_become_unaccepted_summary_{file_tag}.csv')] = out_df
+
+        # Resurrections: old unaccepted species whose names are accepted species in the new version
+        status_codes, statuses = old_map.status_codes
+        old_unaccepted = old_map.get_record_mask(rank='Species', exclude_statuses=_accepted_statuses)
+        resurrected = old_unaccepted & new_accepted_species[old_names]
+        out_list = [str(_present(old_names[old_unaccepted], n_codes).sum()), str(_present(old_names[resurrected], n_codes).sum())]
+        out_index = ['number of old unaccepted species names', 'old unaccepted species names are now accepted']
+        for status, count in _count_names_by_status(old_names, status_codes, statuses, n_codes, resurrected):
+            out_list.append(str(count))
+            out_index.append(f'Number of old {status}s which are now accepted')
+        out_df = pd.DataFrame(out_list)
+        out_df.columns = [tag]
+        out_df.index = out_index
+        summaries[('unaccepted_species_that_become_accepted', f'unaccepted_species_that_become_accepted_summary_{file_tag}.csv')] = out_df
+    return summaries
+
+
 def do_all_analyses_for_a_pair(old_taxa, new_taxa, old_tag: str, new_tag: str):
-    get_species_differences(old_taxa, new_taxa, old_tag, new_tag)
-    get_species_differences(old_taxa, new_taxa, old_tag, new_tag, with_authorship=True)
-    get_accepted_species_that_become_unaccepted(old_taxa, new_taxa, old_tag, new_tag)
+    # The summaries of each analysis, computed in one pass over the pair
+    out_dir, tag = get_out_dir(old_tag, new_tag)
+    for (sub_dir, file_name), out_df in get_pair_changes(old_taxa, new_taxa, tag).items():
+        os.makedirs(os.path.join(out_dir, sub_dir), exist_ok=True)
+        out_df.to_csv(os.path.join(out_dir, sub_dir, file_name))
+    print(f'Written summaries of {tag} to {out_dir}')
+
 
-    get_unaccepted_species_that_become_accepted(old_taxa, new_taxa, old_tag, new_tag)
+def _get_worker_map(tag: str) -> ResolutionMap:
+    if tag not in _worker_maps:
+        _worker_maps[tag] = ResolutionMap(get_worker_table(tag), tag=tag)
+    return _worker_maps[tag]
 
-    get_names_that_resolve_in_old_but_not_in_new(old_taxa, new_taxa, old_tag, new_tag)
+
+def _analyse_pair_in_worker(pair: tuple):
+    do_all_analyses_for_a_pair(_get_worker_map(pair[0]), _get_worker_map(pair[1]), pair[0], pair[1])
+
+
+def do_all_analyses_for_pairs(taxa_versions: dict, pairs: list, n_workers: int = None):
+    """
+    Run do_all_analyses_for_a_pair for each (old_tag, new_tag) pair in parallel. The analysis columns of each version are written once
+    as Arrow files which workers memory-map, rather than pickling the dataframes for each pair.
+
+    :param taxa_versions: dict of tag -> taxa dataframe.
+    :param n_workers: number of worker processes, defaults to the number of cpus.
+    :return: dict of pair -> traceback for pairs that failed.
+    """
+    with tempfile.TemporaryDirectory() as table_dir:
+        table_paths = publish_tables(taxa_versions, analysis_columns, table_dir)
+        _, errors = run_pairs(_analyse_pair_in_worker, pairs, n_workers=n_workers, table_paths=table_paths)
+    for pair in errors:
+        print(f'Could not compare {pair[0]} to {pair[1]}')
+        print(errors[pair])
+    return errors
@@ -1,27 +1,19 @@
 from WFO_versions.get_WFO import get_latest_version, get_oldest_version, get_other_versions
-from analysis.analyse_number_of_changes.helper_functions import do_all_analyses_for_a_pair
+from analysis.analyse_number_of_changes.helper_functions import do_all_analyses_for_pairs
 
 
-def main():
+def main(n_workers: int = None):
     latest_version, new_wfo_tag = get_latest_version()
     oldest_version, old_wfo_tag = get_oldest_version()
 
-    do_all_analyses_for_a_pair(oldest_version, latest_version, old_wfo_tag, new_wfo_tag)
-
     other_versions = get_other_versions()
 
-    for other_version in other_versions:
-        print(f'Running {other_version}')
-        if other_version != old_wfo_tag:
-            do_all_analyses_for_a_pair(oldest_version, other_versions[other_version], old_wfo_tag, other_version)
-        if other_version != new_wfo_tag:
-            do_all_analyses_for_a_pair(other_versions[other_version], latest_version, other_version, new_wfo_tag)
+    # All combinations of versions, where the older version comes first
+    taxa_versions = {old_wfo_tag: oldest_version, **other_versions, new_wfo_tag: latest_version}
+    tags = list(taxa_versions.keys())
+    pairs = [(old_tag, new_tag) for i, old_tag in enumerate(tags) for new_tag in tags[i + 1:]]
 
-        for other_version2 in other_versions:
-            # Get all combinations of other versions (if possible)
-            if other_version2 !=other_version:
-                if other_version2 < other_version:
-                    do_all_analyses_for_a_pair(other_versions[other_version2], other_versions[other_version], other_version2, other_version)
+    do_all_analyses_for_pairs(taxa_versions, pairs, n_workers=n_workers)
 
 
 if __name__ == '__main__':
@@ -3,15 +3,18 @@ import os
 import pandas as pd
 
 from WCVP_versions.updating_wcvp import get_all_databases
+from chaining_methods.result_store import load_pair_table
+from chaining_methods.summaries import summarise_columns
 from analysis.analyse_number_of_changes.helper_functions import this_repo_path
 
 def get_discrepancy_results_for_pair(folder, taxonomy_name:str):
     if taxonomy_name == 'wcvp':
-        value_dir = os.path.join(this_repo_path, 'WCVP_versions', 'outputs', folder)
+        output_dir = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
     if taxonomy_name == 'wfo':
-        value_dir = os.path.join(this_repo_path, 'WFO_versions', 'outputs', folder)
+        output_dir = os.path.join(this_repo_path, 'WFO_versions', 'outputs')
 
-    disagreements_df = pd.read_csv(os.path.join(value_dir, 'all_results.csv'), index_col=0)
+    old_tag, new_tag = folder.split('_')
+    disagreements_df = load_pair_table(output_dir, 'all_results', old_tag, new_tag, taxonomy=taxonomy_name)
     return disagreements_df
 
 def main():
@@ -26,18 +29,18 @@ def main():
 
     output_folder = os.path.join('outputs','wcvp',folder)
     homoytpic_synonyms.to_csv(os.path.join(output_folder, 'homoytpic_synonyms_in_v10_where_discrepancies_arise.csv'), index=False)
-    homoytpic_synonyms.describe(include='all').to_csv(os.path.join(output_folder, 'homoytpic_synonyms_in_v10_where_discrepancies_arise_summary.csv'), index=False)
+    summarise_columns(homoytpic_synonyms).to_csv(os.path.join(output_folder, 'homoytpic_synonyms_in_v10_where_discrepancies_arise_summary.csv'), index=False)
     heteroytpic_synonyms.to_csv(os.path.join(output_folder, 'heteroytpic_synonyms_in_v10_where_discrepancies_arise.csv'), index=False)
-    heteroytpic_synonyms.describe(include='all').to_csv(os.path.join(output_folder, 'heteroytpic_synonyms_in_v10_where_discrepancies_arise_summary.csv'), index=False)
+    summarise_columns(heteroytpic_synonyms).to_csv(os.path.join(output_folder, 'heteroytpic_synonyms_in_v10_where_discrepancies_arise_summary.csv'), index=False)
 
     results_from_homotypic_synonyms = discrepancy_results[discrepancy_results['taxon_name_w_authors'].isin(homoytpic_synonyms['taxon_name_w_authors'].values)]
     results_from_heterotypic_synonyms = discrepancy_results[discrepancy_results['taxon_name_w_authors'].isin(heteroytpic_synonyms['taxon_name_w_authors'].values)]
     assert len(results_from_homotypic_synonyms) + len(results_from_heterotypic_synonyms) == len(discrepancy_results)
 
     results_from_homotypic_synonyms.to_csv(os.path.join(output_folder, 'results_from_homotypic_synonyms.csv'), index=False)
-    results_from_homotypic_synonyms.describe(include='all').to_csv(os.path.join(output_folder, 'results_from_homotypic_synonyms_summary.csv'), index=False)
+    summarise_columns(results_from_homotypic_synonyms).to_csv(os.path.join(output_folder, 'results_from_homotypic_synonyms_summary.csv'), index=False)
     results_from_heterotypic_synonyms.to_csv(os.path.join(output_folder, 'results_from_heterotypic_synonyms.csv'), index=False)
-    results_from_heterotypic_synonyms.describe(include='all').to_csv(os.path.join(output_folder, 'results_from_heterotypic_synonyms_summary.csv'), index=False)
+    summarise_columns(results_from_heterotypic_synonyms).to_csv(os.path.join(output_folder, 'results_from_heterotypic_synonyms_summary.csv'), index=False)
 
 
 
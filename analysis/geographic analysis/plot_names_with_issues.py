@@ -8,16 +8,16 @@ from matplotlib import pyplot as plt
 from sklearn.linear_model import LinearRegression
 import statsmodels.api as sm
 from sklearn.preprocessing import PolynomialFeatures
-from wcvpy.wcvp_download import plot_native_number_accepted_taxa_in_regions, wcvp_accepted_columns, add_authors_to_col
+from wcvpy.wcvp_download import plot_native_number_accepted_taxa_in_regions, wcvp_accepted_columns
 
+from WCVP_versions.updating_wcvp import get_version_taxa
 from analysis.analyse_number_of_changes.helper_functions import this_repo_path
+from chaining_methods.result_store import load_pair_table
 
-_input_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs', 'v10_v14')
-issue_df = pd.read_csv(os.path.join(_input_path, 'species_results.csv'))
-v10_taxa = pd.read_csv(os.path.join(this_repo_path, 'WCVP_versions', 'inputs', 'v10_taxa.csv'))
-v10_taxa['taxon_name_w_authors'] = add_authors_to_col(v10_taxa, 'taxon_name')
-v14_taxa = pd.read_csv(os.path.join(this_repo_path, 'WCVP_versions', 'inputs', 'v14_taxa.csv'))
-v14_taxa['taxon_name_w_authors'] = add_authors_to_col(v14_taxa, 'taxon_name')
+_input_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
+issue_df = load_pair_table(_input_path, 'species_results', 'v10', 'v14', taxonomy='wcvp')
+v10_taxa = get_version_taxa('v10')
+v14_taxa = get_version_taxa('v14')
 
 
 def plot_names_with_issues():
@@ -0,0 +1,243 @@
+import importlib
+import inspect
+import os
+import re
+
+from WCVP_versions import updating_wcvp
+from WFO_versions import get_WFO, updating_wfo
+from WFO_versions.get_WFO import get_version_data
+from analysis.analyse_number_of_changes import helper_functions
+from analysis.plots_to_display import change_over_time_backwards, change_over_time_forward
+from chaining_methods import compare_two_versions
+from chaining_methods.all_pairs import count_version_pairs_by_rank, get_genus_codes, get_rank_index, precompute_version, \
+    write_pair_rank_summaries
+from chaining_methods.name_codes import build_name_dictionary
+from chaining_methods.new_release import update_pair_matrices, update_rank_summaries
+from chaining_methods.pipeline import Pipeline, Stage, pipeline_main
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.result_store import pair_dataset_name
+
+repo_path = os.environ.get('KEWSCRATCHPATH')
+this_repo_path = os.path.join(repo_path, 'TaxoDrift')
+_wcvp_output_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
+_wfo_output_path = os.path.join(this_repo_path, 'WFO_versions', 'outputs')
+# Completed stages and their keys
+_state_path = os.path.join(this_repo_path, 'pipeline_state')
+# Packages of this repo whose functions are followed by _get_chaining_source
+_repo_packages = ['WCVP_versions', 'WFO_versions', 'analysis']
+
+
+def _get_global_names(code) -> set:
+    # Global names used by the code, including in the functions and lambdas defined in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _get_global_names(const)
+    return names
+
+
+def _get_chaining_source(*functions) -> list:
+    """
+    The chaining_methods modules used by the given functions, either directly, through the other functions of this repo they call,
+    or through the chaining_methods modules those import. Stages hash only these, so they aren't rerun for changes to modules they
+    don't use.
+    """
+    modules = {}
+    pending = list(functions)
+    seen = set()
+    while len(pending) > 0:
+        function = pending.pop()
+        if function in seen:
+            continue
+        seen.add(function)
+        names = _get_global_names(function.__code__)
+        for name in names:
+            if name not in function.__globals__:
+                continue
+            reference = function.__globals__[name]
+            module_name = reference.__name__ if inspect.ismodule(reference) else getattr(reference, '__module__', None)
+            if not isinstance(module_name, str):
+                continue
+            if module_name.startswith('chaining_methods.'):
+                modules[module_name] = importlib.import_module(module_name)
+            elif module_name.split('.')[0] in _repo_packages:
+                if inspect.isfunction(reference):
+                    pending.append(reference)
+                elif inspect.ismodule(reference):
+                    # e.g. updating_wcvp.get_version_taxa, where the attribute is also among the names
+                    pending.extend(getattr(reference, n) for n in names if inspect.isfunction(getattr(reference, n, None)))
+
+    # chaining_methods modules import each other, sometimes inside functions, so follow the imports in their source
+    pending = list(modules)
+    while len(pending) > 0:
+        for imported in re.findall(r'chaining_methods\.(\w+)', inspect.getsource(modules[pending.pop()])):
+            module_name = f'chaining_methods.{imported}'
+            if module_name not in modules:
+                modules[module_name] = importlib.import_module(module_name)
+                pending.append(module_name)
+    return [modules[module_name] for module_name in sorted(modules)]
+
+
+def _get_pairs(tags: list) -> list:
+    # Pairs of versions as unit ids, where the older version comes first
+    return [f'{old_tag}_{new_tag}' for i, old_tag in enumerate(tags) for new_tag in tags[i + 1:]]
+
+
+def _get_pair_context(tags: list, get_taxa) -> dict:
+    # Precomputed arrays of every version, shared by the pairs of a stage
+    taxa_versions = [get_taxa(tag) for tag in tags]
+    taxa_maps = get_resolution_maps(taxa_versions, build_name_dictionary(taxa_versions))
+    ranks = get_rank_index(taxa_maps)
+    precomputed = {}
+    for tag, taxa_map in zip(tags, taxa_maps):
+        print(f'Preprocessing {tag}')
+        precomputed[tag] = precompute_version(taxa_map, taxa_map.name_dictionary, ranks)
+    return {'tags': tags, 'precomputed': precomputed, 'genus_codes': get_genus_codes(precomputed, taxa_maps[0].name_dictionary),
+            'ranks': ranks}
+
+
+def _compare_pair(pair: str, context: dict, outpath: str, taxonomy: str):
+    # Result summary and summary by rank of one pair, which are also added to the all pairs matrices and rank summaries
+    old_tag, new_tag = pair.split('_')
+    pair_rank_counts = count_version_pairs_by_rank(context['precomputed'], context['genus_codes'], [(old_tag, new_tag)], context['ranks'])
+    update_rank_summaries(outpath, write_pair_rank_summaries(pair_rank_counts, context['ranks'], outpath,
+                                                             os.path.join(outpath, pair_dataset_name), taxonomy))
+    update_pair_matrices(outpath, {pair: [int(c) for c in counts.sum(axis=1)] for pair, counts in pair_rank_counts.items()},
+                         context['tags'])
+
+
+def _analyse_pair(pair: str, context: dict, get_taxa):
+    # Versions are wrapped in resolution maps once, and kept for the other pairs they are in
+    old_tag, new_tag = pair.split('_')
+    for tag in [old_tag, new_tag]:
+        if tag not in context:
+            context[tag] = helper_functions.get_resolution_map(get_taxa(tag))
+    helper_functions.do_all_analyses_for_a_pair(context[old_tag], context[new_tag], old_tag, new_tag)
+
+
+def get_wcvp_input_files():
+    return [updating_wcvp.get_input_file(tag) for tag in updating_wcvp.get_release_order()]
+
+
+def load_wcvp():
+    missing_files = [f for f in get_wcvp_input_files() if not os.path.isfile(f)]
+    if len(missing_files) > 0:
+        raise FileNotFoundError(f'Download these WCVP versions first, with wcvpy get_all_taxa: {missing_files}')
+
+
+def parse_wcvp(tag: str, context):
+    updating_wcvp.get_version_taxa(tag)
+
+
+def get_wcvp_pairs():
+    return _get_pairs(updating_wcvp.get_release_order())
+
+
+def setup_wcvp_pairs():
+    return _get_pair_context(updating_wcvp.get_release_order(), updating_wcvp.get_version_taxa)
+
+
+def compare_wcvp_pair(pair: str, context: dict):
+    _compare_pair(pair, context, _wcvp_output_path, 'wcvp')
+
+
+def summarise_wcvp():
+    # v10 -> v14 outputs are used in the genus results and other analyses
+    compare_two_versions(updating_wcvp.get_version_taxa('v10'), updating_wcvp.get_version_taxa('v14'), 'v10', 'v14', _wcvp_output_path,
+                         parquet_path=os.path.join(_wcvp_output_path, pair_dataset_name), taxonomy='wcvp')
+    updating_wcvp.full_chain_results()
+    updating_wcvp.compare_all_paths()
+
+
+def analyse_wcvp_pair(pair: str, context: dict):
+    _analyse_pair(pair, context, updating_wcvp.get_version_taxa)
+
+
+def get_wfo_input_files():
+    return [updating_wfo.get_release_version(tag).get_zip_file_path() for tag in updating_wfo.get_release_order()]
+
+
+def load_wfo():
+    missing_files = [f for f in get_wfo_input_files() if not os.path.isfile(f)]
+    if len(missing_files) > 0:
+        raise FileNotFoundError(f'Download these WFO versions first: {missing_files}')
+
+
+def get_wfo_taxa(tag: str):
+    return get_version_data(updating_wfo.get_release_version(tag))
+
+
+def parse_wfo(tag: str, context):
+    get_wfo_taxa(tag)
+
+
+def get_wfo_pairs():
+    return _get_pairs(updating_wfo.get_release_order())
+
+
+def setup_wfo_pairs():
+    return _get_pair_context(updating_wfo.get_release_order(), get_wfo_taxa)
+
+
+def compare_wfo_pair(pair: str, context: dict):
+    _compare_pair(pair, context, _wfo_output_path, 'wfo')
+
+
+def summarise_wfo():
+    updating_wfo.load_versions()
+    updating_wfo.main_case()
+    updating_wfo.summarise_chains()
+
+
+def analyse_wfo_pair(pair: str, context: dict):
+    _analyse_pair(pair, context, get_wfo_taxa)
+
+
+def plot_backwards():
+    change_over_time_backwards.plot_changes_separate_taxonomies()
+    change_over_time_backwards.plot_changes_just_with_last_version()
+    change_over_time_backwards.spearman_tests()
+
+
+def plot_forward():
+    change_over_time_forward.plot_changes_separate_taxonomies()
+    change_over_time_forward.plot_changes_just_with_last_version()
+    change_over_time_forward.spearman_tests()
+
+
+def get_pipeline() -> Pipeline:
+    stages = [
+        Stage('wcvp_load', load_wcvp, input_files=get_wcvp_input_files),
+        Stage('wcvp_parse', parse_wcvp, ['wcvp_load'], source=[updating_wcvp] + _get_chaining_source(parse_wcvp),
+              units=updating_wcvp.get_release_order),
+        Stage('wcvp_pairs', compare_wcvp_pair, ['wcvp_parse'],
+              source=[_compare_pair, _get_pair_context] + _get_chaining_source(compare_wcvp_pair, setup_wcvp_pairs), units=get_wcvp_pairs,
+              setup=setup_wcvp_pairs),
+        Stage('wcvp_summaries', summarise_wcvp, ['wcvp_parse'], source=[updating_wcvp] + _get_chaining_source(summarise_wcvp)),
+        Stage('wcvp_genus', updating_wcvp.get_genus_results, ['wcvp_summaries'],
+              source=[updating_wcvp] + _get_chaining_source(updating_wcvp.get_genus_results)),
+        Stage('wcvp_drift', updating_wcvp.build_drift_rollups, ['wcvp_parse'],
+              source=[updating_wcvp] + _get_chaining_source(updating_wcvp.build_drift_rollups)),
+        Stage('wcvp_name_changes', analyse_wcvp_pair, ['wcvp_parse'], source=[_analyse_pair, helper_functions] + _get_chaining_source(
+            analyse_wcvp_pair), units=get_wcvp_pairs, setup=dict),
+        Stage('wfo_load', load_wfo, input_files=get_wfo_input_files),
+        Stage('wfo_parse', parse_wfo, ['wfo_load'], source=[get_WFO, updating_wfo] + _get_chaining_source(parse_wfo),
+              units=updating_wfo.get_release_order),
+        Stage('wfo_pairs', compare_wfo_pair, ['wfo_parse'],
+              source=[_compare_pair, _get_pair_context] + _get_chaining_source(compare_wfo_pair, setup_wfo_pairs), units=get_wfo_pairs,
+              setup=setup_wfo_pairs),
+        Stage('wfo_summaries', summarise_wfo, ['wfo_parse'], source=[updating_wfo] + _get_chaining_source(summarise_wfo)),
+        Stage('wfo_drift', updating_wfo.build_drift_rollups, ['wfo_parse'],
+              source=[updating_wfo] + _get_chaining_source(updating_wfo.build_drift_rollups)),
+        Stage('wfo_name_changes', analyse_wfo_pair, ['wfo_parse'], source=[_analyse_pair, helper_functions] + _get_chaining_source(
+            analyse_wfo_pair), units=get_wfo_pairs, setup=dict),
+        Stage('plots_backwards', plot_backwards, ['wcvp_pairs', 'wfo_pairs'],
+              source=[change_over_time_backwards] + _get_chaining_source(plot_backwards)),
+        Stage('plots_forward', plot_forward, ['wcvp_pairs', 'wfo_pairs'],
+              source=[change_over_time_forward] + _get_chaining_source(plot_forward)),
+    ]
+    return Pipeline(stages, _state_path)
+
+
+if __name__ == '__main__':
+    pipeline_main(get_pipeline(), 'Run the stages of the TaxoDrift analyses that are out of date.')
@@ -5,27 +5,42 @@ import seaborn as sns
 from matplotlib import pyplot as plt
 from scipy import stats
 
-from WCVP_versions.updating_wcvp import wcvp_version_order
-from WFO_versions.get_WFO import all_wfo_version_strings, latest_wfo_version_string
+from WCVP_versions.updating_wcvp import get_release_order as get_wcvp_release_order, get_release_dates
+from WFO_versions.get_WFO import get_release_date
+from WFO_versions.updating_wfo import get_release_order as get_wfo_release_order
+from chaining_methods import read_pair_percentages
 
 repo_path = os.environ.get('KEWSCRATCHPATH')
 this_repo_path = os.path.join(repo_path, 'TaxoDrift')
 _wcvp_output_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
 _wfo_output_path = os.path.join(this_repo_path, 'WFO_versions', 'outputs')
-version_dict = {'2022-10': 'v10', '2023-04': 'v11', '2023-09': 'v12', '2024-05': 'v13', '2025-05': 'v14'}
+# Including releases added since, see add_release
+wcvp_version_order = get_wcvp_release_order()
+all_wfo_version_strings = get_wfo_release_order()
+version_dict = {date: tag for tag, date in get_release_dates().items()}
 
 
 def format_wfo_string(given_string):
-    return given_string[:4] + '-' + given_string[4:]
+    return get_release_date(given_string)
 
 
-def get_wcvp_species_results(latest_version):
+def get_wcvp_species_percentages():
+    # Old x new species disagreement percentages of every pair, read once from the matrices written by compare_all_pairs
+    return read_pair_percentages(_wcvp_output_path, 'species_disagreements')
+
+
+def get_wfo_species_percentages():
+    return read_pair_percentages(_wfo_output_path, 'species_disagreements')
+
+
+def get_wcvp_species_results(latest_version, species_percentages: pd.DataFrame = None):
+    if species_percentages is None:
+        species_percentages = get_wcvp_species_percentages()
     data = []
     for y in version_dict:
         if version_dict[y] != latest_version:
             if wcvp_version_order.index(version_dict[y]) < wcvp_version_order.index(latest_version):
-                result_df = pd.read_csv(os.path.join(_wcvp_output_path, f'{version_dict[y]}_{latest_version}', 'result_summary.csv'), index_col=0)
-                species_percent = result_df['Percentages'].loc['species_disagreements']
+                species_percent = species_percentages.at[version_dict[y], latest_version]
                 print(species_percent)
                 data.append([y, species_percent])
         else:
@@ -33,13 +48,14 @@ def get_wcvp_species_results(latest_version):
     return data
 
 
-def get_wfo_species_results(latest_version):
+def get_wfo_species_results(latest_version, species_percentages: pd.DataFrame = None):
+    if species_percentages is None:
+        species_percentages = get_wfo_species_percentages()
     data = []
     for y in all_wfo_version_strings:
         if y != latest_version:
             if all_wfo_version_strings.index(y) < all_wfo_version_strings.index(latest_version):
-                result_df = pd.read_csv(os.path.join(_wfo_output_path, f'{y}_{latest_version}', 'result_summary.csv'), index_col=0)
-                species_percent = result_df['Percentages'].loc['species_disagreements']
+                species_percent = species_percentages.at[y, latest_version]
                 # print(species_percent)
                 y_formatted = format_wfo_string(y)
                 data.append([y_formatted, species_percent])
@@ -55,7 +71,7 @@ def plot_changes_just_with_last_version():
                            columns=['Date', 'Species Discrepancy (%)'])
     wcvp_df['Taxonomy'] = 'WCVP'
 
-    wfo_df = pd.DataFrame(get_wfo_species_results('202412'), columns=['Date', 'Species Discrepancy (%)'])
+    wfo_df = pd.DataFrame(get_wfo_species_results(all_wfo_version_strings[-1]), columns=['Date', 'Species Discrepancy (%)'])
     wfo_df['Taxonomy'] = 'WFO'
 
     df = pd.concat([wcvp_df, wfo_df])
@@ -80,8 +96,9 @@ def plot_changes_separate_taxonomies():
     # flights = sns.load_dataset("flights")
     sns.set_theme()
     all_wcvp_df = pd.DataFrame()
+    wcvp_percentages = get_wcvp_species_percentages()
     for w in wcvp_version_order[1:]:
-        wcvp_df = pd.DataFrame(get_wcvp_species_results(w),
+        wcvp_df = pd.DataFrame(get_wcvp_species_results(w, wcvp_percentages),
                                columns=['Date', 'Species Discrepancy (%)'])
         wcvp_df['Taxonomy'] = f'WCVP ({w})'
         all_wcvp_df = pd.concat([all_wcvp_df, wcvp_df])
@@ -103,8 +120,9 @@ def plot_changes_separate_taxonomies():
     plt.close()
 
     all_wfo_df = pd.DataFrame()
+    wfo_percentages = get_wfo_species_percentages()
     for w in all_wfo_version_strings[1:]:
-        wfo_df = pd.DataFrame(get_wfo_species_results(w),
+        wfo_df = pd.DataFrame(get_wfo_species_results(w, wfo_percentages),
                               columns=['Date', 'Species Discrepancy (%)'])
         wfo_df['Taxonomy Version'] = f'WFO ({w})'
         all_wfo_df = pd.concat([all_wfo_df, wfo_df])
@@ -139,7 +157,7 @@ def do_permutation_spearman_test(x, y):
 
 def spearman_tests():
     out_data = []
-    wcvp_data = get_wcvp_species_results('v14')
+    wcvp_data = get_wcvp_species_results(wcvp_version_order[-1])
 
     # Test monotonic relationships of data over time
     y = [wcvp_data.index(c) for c in wcvp_data[:-1]]  ## remove last case as thats a given
@@ -151,7 +169,7 @@ def spearman_tests():
     print(res_exact.statistic)
     print(res_exact.pvalue)
 
-    wfo_data = get_wfo_species_results('202412')
+    wfo_data = get_wfo_species_results(all_wfo_version_strings[-1])
 
     y = [wfo_data.index(c) for c in wfo_data[:-1]]  ## remove last case as thats a given
 
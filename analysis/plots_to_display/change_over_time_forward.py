@@ -5,9 +5,8 @@ import seaborn as sns
 from matplotlib import pyplot as plt
 from scipy import stats
 
-from WCVP_versions.updating_wcvp import wcvp_version_order
-from WFO_versions.get_WFO import all_wfo_version_strings
-from analysis.plots_to_display.change_over_time_backwards import version_dict, format_wfo_string
+from analysis.plots_to_display.change_over_time_backwards import version_dict, format_wfo_string, wcvp_version_order, \
+    all_wfo_version_strings, get_wcvp_species_percentages, get_wfo_species_percentages
 
 repo_path = os.environ.get('KEWSCRATCHPATH')
 this_repo_path = os.path.join(repo_path, 'TaxoDrift')
@@ -15,13 +14,14 @@ _wcvp_output_path = os.path.join(this_repo_path, 'WCVP_versions', 'outputs')
 _wfo_output_path = os.path.join(this_repo_path, 'WFO_versions', 'outputs')
 
 
-def get_wcvp_species_results(oldest_version):
+def get_wcvp_species_results(oldest_version, species_percentages: pd.DataFrame = None):
+    if species_percentages is None:
+        species_percentages = get_wcvp_species_percentages()
     data = []
     for y in version_dict:
         if version_dict[y] != oldest_version:
             if wcvp_version_order.index(version_dict[y]) > wcvp_version_order.index(oldest_version):
-                result_df = pd.read_csv(os.path.join(_wcvp_output_path, f'{oldest_version}_{version_dict[y]}', 'result_summary.csv'), index_col=0)
-                species_percent = result_df['Percentages'].loc['species_disagreements']
+                species_percent = species_percentages.at[oldest_version, version_dict[y]]
                 print(species_percent)
                 data.append([y, species_percent])
         else:
@@ -29,13 +29,14 @@ def get_wcvp_species_results(oldest_version):
     return data
 
 
-def get_wfo_species_results(oldest_version):
+def get_wfo_species_results(oldest_version, species_percentages: pd.DataFrame = None):
+    if species_percentages is None:
+        species_percentages = get_wfo_species_percentages()
     data = []
     for y in all_wfo_version_strings:
         if y != oldest_version:
             if all_wfo_version_strings.index(y) > all_wfo_version_strings.index(oldest_version):
-                result_df = pd.read_csv(os.path.join(_wfo_output_path, f'{oldest_version}_{y}', 'result_summary.csv'), index_col=0)
-                species_percent = result_df['Percentages'].loc['species_disagreements']
+                species_percent = species_percentages.at[oldest_version, y]
                 # print(species_percent)
                 y_formatted = format_wfo_string(y)
                 data.append([y_formatted, species_percent])
@@ -75,8 +76,9 @@ def plot_changes_separate_taxonomies():
     # flights = sns.load_dataset("flights")
     sns.set_theme()
     all_wcvp_df = pd.DataFrame()
+    wcvp_percentages = get_wcvp_species_percentages()
     for w in wcvp_version_order:
-        wcvp_df = pd.DataFrame(get_wcvp_species_results(w),
+        wcvp_df = pd.DataFrame(get_wcvp_species_results(w, wcvp_percentages),
                                columns=['Date', 'Species Discrepancy (%)'])
         wcvp_df['Initial Taxonomy'] = f'{w}'
         all_wcvp_df = pd.concat([all_wcvp_df, wcvp_df])
@@ -98,8 +100,9 @@ def plot_changes_separate_taxonomies():
     plt.close()
 
     all_wfo_df = pd.DataFrame()
+    wfo_percentages = get_wfo_species_percentages()
     for w in all_wfo_version_strings:
-        wfo_df = pd.DataFrame(get_wfo_species_results(w),
+        wfo_df = pd.DataFrame(get_wfo_species_results(w, wfo_percentages),
                               columns=['Date', 'Species Discrepancy (%)'])
         wfo_df['Initial Taxonomy'] = f'{format_wfo_string(w)}'
         all_wfo_df = pd.concat([all_wfo_df, wfo_df])
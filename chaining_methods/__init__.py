@@ -1 +1,24 @@
-from .updating_taxonomies import *
\ No newline at end of file
+from chaining_methods.name_codes import build_name_dictionary, encode_all_versions, encode_names, decode_names
+from chaining_methods.name_cleaning import clean_names, get_genera_from_full_names, apply_to_unique_names
+from chaining_methods.summaries import summarise_columns, StreamingSummary
+from chaining_methods.updating_taxonomies import get_accepted_name_from_record, chain_two_databases, get_direct_name_updates, \
+    compare_and_output_chained_and_direct_updates, compare_two_versions, get_overrepresented_genera, summarise_results, \
+    write_result_summary, PairResult, compare_chained_and_direct_updates, read_pair_result, get_result_summary, read_pair_result_from_dataset, \
+    get_rank_summary
+from chaining_methods.result_store import read_pair_tables, load_pair_table
+from chaining_methods.chain_engine import get_chaining_resolution, get_direct_resolution, compose_chain, chain_versions
+from chaining_methods.all_pairs import precompute_version, get_genus_codes, get_pair_counts, compare_all_version_pairs, \
+    get_pair_rank_counts, read_pair_percentages
+from chaining_methods.transitivity_index import TransitivityIndex
+from chaining_methods.resolution_map import ResolutionMap, get_resolution_maps
+from chaining_methods.resolution_graph import ResolutionGraph
+from chaining_methods.all_paths import compare_all_version_paths
+from chaining_methods.sparse_chain import get_resolution_matrix, chain_resolution_matrices, get_sparse_disagreements, get_reachable_names
+from chaining_methods.version_deltas import get_version_delta, apply_version_delta, update_resolutions, write_version_store, \
+    iter_stored_versions, load_stored_version
+from chaining_methods.name_history import NameHistory
+from chaining_methods.new_release import append_release, get_registered_releases, register_release
+from chaining_methods.pipeline import Stage, Pipeline, pipeline_main
+from chaining_methods.name_flags import NameFlagMatrix
+from chaining_methods.name_stability import get_stability_profiles, rank_by_instability
+from chaining_methods.drift_rollups import get_drift_rollups
@@ -0,0 +1,262 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import UNRESOLVED, AMBIGUOUS
+from chaining_methods.name_cleaning import get_genera_from_full_names
+from chaining_methods.name_codes import MISSING_CODE, decode_names
+from chaining_methods.resolution_map import get_resolution_maps, rank_column
+from chaining_methods.pair_scheduler import get_worker_arrays, publish_arrays, release_arrays, run_pairs
+from chaining_methods.updating_taxonomies import compare_two_versions, result_summary_index, write_result_summary, write_pair_counts, \
+    get_name_rank_groups, get_rank_summary, write_rank_summary
+
+
+def precompute_version(taxa, name_dictionary: pd.Index, ranks: pd.Index = None) -> dict:
+    """
+    Everything needed from a version to compare it with other versions, computed once per version.
+
+    :param taxa: taxa dataframe or ResolutionMap.
+    :param ranks: if given, the rank of each start name is kept as its position in ranks (see get_rank_index), so pairs can be counted
+        by rank. Start names without a rank are len(ranks).
+    """
+    taxa_map, = get_resolution_maps([taxa], name_dictionary)
+    direct_accepted, direct_species = taxa_map.direct_resolution
+    chaining_accepted, chaining_species = taxa_map.chaining_resolution
+    precomputed = {'direct_accepted': direct_accepted, 'direct_species': direct_species,
+                   'chaining_accepted': chaining_accepted, 'chaining_species': chaining_species,
+                   'start_names': taxa_map.start_names}
+    if ranks is not None:
+        precomputed['start_ranks'] = get_name_rank_groups(taxa_map, ranks)[0].take(taxa_map.start_names)
+    return precomputed
+
+
+def get_rank_index(taxa_versions: list) -> pd.Index:
+    """
+    Ranks of the records of all the given versions (taxa dataframes or resolution maps), so the ranks of every version are coded alike.
+    """
+    ranks = set()
+    for taxa in taxa_versions:
+        taxa = taxa.taxa if hasattr(taxa, 'taxa') else taxa
+        if rank_column in taxa.columns:
+            ranks.update(taxa[rank_column].dropna().unique())
+    return pd.Index(sorted(ranks), dtype=object, name=rank_column)
+
+
+def get_genus_codes(precomputed: dict, name_dictionary: pd.Index) -> np.ndarray:
+    """
+    Genus code of every accepted name in the precomputed versions, indexed by name code, so genera can be compared as ints.
+    Names without a genus are MISSING_CODE.
+    """
+    accepted = np.unique(np.concatenate([version[c] for version in precomputed.values() for c in ['direct_accepted', 'chaining_accepted']]))
+    accepted = accepted[accepted >= 0]
+    genera = get_genera_from_full_names(pd.Series(decode_names(accepted, name_dictionary)))
+    genus_ids, _ = pd.factorize(genera)
+    genus_codes = np.full(len(name_dictionary), MISSING_CODE, dtype=np.int32)
+    genus_codes[accepted] = genus_ids
+    return genus_codes
+
+
+def get_disagreements(chained_accepted: np.ndarray, chained_species: np.ndarray, direct_accepted: np.ndarray, direct_species: np.ndarray,
+                      genus_codes: np.ndarray) -> dict:
+    """
+    Compare chained and direct resolutions of the same names, with the rules used in compare_and_output_chained_and_direct_updates.
+
+    :param genus_codes: from get_genus_codes.
+    :return: dict of boolean arrays, aligned with the given resolutions, for 'compared', 'unresolved_via_chaining', 'disagreements',
+        'species_disagreements' and 'genus_disagreements'.
+    """
+    # Names with both a chained and a direct resolution
+    compared = ((chained_accepted >= 0) | (chained_accepted == UNRESOLVED)) & (direct_accepted >= 0) & (direct_species != AMBIGUOUS)
+    unresolved_via_chaining = compared & (chained_accepted == UNRESOLVED)
+    disagreements = compared & (chained_accepted >= 0) & (chained_accepted != direct_accepted)
+
+    chained_genera = genus_codes.take(chained_accepted[disagreements])
+    direct_genera = genus_codes.take(direct_accepted[disagreements])
+    # Missing genera and species never compare as equal
+    genus_disagreements = (chained_genera != direct_genera) | (chained_genera == MISSING_CODE)
+    species_disagreements = (direct_genera != MISSING_CODE) & (
+            (direct_species[disagreements] != chained_species[disagreements]) | (direct_species[disagreements] == MISSING_CODE) |
+            genus_disagreements)
+    genus_disagreements = species_disagreements & genus_disagreements
+
+    all_species_disagreements = np.zeros(len(disagreements), dtype=bool)
+    all_species_disagreements[disagreements] = species_disagreements
+    all_genus_disagreements = np.zeros(len(disagreements), dtype=bool)
+    all_genus_disagreements[disagreements] = genus_disagreements
+    return {'compared': compared, 'unresolved_via_chaining': unresolved_via_chaining, 'disagreements': disagreements,
+            'species_disagreements': all_species_disagreements, 'genus_disagreements': all_genus_disagreements}
+
+
+def get_pair_rank_counts(old_version: dict, new_version: dict, genus_codes: np.ndarray, n_ranks: int = 0) -> np.ndarray:
+    """
+    Counts of get_pair_counts for the start names of each rank, from one comparison of all start names.
+
+    :param n_ranks: number of ranks the start_ranks of old_version are coded against, if 0 ranks aren't used.
+    :return: array of counts with a row for each measure of result_summary_index and a column for each rank,
+        followed by a column for start names without a rank.
+    """
+    names = old_version['start_names']
+    old_accepted = old_version['direct_accepted'].take(names)
+    disagreements = get_disagreements(new_version['chaining_accepted'].take(old_accepted), new_version['chaining_species'].take(old_accepted),
+                                      new_version['direct_accepted'].take(names), new_version['direct_species'].take(names), genus_codes)
+    ranks = old_version['start_ranks'] if n_ranks > 0 else np.zeros(len(names), dtype=np.int32)
+    counts = np.zeros((len(result_summary_index), n_ranks + 1), dtype=np.int64)
+    counts[0] = np.bincount(ranks, minlength=n_ranks + 1)
+    for i, c in enumerate(['disagreements', 'species_disagreements', 'genus_disagreements', 'unresolved_via_chaining']):
+        counts[i + 1] = np.bincount(ranks, weights=disagreements[c], minlength=n_ranks + 1)
+    return counts
+
+
+def get_pair_counts(old_version: dict, new_version: dict, genus_codes: np.ndarray) -> list:
+    """
+    Counts of disagreements between chained and direct resolutions for a pair of precomputed versions,
+    equivalent to running compare_two_versions and then summarise_results.
+
+    :param genus_codes: from get_genus_codes.
+    :return: counts in the order of result_summary_index.
+    """
+    return [int(c) for c in get_pair_rank_counts(old_version, new_version, genus_codes).sum(axis=1)]
+
+
+def _count_pair_in_worker(pair: tuple) -> np.ndarray:
+    arrays = get_worker_arrays()
+    return get_pair_rank_counts(arrays[pair[0]], arrays[pair[1]], arrays['genera']['genus_codes'], int(arrays['genera']['n_ranks'][0]))
+
+
+def count_version_pairs_by_rank(precomputed: dict, genus_codes: np.ndarray, pairs: list, ranks: pd.Index = None,
+                                n_workers: int = 1) -> dict:
+    """
+    Counts by rank for each (old_tag, new_tag) pair of precomputed versions, see get_pair_rank_counts.
+
+    :param ranks: the ranks the versions were precomputed with, if None the counts only have the column of names without a rank,
+        i.e. of all names.
+    :param n_workers: number of processes to count pairs with. When more than 1, the precomputed arrays are shared with workers
+        in shared memory, and if any pairs fail a RuntimeError with their tracebacks is raised once all pairs have finished.
+    :return: dict of pair -> array of counts.
+    """
+    n_ranks = 0 if ranks is None else len(ranks)
+    if n_workers > 1:
+        manifest, blocks = publish_arrays({**precomputed, 'genera': {'genus_codes': genus_codes, 'n_ranks': np.array([n_ranks])}})
+        try:
+            pair_counts, errors = run_pairs(_count_pair_in_worker, pairs, n_workers=n_workers, manifest=manifest)
+        finally:
+            release_arrays(blocks)
+        if len(errors) > 0:
+            raise RuntimeError(f'Could not count {len(errors)} of {len(pairs)} pairs:\n' +
+                               '\n'.join(f'{old_tag} to {new_tag}:\n{error}' for (old_tag, new_tag), error in errors.items()))
+        return pair_counts
+    return {pair: get_pair_rank_counts(precomputed[pair[0]], precomputed[pair[1]], genus_codes, n_ranks) for pair in pairs}
+
+
+def count_version_pairs(precomputed: dict, genus_codes: np.ndarray, pairs: list, n_workers: int = 1) -> dict:
+    """
+    Counts for each (old_tag, new_tag) pair of precomputed versions, see get_pair_counts.
+
+    :param n_workers: number of processes to count pairs with. When more than 1, the precomputed arrays are shared with workers
+        in shared memory.
+    :return: dict of pair -> counts.
+    """
+    return {pair: [int(c) for c in counts.sum(axis=1)]
+            for pair, counts in count_version_pairs_by_rank(precomputed, genus_codes, pairs, n_workers=n_workers).items()}
+
+
+def write_pair_summary(counts: list, old_tag: str, new_tag: str, outpath: str = None, parquet_path: str = None, taxonomy: str = None,
+                       rank_summary: pd.DataFrame = None):
+    # The result summary of a pair and its summary by rank (if given), to outpath/{old_tag}_{new_tag} and/or the parquet dataset
+    out_dir = None
+    if outpath is not None:
+        tag = f'{old_tag}_{new_tag}'
+        out_dir = os.path.join(outpath, tag)
+        os.makedirs(out_dir, exist_ok=True)
+        write_result_summary(counts, out_dir, tag)
+    if parquet_path is not None:
+        write_pair_counts(counts, parquet_path, taxonomy, old_tag, new_tag)
+    if rank_summary is not None:
+        write_rank_summary(rank_summary, out_dir, parquet_path, taxonomy, old_tag, new_tag)
+
+
+def write_pair_rank_summaries(pair_counts: dict, ranks: pd.Index, outpath: str = None, parquet_path: str = None,
+                              taxonomy: str = None) -> pd.DataFrame:
+    """
+    Write the result summary and summary by rank of each pair counted by count_version_pairs_by_rank.
+
+    :return: the rank summaries of all pairs in one table, with the old and new tags of each pair.
+    """
+    rank_summaries = []
+    for (old_tag, new_tag), rank_counts in pair_counts.items():
+        rank_summary = get_rank_summary(rank_counts, ranks)
+        write_pair_summary([int(c) for c in rank_counts.sum(axis=1)], old_tag, new_tag, outpath, parquet_path, taxonomy, rank_summary)
+        rank_summary = rank_summary.reset_index()
+        rank_summary.insert(0, 'new', new_tag)
+        rank_summary.insert(0, 'old', old_tag)
+        rank_summaries.append(rank_summary)
+    return pd.concat(rank_summaries, ignore_index=True)
+
+
+def read_pair_percentages(outpath: str, measure: str) -> pd.DataFrame:
+    """
+    Old x new dataframe of the percentage of original names counted in measure for every pair, from the all_pairs_{measure}.csv
+    matrices written by compare_all_version_pairs. These match the Percentages of each pair's result_summary.csv.
+    """
+    counts = pd.read_csv(os.path.join(outpath, f'all_pairs_{measure}.csv'), index_col=0)
+    original_names = pd.read_csv(os.path.join(outpath, 'all_pairs_original_names.csv'), index_col=0)
+    return 100 * counts / original_names
+
+
+def compare_all_version_pairs(taxa_versions: dict, outpath: str = None, name_dictionary: pd.Index = None, detail_pairs: list = None,
+                              n_workers: int = 1, parquet_path: str = None, taxonomy: str = None):
+    """
+    Compare every pair of versions, where the older version comes first in taxa_versions.
+    Each version is preprocessed exactly once, and then each old x new count matrix is filled from the precomputed arrays.
+
+    :param taxa_versions: dict of tag -> taxa dataframe or ResolutionMap, ordered from oldest to newest.
+    :param outpath: if given, a result_summary.csv and a rank_summary.csv are written for each pair (as in summarise_results,
+        with the rank summary from get_rank_summary), each count matrix is written to all_pairs_{measure}.csv
+        and the rank summaries of all pairs to all_pairs_by_rank.csv.
+    :param detail_pairs: list of (old_tag, new_tag) pairs to also write the full per-pair outputs for, using compare_two_versions.
+    :param n_workers: number of processes to count pairs with. When more than 1, the precomputed arrays are shared with workers
+        in shared memory.
+    :param parquet_path: if given, counts for each pair and the outputs of detail_pairs are also written to this parquet dataset,
+        under the given taxonomy.
+    :return: dict of measure -> old x new dataframe of counts, with measures from result_summary_index.
+    """
+    if parquet_path is not None and taxonomy is None:
+        raise ValueError('A taxonomy name is needed to write to a parquet dataset')
+    tags = list(taxa_versions.keys())
+    # Resolution maps are shared by the count for every pair and the detail pairs
+    taxa_versions = dict(zip(tags, get_resolution_maps(list(taxa_versions.values()), name_dictionary)))
+    name_dictionary = taxa_versions[tags[0]].name_dictionary
+    if detail_pairs is None:
+        detail_pairs = []
+
+    ranks = get_rank_index(list(taxa_versions.values()))
+    precomputed = {}
+    for tag in tags:
+        print(f'Preprocessing {tag}')
+        precomputed[tag] = precompute_version(taxa_versions[tag], name_dictionary, ranks)
+    genus_codes = get_genus_codes(precomputed, name_dictionary)
+
+    pairs = [(old_tag, new_tag) for i, old_tag in enumerate(tags) for new_tag in tags[i + 1:]]
+    pair_rank_counts = count_version_pairs_by_rank(precomputed, genus_codes, pairs, ranks, n_workers)
+
+    matrices = {measure: pd.DataFrame(np.nan, index=tags, columns=tags) for measure in result_summary_index}
+    rank_summaries = []
+    for (old_tag, new_tag), rank_counts in pair_rank_counts.items():
+        counts = [int(c) for c in rank_counts.sum(axis=1)]
+        for measure, count in zip(result_summary_index, counts):
+            matrices[measure].at[old_tag, new_tag] = count
+
+        if (old_tag, new_tag) in detail_pairs and (outpath is not None or parquet_path is not None):
+            compare_two_versions(taxa_versions[old_tag], taxa_versions[new_tag], old_tag, new_tag, outpath, parquet_path=parquet_path,
+                                 taxonomy=taxonomy)
+        # Written after compare_two_versions for detail pairs, so that their summary by rank is over the ranks of all versions, as in
+        # all_pairs_by_rank.csv, rather than the ranks of the pair
+        rank_summaries.append(write_pair_rank_summaries({(old_tag, new_tag): rank_counts}, ranks, outpath, parquet_path, taxonomy))
+
+    if outpath is not None:
+        for measure in matrices:
+            matrices[measure].to_csv(os.path.join(outpath, f'all_pairs_{measure}.csv'))
+        if len(rank_summaries) > 0:
+            pd.concat(rank_summaries, ignore_index=True).to_csv(os.path.join(outpath, 'all_pairs_by_rank.csv'), index=False)
+    return matrices
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.all_pairs import get_disagreements
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.transitivity_index import TransitivityIndex
+from chaining_methods.updating_taxonomies import get_name_rank_groups, get_rank_summary, result_summary_index
+
+
+def _path_counts(index: TransitivityIndex, path: tuple, resolution: tuple, remaining: list, end_tag: str, direct: tuple,
+                 groups: np.ndarray, n_ranks: int):
+    # Depth first over paths, where resolution is the chained resolution of the start names along path.
+    # Each prefix is composed once and shared by every path that extends it. Counts are by the rank group of each start name
+    chained_accepted, chained_species = index.extend_resolution(resolution, end_tag)
+    disagreements = get_disagreements(chained_accepted, chained_species, direct[0], direct[1], index.genus_codes)
+    counts = np.zeros((len(result_summary_index), n_ranks + 1), dtype=np.int64)
+    counts[0] = np.bincount(groups, minlength=n_ranks + 1)
+    for i, c in enumerate(['disagreements', 'species_disagreements', 'genus_disagreements', 'unresolved_via_chaining']):
+        counts[i + 1] = np.bincount(groups, weights=disagreements[c], minlength=n_ranks + 1)
+    yield path + (end_tag,), counts
+    for i, tag in enumerate(remaining):
+        yield from _path_counts(index, path + (tag,), index.extend_resolution(resolution, tag), remaining[i + 1:], end_tag, direct,
+                                groups, n_ranks)
+
+
+def compare_all_version_paths(taxa_versions: dict, start_tag: str = None, end_tag: str = None, outpath: str = None,
+                              name_dictionary: pd.Index = None, return_rank_summary: bool = False):
+    """
+    Compare chained and direct resolutions for every ordered sub-sequence of versions that starts with start_tag and ends with end_tag,
+    e.g. v10 -> v12 -> v14 as well as v10 -> v11 -> v12 -> v13 -> v14 and v10 -> v14.
+    Names are those that resolve uniquely in start_tag, and are compared with their direct resolution in end_tag as in get_pair_counts.
+
+    :param taxa_versions: dict of tag -> taxa dataframe or ResolutionMap, ordered from oldest to newest.
+    :param start_tag: defaults to the oldest version.
+    :param end_tag: defaults to the newest version.
+    :param outpath: if given, the results are written to all_paths_{start_tag}_{end_tag}.csv, and their counts by the rank of the names
+        in start_tag (see get_rank_summary) to all_paths_by_rank_{start_tag}_{end_tag}.csv.
+    :param return_rank_summary: also return the counts by rank.
+    :return: dataframe indexed by path, with the number of versions in the path, the counts of result_summary_index
+        and the percentage of original names for each of the other counts. With return_rank_summary, also a dataframe of the counts of
+        each path by rank.
+    """
+    tags = list(taxa_versions.keys())
+    if start_tag is None:
+        start_tag = tags[0]
+    if end_tag is None:
+        end_tag = tags[-1]
+    index = TransitivityIndex(taxa_versions, name_dictionary=name_dictionary)
+
+    start_accepted, start_species = index.direct[start_tag]
+    names = np.flatnonzero(start_accepted[:len(index.name_dictionary)] >= 0)
+    direct = tuple(a.take(names) for a in index.direct[end_tag])
+    middle = tags[tags.index(start_tag) + 1:tags.index(end_tag)]
+    start_map, = get_resolution_maps([taxa_versions[start_tag]], index.name_dictionary)
+    name_groups, ranks = get_name_rank_groups(start_map)
+
+    rows = {}
+    rank_summaries = []
+    for path, counts in _path_counts(index, (start_tag,), (start_accepted.take(names), start_species.take(names)), middle, end_tag,
+                                     direct, name_groups.take(names), len(ranks)):
+        rows['_'.join(path)] = [len(path)] + [int(c) for c in counts.sum(axis=1)]
+        rank_summary = get_rank_summary(counts, ranks).reset_index()
+        rank_summary.insert(0, 'path', '_'.join(path))
+        rank_summaries.append(rank_summary)
+    results = pd.DataFrame.from_dict(rows, orient='index', columns=['versions'] + result_summary_index)
+    for measure in result_summary_index[1:]:
+        results[measure + '_percentage'] = 100 * results[measure] / results['original_names']
+    rank_summaries = pd.concat(rank_summaries, ignore_index=True)
+
+    if outpath is not None:
+        os.makedirs(outpath, exist_ok=True)
+        results.to_csv(os.path.join(outpath, f'all_paths_{start_tag}_{end_tag}.csv'))
+        rank_summaries.to_csv(os.path.join(outpath, f'all_paths_by_rank_{start_tag}_{end_tag}.csv'), index=False)
+    if return_rank_summary:
+        return results, rank_summaries
+    return results
@@ -0,0 +1,176 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.name_codes import MISSING_CODE, decode_names, get_name_codes
+from chaining_methods.summaries import summarise_columns
+
+# Sentinels in resolution arrays. Valid resolutions are name codes, which are >= 0
+UNRESOLVED = MISSING_CODE  # name is in the version but has no accepted name
+AMBIGUOUS = -2  # name has more than one resolution in the version
+ABSENT = -3  # name is not in the version
+
+# Resolution arrays are padded at the end, so that np.take with a (negative) sentinel index lands in the padding.
+# The padding is ABSENT, so names that failed to resolve at one step are dropped at every later step.
+_PADDING = 3
+
+
+def _empty_resolution(size: int) -> np.ndarray:
+    return np.full(size + _PADDING, ABSENT, dtype=np.int32)
+
+
+def _unique_resolutions(name_codes: np.ndarray, accepted_codes: np.ndarray, species_codes: np.ndarray, size: int):
+    # For each name, find the single distinct (accepted, species) pair it resolves to, or mark it as AMBIGUOUS
+    accepted = _empty_resolution(size)
+    species = _empty_resolution(size)
+    keep = name_codes >= 0
+    name_codes = name_codes[keep].astype(np.int64)
+    if len(name_codes) == 0:
+        return accepted, species
+    # Shift by one so that MISSING_CODE is a valid key
+    pair_keys = (accepted_codes[keep].astype(np.int64) + 1) * (size + 1) + (species_codes[keep].astype(np.int64) + 1)
+    unique_pair_keys, pair_ids = np.unique(pair_keys, return_inverse=True)
+    name_pairs = np.unique(name_codes * len(unique_pair_keys) + pair_ids.ravel())
+    names = name_pairs // len(unique_pair_keys)
+    pairs = unique_pair_keys[name_pairs % len(unique_pair_keys)]
+
+    counts = np.bincount(names, minlength=size)
+    single = counts[names] == 1
+    accepted[names[single]] = pairs[single] // (size + 1) - 1
+    species[names[single]] = pairs[single] % (size + 1) - 1
+    ambiguous = np.flatnonzero(counts > 1)
+    accepted[ambiguous] = AMBIGUOUS
+    species[ambiguous] = AMBIGUOUS
+    return accepted, species
+
+
+def get_chaining_resolution(taxa: pd.DataFrame, name_dictionary: pd.Index):
+    """
+    Resolution of names in a version when it is the newer version of a chain (as in chain_two_databases).
+    Records without an accepted name are kept, so a name may resolve to UNRESOLVED.
+
+    :return: padded arrays of accepted name codes and accepted species codes, indexed by name code.
+    """
+    return _unique_resolutions(get_name_codes(taxa, 'taxon_name_w_authors', name_dictionary),
+                               get_name_codes(taxa, 'accepted_name_w_author', name_dictionary),
+                               get_name_codes(taxa, 'accepted_species', name_dictionary), len(name_dictionary))
+
+
+def get_direct_resolution(taxa: pd.DataFrame, name_dictionary: pd.Index):
+    """
+    Resolution of names in a version to non-nan accepted names, as for the older version in chain_two_databases.
+    Names are ambiguous in the accepted array if they have more than one accepted name,
+    and ambiguous in the species array if they have more than one (accepted name, accepted species) pair, as in get_direct_name_updates.
+
+    :return: padded arrays of accepted name codes and accepted species codes, indexed by name code.
+    """
+    size = len(name_dictionary)
+    name_codes = get_name_codes(taxa, 'taxon_name_w_authors', name_dictionary)
+    accepted_codes = get_name_codes(taxa, 'accepted_name_w_author', name_dictionary)
+    resolves = accepted_codes != MISSING_CODE
+    accepted, _ = _unique_resolutions(name_codes[resolves], accepted_codes[resolves], np.zeros(resolves.sum(), dtype=np.int32), size)
+    _, species = _unique_resolutions(name_codes[resolves], accepted_codes[resolves],
+                                     get_name_codes(taxa, 'accepted_species', name_dictionary)[resolves], size)
+    # Names in the version without any accepted name
+    present = name_codes[name_codes >= 0]
+    unresolved = present[accepted[present] == ABSENT]
+    accepted[unresolved] = UNRESOLVED
+    species[unresolved] = UNRESOLVED
+    return accepted, species
+
+
+def get_start_names(taxa: pd.DataFrame, accepted: np.ndarray, name_dictionary: pd.Index) -> np.ndarray:
+    """
+    Codes of names which resolve uniquely in the version, i.e. the names that start a chain, in the order they appear in the database
+    (as in chain_two_databases).
+
+    :param accepted: accepted array from get_direct_resolution for the version.
+    """
+    name_codes = get_name_codes(taxa, 'taxon_name_w_authors', name_dictionary)
+    accepted_codes = get_name_codes(taxa, 'accepted_name_w_author', name_dictionary)
+    taxon_name_codes = pd.unique(name_codes[(name_codes != MISSING_CODE) & (accepted_codes != MISSING_CODE)])
+    return taxon_name_codes[accepted.take(taxon_name_codes) >= 0]
+
+
+def compose_chain(start_accepted: np.ndarray, chaining_resolutions: list):
+    """
+    Compose resolutions along a chain of versions with np.take.
+
+    :param start_accepted: accepted name codes in the oldest version.
+    :param chaining_resolutions: list of (accepted, species) arrays from get_chaining_resolution for each newer version, in order.
+    :return: accepted codes in the penultimate version, and the final accepted and species codes.
+    Names that don't resolve along the chain are ABSENT or AMBIGUOUS. Names that are in the final version but have no accepted name are UNRESOLVED.
+    """
+    previous_accepted = start_accepted
+    for accepted, _ in chaining_resolutions[:-1]:
+        # Names which don't resolve in intermediate versions are dropped from the chain
+        chained = accepted.take(previous_accepted)
+        previous_accepted = np.where(chained == UNRESOLVED, ABSENT, chained).astype(np.int32)
+    final_accepted, final_species = chaining_resolutions[-1]
+    return previous_accepted, final_accepted.take(previous_accepted), final_species.take(previous_accepted)
+
+
+def chain_versions(older_taxa_version, newer_taxa_versions: list, old_tag: str, new_tag: str, out_dir: str,
+                   name_dictionary: pd.Index = None, chain_tag: str = None):
+    """
+    Chain names in the oldest version through each of the newer versions in turn, composing per-version resolution arrays
+    rather than repeatedly calling chain_two_databases. Returns the same rows and columns as calling chain_two_databases
+    for each link in the chain.
+
+    :param older_taxa_version: taxa dataframe or ResolutionMap, as are each of newer_taxa_versions.
+    :param chain_tag: tag used for the accepted names in the penultimate version, defaults to old_tag.
+    """
+    # Imported here as resolution maps are built from the functions above
+    from chaining_methods.resolution_map import get_resolution_maps
+    older_map, *newer_maps = get_resolution_maps([older_taxa_version] + newer_taxa_versions, name_dictionary)
+    name_dictionary = older_map.name_dictionary
+    if chain_tag is None:
+        chain_tag = old_tag
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    start_accepted, _ = older_map.direct_resolution
+    taxon_name_codes = older_map.start_names
+    if out_dir is not None:
+        write_old_records_summary(taxon_name_codes, start_accepted, name_dictionary, old_tag, out_dir)
+
+    chaining_resolutions = [m.chaining_resolution for m in newer_maps]
+    previous_accepted, chained_accepted, chained_species = compose_chain(start_accepted.take(taxon_name_codes), chaining_resolutions)
+    return get_chained_records(taxon_name_codes, previous_accepted, chained_accepted, chained_species, name_dictionary, chain_tag, new_tag)
+
+
+def write_old_records_summary(taxon_name_codes: np.ndarray, start_accepted: np.ndarray, name_dictionary: pd.Index, old_tag: str,
+                              out_dir: str):
+    old_records_summary = pd.DataFrame({'taxon_name_w_authors': decode_names(taxon_name_codes, name_dictionary),
+                                        old_tag + '_accepted_name_w_author': decode_names(start_accepted.take(taxon_name_codes),
+                                                                                          name_dictionary)})
+    summarise_columns(old_records_summary).to_csv(os.path.join(out_dir, old_tag + '_old_records_summary.csv'))
+
+
+def get_chained_records(taxon_name_codes: np.ndarray, previous_accepted: np.ndarray, chained_accepted: np.ndarray,
+                        chained_species: np.ndarray, name_dictionary: pd.Index, chain_tag: str, new_tag: str) -> pd.DataFrame:
+    """
+    Output of chain_versions from the composed codes of each start name, as returned by compose_chain.
+    """
+    num_original_names = len(taxon_name_codes)
+    # Keep names that reach the final version, including those without an accepted name there
+    reached = (chained_accepted >= 0) | (chained_accepted == UNRESOLVED)
+    taxon_name_codes = taxon_name_codes[reached]
+    previous_accepted = previous_accepted[reached]
+    chained_accepted = chained_accepted[reached]
+    chained_species = np.where(chained_species[reached] < 0, MISSING_CODE, chained_species[reached]).astype(np.int32)
+
+    previous_accepted_names = decode_names(previous_accepted, name_dictionary)
+    chained_updated_records = pd.DataFrame({'taxon_name_w_authors': decode_names(taxon_name_codes, name_dictionary),
+                                            chain_tag + '_accepted_name_w_author': previous_accepted_names,
+                                            new_tag + '_taxon_name_w_authors': previous_accepted_names,
+                                            new_tag + '_chained_accepted_name_w_author': decode_names(chained_accepted, name_dictionary),
+                                            new_tag + '_chained_accepted_species': decode_names(chained_species, name_dictionary),
+                                            'taxon_name_code': taxon_name_codes.astype(np.int32),
+                                            chain_tag + '_accepted_name_code': previous_accepted,
+                                            new_tag + '_chained_accepted_name_code': chained_accepted,
+                                            new_tag + '_chained_accepted_species_code': chained_species})
+    # Number of names that were chained, for the result summary
+    chained_updated_records.attrs['original_names'] = num_original_names
+    return chained_updated_records
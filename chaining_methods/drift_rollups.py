@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from chaining_methods.all_pairs import get_disagreements, get_genus_codes, precompute_version
+from chaining_methods.chain_engine import ABSENT, compose_chain
+from chaining_methods.name_cleaning import get_genera_from_full_names
+from chaining_methods.name_codes import MISSING_CODE, decode_names
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.updating_taxonomies import result_summary_index
+
+# Columns of the roll up table which identify a row
+rollup_keys = ['taxonomy', 'comparison', 'old', 'new', 'level', 'group']
+# Disagreement counts of result_summary_index and the disagreements they count, as in get_pair_counts
+_disagreement_measures = dict(zip(result_summary_index[1:],
+                                  ['disagreements', 'species_disagreements', 'genus_disagreements', 'unresolved_via_chaining']))
+
+
+def _get_name_genera(taxa_maps: list) -> tuple:
+    """
+    Genus id of every name in any of the versions, from the name itself as in get_overrepresented_genera, indexed by name code.
+    Names without a genus are MISSING_CODE.
+
+    :return: (genus ids, genera).
+    """
+    size = len(taxa_maps[0].name_dictionary)
+    names = np.unique(np.concatenate([m.unique_names for m in taxa_maps]))
+    genus_ids, genera = pd.factorize(get_genera_from_full_names(pd.Series(decode_names(names, taxa_maps[0].name_dictionary))))
+    name_genera = np.full(size, MISSING_CODE, dtype=np.int32)
+    name_genera[names] = genus_ids
+    return name_genera, genera
+
+
+def _get_genus_families(taxa_maps: list, name_genera: np.ndarray, n_genera: int) -> tuple:
+    """
+    Family id of each genus id, from the family column of the versions that have one. Later versions take precedence,
+    so genera are placed in their most recent family. Genera without a family are MISSING_CODE.
+
+    :return: (family ids, families).
+    """
+    genus_families = np.full(n_genera, None, dtype=object)
+    for taxa_map in taxa_maps:
+        if 'family' not in taxa_map.taxa.columns:
+            continue
+        genera = name_genera.take(np.maximum(taxa_map.taxon_name_codes, 0))
+        families = taxa_map.taxa['family'].to_numpy(dtype=object)
+        has_family = (taxa_map.taxon_name_codes >= 0) & (genera >= 0) & pd.notna(families)
+        genus_family = pd.DataFrame({'genus': genera[has_family], 'family': families[has_family]}).drop_duplicates('genus')
+        genus_families[genus_family['genus'].to_numpy()] = genus_family['family'].to_numpy()
+    family_ids, families = pd.factorize(genus_families)
+    return family_ids.astype(np.int32), families
+
+
+def get_drift_rollups(taxa_versions: dict, taxonomy: str, pairs: list = None, full_chains: bool = True,
+                      name_dictionary: pd.Index = None) -> pd.DataFrame:
+    """
+    Counts of names and of disagreements between chained and direct resolutions (as in result_summary.csv) per genus and per family,
+    for every pair of versions and every full chain, in one long table.
+
+    For each comparison, the names are grouped by genus with one bincount per measure. Family counts are sums of the genus counts.
+    Genera are taken from the names, as in get_overrepresented_genera, and families from the family column of the versions,
+    so taxonomies without a family column only have genus rows.
+
+    :param taxa_versions: dict of version tag -> taxa dataframe or ResolutionMap, ordered from oldest to newest.
+    :param pairs: (old_tag, new_tag) pairs to compare, defaults to all pairs where the older version comes first.
+    :param full_chains: also compare chains from each version through every later version to the latest version, as in the full chain
+        results. Their old tag joins the tags of the versions before the latest one.
+    :return: dataframe keyed by rollup_keys, with the number of names of the group in the old version (total_names), the counts of
+        result_summary_index and the percent of total_names of each disagreement count.
+    """
+    tags = list(taxa_versions.keys())
+    taxa_maps = get_resolution_maps(list(taxa_versions.values()), name_dictionary)
+    name_dictionary = taxa_maps[0].name_dictionary
+    maps = dict(zip(tags, taxa_maps))
+    precomputed = {tag: precompute_version(maps[tag], name_dictionary) for tag in tags}
+    genus_codes = get_genus_codes(precomputed, name_dictionary)
+    name_genera, genera = _get_name_genera(taxa_maps)
+    genus_families, families = _get_genus_families(taxa_maps, name_genera, len(genera))
+    # Names without a genus are counted in a last group, which is dropped
+    name_genera = np.where(name_genera >= 0, name_genera, len(genera))
+
+    if pairs is None:
+        pairs = [(old_tag, new_tag) for i, old_tag in enumerate(tags) for new_tag in tags[i + 1:]]
+    comparisons = [('pair', old_tag, old_tag, new_tag, [maps[new_tag]]) for old_tag, new_tag in pairs]
+    if full_chains:
+        comparisons += [('full_chain', '_'.join(tags[i:-1]), tags[i], tags[-1], taxa_maps[i + 1:]) for i in range(len(tags) - 2)]
+
+    size = len(name_dictionary)
+    total_names = {}
+    counts = np.zeros((len(comparisons), 1 + len(result_summary_index), len(genera) + 1), dtype=np.int64)
+    for i, (_, _, old_tag, new_tag, chain_maps) in enumerate(comparisons):
+        if old_tag not in total_names:
+            present = np.flatnonzero(precomputed[old_tag]['direct_accepted'][:size] != ABSENT)
+            total_names[old_tag] = np.bincount(name_genera[present], minlength=len(genera) + 1)
+        names = precomputed[old_tag]['start_names']
+        _, chained_accepted, chained_species = compose_chain(precomputed[old_tag]['direct_accepted'].take(names),
+                                                             [m.chaining_resolution for m in chain_maps])
+        disagreements = get_disagreements(chained_accepted, chained_species, precomputed[new_tag]['direct_accepted'].take(names),
+                                          precomputed[new_tag]['direct_species'].take(names), genus_codes)
+        groups = name_genera[names]
+        counts[i, 0] = total_names[old_tag]
+        counts[i, 1] = np.bincount(groups, minlength=len(genera) + 1)
+        for j, disagreement in enumerate(_disagreement_measures.values()):
+            counts[i, 2 + j] = np.bincount(groups, weights=disagreements[disagreement], minlength=len(genera) + 1)
+    counts = counts[:, :, :-1]
+
+    # Family counts reuse the genus counts, genera without a family are dropped
+    family_counts = np.zeros((len(comparisons), counts.shape[1], len(families) + 1), dtype=np.int64)
+    np.add.at(family_counts, (slice(None), slice(None), np.where(genus_families >= 0, genus_families, len(families))), counts)
+    family_counts = family_counts[:, :, :-1]
+
+    rollups = []
+    for level, groups, level_counts in [('genus', genera, counts), ('family', families, family_counts)]:
+        comparison_ids, group_ids = np.nonzero(level_counts[:, 0] > 0)
+        rollup = pd.DataFrame({'taxonomy': taxonomy,
+                               'comparison': [comparisons[i][0] for i in comparison_ids],
+                               'old': [comparisons[i][1] for i in comparison_ids],
+                               'new': [comparisons[i][3] for i in comparison_ids],
+                               'level': level,
+                               'group': np.asarray(groups, dtype=object).take(group_ids)})
+        for j, measure in enumerate(['total_names'] + result_summary_index):
+            rollup[measure] = level_counts[comparison_ids, j, group_ids]
+        for measure in _disagreement_measures:
+            rollup[f'percent_{measure}'] = 100 * rollup[measure] / rollup['total_names']
+        rollups.append(rollup)
+    return pd.concat(rollups, ignore_index=True)
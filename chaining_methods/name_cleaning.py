@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from wcvpy.wcvp_download import clean_whitespaces_in_names
+from wcvpy.wcvp_name_matching import remove_spacelike_chars, add_space_around_hybrid_chars_and_infraspecific_epithets, \
+    get_genus_from_full_name
+
+
+def apply_to_unique_names(names: pd.Series, function, cache: dict = None) -> pd.Series:
+    """
+    Equivalent to names.apply(function), but function is only called once for each distinct name.
+
+    :param cache: optional results of function from earlier calls, name -> result, e.g. to share work between versions. New names
+        are added to it, so it grows with the distinct names given to it and is owned by the caller.
+    """
+    codes, unique_names = pd.factorize(names, use_na_sentinel=False)
+    unique_names = unique_names.to_numpy(dtype=object)
+
+    results = np.empty(len(unique_names), dtype=object)
+    for i, name in enumerate(unique_names):
+        if cache is not None and isinstance(name, str):
+            if name not in cache:
+                cache[name] = function(name)
+            results[i] = cache[name]
+        else:
+            # Missing values aren't cached, as nan doesn't work as a dict key
+            results[i] = function(name)
+    return pd.Series(results.take(codes), index=names.index, name=names.name)
+
+
+def clean_name(name):
+    return clean_whitespaces_in_names(add_space_around_hybrid_chars_and_infraspecific_epithets(remove_spacelike_chars(name)))
+
+
+def clean_names(names: pd.Series, cache: dict = None) -> pd.Series:
+    """
+    Remove spacelike characters, add spaces around hybrid characters and infraspecific epithets and clean whitespace,
+    using the wcvpy helpers on each distinct name once.
+
+    :param cache: see apply_to_unique_names.
+    """
+    return apply_to_unique_names(names, clean_name, cache=cache)
+
+
+def get_genera_from_full_names(names: pd.Series, cache: dict = None) -> pd.Series:
+    """
+    Equivalent to names.apply(get_genus_from_full_name), computed once for each distinct name.
+
+    :param cache: see apply_to_unique_names.
+    """
+    return apply_to_unique_names(names, get_genus_from_full_name, cache=cache)
@@ -0,0 +1,99 @@
+import itertools
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Code used for missing names (nan or not in the dictionary)
+MISSING_CODE = -1
+
+# String columns used in chaining and the int32 code column stored alongside each of them
+name_code_columns = {'taxon_name_w_authors': 'taxon_name_code',
+                     'accepted_name_w_author': 'accepted_name_code',
+                     'accepted_species': 'accepted_species_code'}
+# Dictionaries that code columns were built from, by the token stored in the taxa attrs. Entries go when their dictionary is freed,
+# so a token can't match a later dictionary
+_code_dictionaries = weakref.WeakValueDictionary()
+_code_tokens = itertools.count()
+
+
+def build_name_dictionary(taxa_versions: list, columns: list = None) -> pd.Index:
+    """
+    Build one name dictionary shared by all given taxonomy versions, so that each name gets the same int32 code in every version.
+
+    :param taxa_versions: list of taxa dataframes, e.g. all loaded WCVP or WFO versions.
+    :param columns: string columns to collect names from. Defaults to the keys of name_code_columns.
+    :return: a pandas Index of unique names, where the position of a name is its code.
+    """
+    if columns is None:
+        columns = list(name_code_columns.keys())
+    all_names = []
+    for taxa in taxa_versions:
+        for c in columns:
+            if c in taxa.columns:
+                all_names.append(taxa[c].dropna().unique())
+    if len(all_names) == 0:
+        return pd.Index([], dtype=object)
+    name_dictionary = pd.Index(pd.unique(np.concatenate(all_names)))
+    if len(name_dictionary) >= np.iinfo(np.int32).max:
+        raise ValueError('Too many names to encode as int32')
+    return name_dictionary
+
+
+def encode_names(names, name_dictionary: pd.Index) -> np.ndarray:
+    """
+    Convert an array of names to int32 codes. Nan and unknown names get MISSING_CODE.
+    """
+    return name_dictionary.get_indexer(pd.Index(names)).astype(np.int32)
+
+
+def decode_names(codes, name_dictionary: pd.Index) -> np.ndarray:
+    """
+    Convert int32 codes back to names. Negative codes become nan.
+    """
+    codes = np.asarray(codes)
+    # Pad the lookup with a nan at the end so that MISSING_CODE (-1) takes the last value
+    lookup = np.append(name_dictionary.to_numpy(dtype=object), np.nan)
+    return lookup.take(np.where(codes < 0, -1, codes))
+
+
+def add_name_codes(taxa: pd.DataFrame, name_dictionary: pd.Index) -> pd.DataFrame:
+    """
+    Add int32 code columns (see name_code_columns) to the taxa dataframe, in place, so they are only computed once per version.
+    The dictionary is recorded in taxa.attrs, so the columns are only reused with the same dictionary.
+    """
+    for c in name_code_columns:
+        if c in taxa.columns:
+            taxa[name_code_columns[c]] = encode_names(taxa[c], name_dictionary)
+    token = next(_code_tokens)
+    _code_dictionaries[token] = name_dictionary
+    taxa.attrs['name_dictionary_token'] = token
+    return taxa
+
+
+def encode_all_versions(taxa_versions: list) -> pd.Index:
+    """
+    Build the shared name dictionary for the given versions and add code columns to each of them.
+    """
+    name_dictionary = build_name_dictionary(taxa_versions)
+    for taxa in taxa_versions:
+        add_name_codes(taxa, name_dictionary)
+    return name_dictionary
+
+
+def get_name_codes(taxa: pd.DataFrame, column: str, name_dictionary: pd.Index) -> np.ndarray:
+    """
+    Get codes for a string column, reusing the stored code column if add_name_codes has already been run with this name_dictionary.
+    """
+    code_column = name_code_columns.get(column)
+    if code_column is not None and code_column in taxa.columns and \
+            _code_dictionaries.get(taxa.attrs.get('name_dictionary_token')) is name_dictionary:
+        return taxa[code_column].to_numpy(dtype=np.int32)
+    return encode_names(taxa[column], name_dictionary)
+
+
+def drop_code_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Remove code columns before writing output.
+    """
+    return df[[c for c in df.columns if not c.endswith('_code')]]
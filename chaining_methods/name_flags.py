@@ -0,0 +1,139 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import ABSENT, AMBIGUOUS
+from chaining_methods.name_codes import decode_names
+from chaining_methods.resolution_map import get_resolution_maps
+
+# Flags kept for each name in each version
+name_flags = ['present', 'resolves', 'accepted', 'species', 'ambiguous']
+accepted_statuses = ['Accepted', 'Artificial Hybrid']
+
+# Number of set bits in each byte
+_bit_counts = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def get_version_flags(taxa_map) -> dict:
+    """
+    Flags of every name in the map's name dictionary for one version, as boolean arrays indexed by name code:
+    present (the name has a record), resolves (it has a record with an accepted name), accepted (it has a record with an accepted status),
+    species (it has a record of species rank) and ambiguous (it has more than one accepted name).
+    """
+    size = len(taxa_map.name_dictionary)
+    accepted = taxa_map.direct_resolution[0][:size]
+    flags = {'present': accepted != ABSENT,
+             'resolves': (accepted >= 0) | (accepted == AMBIGUOUS),
+             'ambiguous': accepted == AMBIGUOUS}
+    names = taxa_map.taxon_name_codes
+    for flag, mask in [('accepted', ~taxa_map.get_record_mask(exclude_statuses=accepted_statuses)),
+                       ('species', taxa_map.get_record_mask(rank='Species'))]:
+        flags[flag] = np.zeros(size, dtype=bool)
+        flags[flag][names[mask & (names >= 0)]] = True
+    return flags
+
+
+class NameFlagMatrix:
+    """
+    Flags of every name in every version as a bit packed (flag, version, name) array, so set questions across versions,
+    e.g. how many names resolve in one version but not another, are bitwise operations on packed rows rather than python sets of names.
+    Each row has one bit per name code of the shared name dictionary.
+    """
+
+    def __init__(self, taxa_versions: dict, name_dictionary: pd.Index = None):
+        """
+        :param taxa_versions: dict of version tag -> taxa dataframe or ResolutionMap, ordered from oldest to newest.
+        """
+        self.tags = list(taxa_versions.keys())
+        taxa_maps = get_resolution_maps(list(taxa_versions.values()), name_dictionary)
+        self.name_dictionary = taxa_maps[0].name_dictionary
+        self.bits = np.zeros((len(name_flags), len(self.tags), (len(self.name_dictionary) + 7) // 8), dtype=np.uint8)
+        for version, taxa_map in enumerate(taxa_maps):
+            flags = get_version_flags(taxa_map)
+            for flag_index, flag in enumerate(name_flags):
+                self.bits[flag_index, version] = np.packbits(flags[flag])
+
+    def save(self, matrix_dir: str):
+        """
+        Write the matrix to matrix_dir, so it can be built once and loaded with NameFlagMatrix.load.
+        """
+        os.makedirs(matrix_dir, exist_ok=True)
+        pd.DataFrame({'name': self.name_dictionary.to_numpy(dtype=object)}).to_parquet(os.path.join(matrix_dir, 'names.parquet'))
+        with open(os.path.join(matrix_dir, 'versions.json'), 'w') as f:
+            json.dump({'tags': self.tags, 'flags': name_flags}, f)
+        np.save(os.path.join(matrix_dir, 'bits.npy'), self.bits)
+
+    @classmethod
+    def load(cls, matrix_dir: str, mmap_mode: str = 'r'):
+        """
+        Load a matrix written by save. The bits are memory mapped by default.
+        """
+        matrix = cls.__new__(cls)
+        matrix.name_dictionary = pd.Index(pd.read_parquet(os.path.join(matrix_dir, 'names.parquet'))['name'].to_numpy(dtype=object))
+        with open(os.path.join(matrix_dir, 'versions.json')) as f:
+            versions = json.load(f)
+        if versions['flags'] != name_flags:
+            raise ValueError(f'Matrix in {matrix_dir} has flags {versions["flags"]}, not {name_flags}')
+        matrix.tags = versions['tags']
+        matrix.bits = np.load(os.path.join(matrix_dir, 'bits.npy'), mmap_mode=mmap_mode)
+        return matrix
+
+    def get_bits(self, flags, tag: str) -> np.ndarray:
+        """
+        Packed row of the names with all the given flags in a version.
+
+        :param flags: a flag or list of flags, e.g. ['accepted', 'species'].
+        """
+        if isinstance(flags, str):
+            flags = [flags]
+        version = self.tags.index(tag)
+        bits = self.bits[name_flags.index(flags[0]), version]
+        for flag in flags[1:]:
+            bits = bits & self.bits[name_flags.index(flag), version]
+        return bits
+
+    def _combine(self, old_bits: np.ndarray, new_bits: np.ndarray, difference: bool) -> np.ndarray:
+        # Names in the old rows and in (or, for a difference, not in) the new rows. Old rows never have the padding bits set
+        return old_bits & ~new_bits if difference else old_bits & new_bits
+
+    def count(self, flags, tag: str) -> int:
+        return int(_bit_counts.take(self.get_bits(flags, tag)).sum(dtype=np.int64))
+
+    def count_pair(self, old_flags, old_tag: str, new_tag: str, new_flags=None, difference: bool = True) -> int:
+        """
+        Number of names with old_flags in the old version which don't have (or, if difference is False, also have) new_flags in the new version.
+
+        :param new_flags: defaults to old_flags.
+        """
+        if new_flags is None:
+            new_flags = old_flags
+        return int(_bit_counts.take(self._combine(self.get_bits(old_flags, old_tag), self.get_bits(new_flags, new_tag),
+                                                  difference)).sum(dtype=np.int64))
+
+    def count_all_pairs(self, old_flags, new_flags=None, difference: bool = True) -> pd.DataFrame:
+        """
+        count_pair for every (old version, new version) pair at once, including pairs where the new version is older.
+
+        :return: old x new dataframe of counts, where the diagonal compares each version with itself.
+        """
+        if new_flags is None:
+            new_flags = old_flags
+        new_bits = np.stack([self.get_bits(new_flags, tag) for tag in self.tags])
+        counts = np.zeros((len(self.tags), len(self.tags)), dtype=np.int64)
+        for version, tag in enumerate(self.tags):
+            # One old version against all new versions at a time, which keeps the temporary arrays to versions x bytes
+            combined = self._combine(self.get_bits(old_flags, tag)[np.newaxis, :], new_bits, difference)
+            counts[version] = _bit_counts.take(combined).sum(axis=1, dtype=np.int64)
+        return pd.DataFrame(counts, index=self.tags, columns=self.tags)
+
+    def get_names(self, old_flags, old_tag: str, new_tag: str = None, new_flags=None, difference: bool = True) -> np.ndarray:
+        """
+        The names counted by count (if new_tag is None) or count_pair.
+        """
+        bits = self.get_bits(old_flags, old_tag)
+        if new_tag is not None:
+            bits = self._combine(bits, self.get_bits(old_flags if new_flags is None else new_flags, new_tag), difference)
+        codes = np.flatnonzero(np.unpackbits(bits, count=len(self.name_dictionary)))
+        return decode_names(codes, self.name_dictionary)
@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import ABSENT
+from chaining_methods.name_codes import MISSING_CODE, decode_names, encode_names
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.transitivity_index import ABSENT_STATUS, get_statuses
+
+
+def _to_dates(dates) -> np.ndarray:
+    # Release and query dates are compared as datetimes, so 'YYYY-MM' and full dates can be mixed
+    return pd.to_datetime(np.atleast_1d(np.asarray(dates, dtype=object)), format='ISO8601').to_numpy(dtype='datetime64[ns]')
+
+
+class NameHistory:
+    """
+    The direct resolution of every name over the release dates of a taxonomy, stored as intervals: a name only has an entry for
+    the releases where its resolution changed, and keeps that resolution until its next entry.
+    Entries are sorted by (name code, release) so point in time and range queries are binary searches, and are answered for
+    batches of names at once.
+    """
+
+    def __init__(self, taxa_versions: dict, release_dates: dict, name_dictionary: pd.Index = None):
+        """
+        :param taxa_versions: dict of version tag -> taxa dataframe or ResolutionMap.
+        :param release_dates: dict of version tag -> release date, e.g. {'v10': '2022-10'}.
+        """
+        self.tags = sorted(taxa_versions.keys(), key=lambda tag: _to_dates(release_dates[tag])[0])
+        self.release_dates = _to_dates([release_dates[tag] for tag in self.tags])
+        taxa_maps = get_resolution_maps([taxa_versions[tag] for tag in self.tags], name_dictionary)
+        self.name_dictionary = taxa_maps[0].name_dictionary
+
+        size = len(self.name_dictionary)
+        previous_accepted = np.full(size, ABSENT, dtype=np.int32)
+        previous_species = np.full(size, ABSENT, dtype=np.int32)
+        names, releases, accepted, species = [], [], [], []
+        for release, taxa_map in enumerate(taxa_maps):
+            release_accepted, release_species = [r[:size] for r in taxa_map.direct_resolution]
+            changed = np.flatnonzero((release_accepted != previous_accepted) | (release_species != previous_species)).astype(np.int32)
+            names.append(changed)
+            releases.append(np.full(len(changed), release, dtype=np.int32))
+            accepted.append(release_accepted[changed])
+            species.append(release_species[changed])
+            previous_accepted, previous_species = release_accepted, release_species
+        names = np.concatenate(names)
+        releases = np.concatenate(releases)
+        order = np.lexsort((releases, names))
+        self.names = names[order]
+        self.releases = releases[order]
+        self.accepted = np.concatenate(accepted)[order]
+        self.species = np.concatenate(species)[order]
+        # Sort keys of the entries, searched by every query
+        self.keys = self.names.astype(np.int64) * len(self.tags) + self.releases
+
+    def save(self, history_dir: str):
+        """
+        Write the history to history_dir, so it can be built once and loaded with NameHistory.load.
+        """
+        os.makedirs(history_dir, exist_ok=True)
+        pd.DataFrame({'name': self.name_dictionary.to_numpy(dtype=object)}).to_parquet(os.path.join(history_dir, 'names.parquet'))
+        with open(os.path.join(history_dir, 'releases.json'), 'w') as f:
+            json.dump({'tags': self.tags, 'release_dates': [str(d) for d in self.release_dates]}, f)
+        for column in ['names', 'releases', 'accepted', 'species', 'keys']:
+            np.save(os.path.join(history_dir, f'{column}.npy'), getattr(self, column))
+
+    @classmethod
+    def load(cls, history_dir: str, mmap_mode: str = 'r'):
+        """
+        Load a history written by save. Arrays are memory mapped by default.
+        """
+        history = cls.__new__(cls)
+        history.name_dictionary = pd.Index(pd.read_parquet(os.path.join(history_dir, 'names.parquet'))['name'].to_numpy(dtype=object))
+        with open(os.path.join(history_dir, 'releases.json')) as f:
+            releases = json.load(f)
+        history.tags = releases['tags']
+        history.release_dates = _to_dates(releases['release_dates'])
+        for column in ['names', 'releases', 'accepted', 'species', 'keys']:
+            setattr(history, column, np.load(os.path.join(history_dir, f'{column}.npy'), mmap_mode=mmap_mode))
+        return history
+
+    def get_release(self, dates) -> np.ndarray:
+        # Index of the latest release on or before each date, -1 for dates before the first release
+        return np.searchsorted(self.release_dates, _to_dates(dates), side='right') - 1
+
+    def _get_entries(self, codes: np.ndarray, releases: np.ndarray) -> np.ndarray:
+        # Position of the entry in force for each (name code, release), or -1 if the name has no entry yet.
+        # Names which were removed have an ABSENT entry, so an entry is in force until the next one
+        positions = np.searchsorted(self.keys, codes.astype(np.int64) * len(self.tags) + releases, side='right') - 1
+        found = (codes >= 0) & (releases >= 0) & (positions >= 0)
+        found[found] = self.names[positions[found]] == codes[found]
+        return np.where(found, positions, -1)
+
+    def _decode_entries(self, positions: np.ndarray) -> dict:
+        accepted = np.where(positions >= 0, self.accepted[np.maximum(positions, 0)], ABSENT)
+        species = np.where(positions >= 0, self.species[np.maximum(positions, 0)], ABSENT)
+        return {'accepted_name_w_author': decode_names(accepted, self.name_dictionary),
+                'accepted_species': decode_names(species, self.name_dictionary),
+                'status': get_statuses(accepted)}
+
+    def resolve_as_of(self, names, dates) -> pd.DataFrame:
+        """
+        What each name resolved to directly in the latest release on or before the given date.
+
+        :param names: taxon names with authors.
+        :param dates: a single date for all names, or one date per name.
+        :return: dataframe with a row per name, giving the release used and the resolution, with statuses as in TransitivityIndex.
+            Names before the first release or not in the release are absent.
+        """
+        names = np.asarray(names, dtype=object)
+        releases = np.broadcast_to(self.get_release(dates), names.shape)
+        codes = encode_names(names, self.name_dictionary)
+        positions = self._get_entries(codes, releases)
+        tags = np.append(np.array(self.tags, dtype=object), np.nan).take(releases)
+        return pd.DataFrame({'taxon_name_w_authors': names, 'as_of': np.broadcast_to(_to_dates(dates), names.shape), 'version': tags,
+                             **self._decode_entries(positions)})
+
+    def get_history(self, names, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        The resolutions of each name in force at any time between start_date and end_date (inclusive), one row per interval.
+
+        :return: dataframe with the name, the version and date each resolution started in, the date it was replaced (NaT if it wasn't)
+            and the resolution.
+        """
+        names = pd.unique(np.asarray(names, dtype=object))
+        codes = encode_names(names, self.name_dictionary)
+        start_release = 0 if start_date is None else max(self.get_release(start_date)[0], 0)
+        end_release = len(self.tags) - 1 if end_date is None else self.get_release(end_date)[0]
+        # From the entry in force at the start to the last entry starting on or before the end
+        first = self._get_entries(codes, np.full(len(codes), start_release))
+        last = np.searchsorted(self.keys, codes.astype(np.int64) * len(self.tags) + end_release, side='right')
+        first = np.where(first >= 0, first, np.searchsorted(self.keys, codes.astype(np.int64) * len(self.tags) + start_release))
+        counts = np.where((codes != MISSING_CODE) & (end_release >= 0), np.maximum(last - first, 0), 0)
+        rows = np.repeat(np.arange(len(names)), counts)
+        positions = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        next_positions = positions + 1
+        replaced = next_positions < len(self.names)
+        replaced[replaced] = self.names[next_positions[replaced]] == self.names[positions[replaced]]
+        release_dates = np.append(self.release_dates, np.datetime64('NaT'))
+        history = pd.DataFrame({'taxon_name_w_authors': names[rows],
+                                'version': np.array(self.tags, dtype=object)[self.releases[positions]],
+                                'valid_from': self.release_dates[self.releases[positions]],
+                                'valid_until': release_dates[np.where(replaced, self.releases[np.minimum(next_positions, len(self.names) - 1)],
+                                                                      -1)],
+                                **self._decode_entries(positions)})
+        # Intervals where the name was absent are not reported
+        return history[history['status'] != ABSENT_STATUS].reset_index(drop=True)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from chaining_methods.all_pairs import get_disagreements, get_genus_codes
+from chaining_methods.chain_engine import ABSENT, AMBIGUOUS, UNRESOLVED
+from chaining_methods.name_codes import decode_names
+from chaining_methods.resolution_map import get_resolution_maps
+
+
+def _get_version_lists(masks: np.ndarray, tags: list) -> np.ndarray:
+    # '|' separated tags of the versions set in each bit mask, with nan for empty masks. Each distinct mask is only joined once
+    unique_masks, inverse = np.unique(masks, return_inverse=True)
+    joined = np.array(['|'.join(tag for i, tag in enumerate(tags) if mask >> i & 1) if mask > 0 else np.nan for mask in unique_masks],
+                      dtype=object)
+    return joined.take(inverse.ravel())
+
+
+def get_stability_profiles(taxa_versions: dict, name_dictionary: pd.Index = None) -> pd.DataFrame:
+    """
+    How stable each name is over all versions, in one sweep from the oldest to the newest version.
+
+    Chains are compared with the direct resolution in their last version, with the rules of get_disagreements. A name is compared in
+    each chain from a version where it resolves to every later version, both chained directly between the two versions (as in
+    compare_all_version_pairs) and through every version in between (as in the full chain results).
+
+    :param taxa_versions: dict of version tag -> taxa dataframe or ResolutionMap, ordered from oldest to newest.
+    :return: dataframe with a row for each name in any version, giving the number of versions it is in and resolves in,
+        the first and last versions it resolves in, the number of times its accepted name changed between the versions where it has
+        a single accepted name, the versions where it is ambiguous, the number of chains it was compared in, the number where the chained
+        accepted name disagreed with the direct one, and whether it ever failed transitivity.
+    """
+    tags = list(taxa_versions.keys())
+    if len(tags) > 63:
+        raise ValueError('Ambiguous versions are stored as 64 bit masks, so at most 63 versions can be profiled')
+    taxa_maps = get_resolution_maps(list(taxa_versions.values()), name_dictionary)
+    name_dictionary = taxa_maps[0].name_dictionary
+    size = len(name_dictionary)
+    genus_codes = get_genus_codes({tag: {'direct_accepted': m.direct_resolution[0], 'chaining_accepted': m.chaining_resolution[0]}
+                                   for tag, m in zip(tags, taxa_maps)}, name_dictionary)
+
+    versions_present = np.zeros(size, dtype=np.int32)
+    versions_resolved = np.zeros(size, dtype=np.int32)
+    first_resolved = np.full(size, -1, dtype=np.int32)
+    last_resolved = np.full(size, -1, dtype=np.int32)
+    last_accepted = np.full(size, ABSENT, dtype=np.int32)
+    accepted_name_changes = np.zeros(size, dtype=np.int32)
+    ambiguous_masks = np.zeros(size, dtype=np.int64)
+    n_ambiguous_versions = np.zeros(size, dtype=np.int32)
+    chains_compared = np.zeros(size, dtype=np.int32)
+    transitivity_failures = np.zeros(size, dtype=np.int32)
+    # Accepted names each start version resolves to, and where its chain through every later version has got to
+    start_accepted = np.empty((0, size), dtype=np.int32)
+    chain_accepted = np.empty((0, size), dtype=np.int32)
+
+    for version, taxa_map in enumerate(taxa_maps):
+        direct_accepted, direct_species = [r[:size] for r in taxa_map.direct_resolution]
+        resolves = (direct_accepted >= 0) | (direct_accepted == AMBIGUOUS)
+        versions_present += direct_accepted != ABSENT
+        versions_resolved += resolves
+        first_resolved[(first_resolved < 0) & resolves] = version
+        last_resolved[resolves] = version
+        accepted_name_changes += (direct_accepted >= 0) & (last_accepted >= 0) & (direct_accepted != last_accepted)
+        last_accepted = np.where(direct_accepted >= 0, direct_accepted, last_accepted)
+        ambiguous_masks |= (direct_accepted == AMBIGUOUS).astype(np.int64) << version
+        n_ambiguous_versions += direct_accepted == AMBIGUOUS
+
+        if version > 0:
+            # Chains through every version, then chains straight from each start version except the previous one,
+            # whose chain through every version is the same chain
+            previous_accepted = np.concatenate([chain_accepted, start_accepted[:-1]])
+            chaining_accepted, chaining_species = taxa_map.chaining_resolution
+            chained_accepted = chaining_accepted.take(previous_accepted)
+            disagreements = get_disagreements(chained_accepted.ravel(), chaining_species.take(previous_accepted).ravel(),
+                                              np.broadcast_to(direct_accepted, previous_accepted.shape).ravel(),
+                                              np.broadcast_to(direct_species, previous_accepted.shape).ravel(), genus_codes)
+            chains_compared += disagreements['compared'].reshape(previous_accepted.shape).sum(axis=0, dtype=np.int32)
+            transitivity_failures += disagreements['disagreements'].reshape(previous_accepted.shape).sum(axis=0, dtype=np.int32)
+            # Names which don't resolve in this version are dropped from the chains through it, as in compose_chain
+            chained_accepted = chained_accepted[:len(chain_accepted)]
+            chain_accepted = np.where(chained_accepted == UNRESOLVED, ABSENT, chained_accepted).astype(np.int32)
+        # Names which resolve to a single accepted name start a chain here
+        started = np.where(direct_accepted >= 0, direct_accepted, ABSENT).astype(np.int32)[np.newaxis, :]
+        start_accepted = np.concatenate([start_accepted, started])
+        chain_accepted = np.concatenate([chain_accepted, started])
+
+    names = np.flatnonzero(versions_present > 0)
+    version_tags = np.append(np.array(tags, dtype=object), np.nan)
+    return pd.DataFrame({'taxon_name_w_authors': decode_names(names, name_dictionary),
+                         'versions_present': versions_present[names],
+                         'versions_resolved': versions_resolved[names],
+                         'first_resolved_version': version_tags.take(first_resolved[names]),
+                         'last_resolved_version': version_tags.take(last_resolved[names]),
+                         'accepted_name_changes': accepted_name_changes[names],
+                         'ambiguous_versions': _get_version_lists(ambiguous_masks[names], tags),
+                         'n_ambiguous_versions': n_ambiguous_versions[names],
+                         'chains_compared': chains_compared[names],
+                         'transitivity_failures': transitivity_failures[names],
+                         'failed_transitivity': transitivity_failures[names] > 0})
+
+
+def rank_by_instability(profiles: pd.DataFrame) -> pd.DataFrame:
+    # Least stable names first: by transitivity failures, then accepted name changes, then ambiguous versions
+    return profiles.sort_values(['transitivity_failures', 'accepted_name_changes', 'n_ambiguous_versions', 'taxon_name_w_authors'],
+                                ascending=[False, False, False, True], kind='stable').reset_index(drop=True)
@@ -0,0 +1,139 @@
+import json
+import os
+
+import pandas as pd
+
+from chaining_methods.all_pairs import count_version_pairs_by_rank, get_genus_codes, get_rank_index, precompute_version, \
+    write_pair_rank_summaries
+from chaining_methods.name_codes import build_name_dictionary
+from chaining_methods.resolution_graph import ResolutionGraph
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.sparse_chain import get_reachable_names
+from chaining_methods.updating_taxonomies import compare_chained_and_direct_updates, get_direct_name_updates, result_summary_index
+
+_registry_file = 'releases.json'
+
+
+def _read_registry(outpath: str) -> dict:
+    registry_file = os.path.join(outpath, _registry_file)
+    if not os.path.isfile(registry_file):
+        return {'tags': [], 'release_dates': {}, 'details': {}}
+    with open(registry_file) as f:
+        return json.load(f)
+
+
+def get_registered_releases(outpath: str, default_tags: list) -> list:
+    """
+    Version tags of a taxonomy in release order: default_tags followed by any releases added with append_release.
+    """
+    tags = list(default_tags)
+    return tags + [tag for tag in _read_registry(outpath)['tags'] if tag not in tags]
+
+
+def get_registered_release_dates(outpath: str, default_release_dates: dict) -> dict:
+    # Release dates of default_release_dates and of any releases added with append_release
+    return {**default_release_dates, **_read_registry(outpath)['release_dates']}
+
+
+def get_release_details(outpath: str, tag: str) -> dict:
+    # Details given when the release was registered, e.g. where to download it. Empty for default releases
+    return _read_registry(outpath)['details'].get(tag, {})
+
+
+def register_release(outpath: str, tag: str, release_date: str = None, details: dict = None):
+    registry = _read_registry(outpath)
+    if tag not in registry['tags']:
+        registry['tags'].append(tag)
+    if release_date is not None:
+        registry['release_dates'][tag] = release_date
+    if details is not None:
+        registry['details'][tag] = details
+    os.makedirs(outpath, exist_ok=True)
+    with open(os.path.join(outpath, _registry_file), 'w') as f:
+        json.dump(registry, f)
+
+
+def update_pair_matrices(outpath: str, pair_counts: dict, tags: list) -> dict:
+    """
+    Add counts of new pairs to the all_pairs_{measure}.csv matrices written by compare_all_version_pairs, keeping the existing counts.
+
+    :return: dict of measure -> updated old x new dataframe of counts.
+    """
+    matrices = {}
+    for measure_index, measure in enumerate(result_summary_index):
+        matrix_file = os.path.join(outpath, f'all_pairs_{measure}.csv')
+        if os.path.isfile(matrix_file):
+            matrix = pd.read_csv(matrix_file, index_col=0).reindex(index=tags, columns=tags)
+        else:
+            matrix = pd.DataFrame(float('nan'), index=tags, columns=tags)
+        for (old_tag, new_tag), counts in pair_counts.items():
+            matrix.at[old_tag, new_tag] = counts[measure_index]
+        matrix.to_csv(matrix_file)
+        matrices[measure] = matrix
+    return matrices
+
+
+def update_rank_summaries(outpath: str, rank_summaries: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the rank summaries of new pairs, from write_pair_rank_summaries, to the all_pairs_by_rank.csv written by
+    compare_all_version_pairs, replacing any earlier rows of the same pairs.
+    """
+    table_file = os.path.join(outpath, 'all_pairs_by_rank.csv')
+    if os.path.isfile(table_file):
+        existing = pd.read_csv(table_file)
+        new_pairs = pd.MultiIndex.from_frame(rank_summaries[['old', 'new']].astype(str))
+        existing = existing[~pd.MultiIndex.from_frame(existing[['old', 'new']].astype(str)).isin(new_pairs)]
+        rank_summaries = pd.concat([existing, rank_summaries], ignore_index=True)
+    rank_summaries.to_csv(table_file, index=False)
+    return rank_summaries
+
+
+def append_release(get_taxa, new_tag: str, outpath: str, registered_tags: list, release_date: str = None, n_workers: int = 1,
+                   parquet_path: str = None, taxonomy: str = None, full_chain_dir: str = None, chain_tag: str = 'previous_chain',
+                   details: dict = None) -> dict:
+    """
+    Add a new release to the results of a taxonomy without recomputing existing pairs. Only the pairs of each registered version
+    with the new version are counted, their result summaries (and summaries by rank) are written, and the all pairs matrices
+    and all_pairs_by_rank.csv are updated in place.
+    The release is then registered, so it is included in get_registered_releases.
+
+    :param get_taxa: function of a version tag returning its taxa dataframe, e.g. from the version cache.
+    :param registered_tags: tags of the versions already compared, in release order, see get_registered_releases.
+    :param parquet_path: if given, the new pair counts are also written to this parquet dataset, under the given taxonomy.
+    :param full_chain_dir: if given, the full chain from the first registered version through every version to the new one is
+        compared with the direct resolutions in the new version, as in full_chain_results.
+    :param details: stored with the release, see get_release_details.
+    :return: dict of measure -> old x new dataframe of counts, for all versions.
+    """
+    if new_tag in registered_tags:
+        raise ValueError(f'{new_tag} is already registered')
+    if parquet_path is not None and taxonomy is None:
+        raise ValueError('A taxonomy name is needed to write to a parquet dataset')
+    tags = list(registered_tags) + [new_tag]
+    taxa_versions = {tag: get_taxa(tag) for tag in tags}
+    name_dictionary = build_name_dictionary(list(taxa_versions.values()))
+    taxa_versions = dict(zip(tags, get_resolution_maps(list(taxa_versions.values()), name_dictionary)))
+
+    ranks = get_rank_index(list(taxa_versions.values()))
+    precomputed = {}
+    for tag in tags:
+        print(f'Preprocessing {tag}')
+        precomputed[tag] = precompute_version(taxa_versions[tag], name_dictionary, ranks)
+    genus_codes = get_genus_codes(precomputed, name_dictionary)
+    pair_rank_counts = count_version_pairs_by_rank(precomputed, genus_codes, [(old_tag, new_tag) for old_tag in registered_tags],
+                                                   ranks, n_workers)
+    update_rank_summaries(outpath, write_pair_rank_summaries(pair_rank_counts, ranks, outpath, parquet_path, taxonomy))
+    pair_counts = {pair: [int(c) for c in rank_counts.sum(axis=1)] for pair, rank_counts in pair_rank_counts.items()}
+    matrices = update_pair_matrices(outpath, pair_counts, tags)
+
+    if full_chain_dir is not None:
+        graph = ResolutionGraph(tags, taxa_versions, name_dictionary=name_dictionary)
+        full_chain = graph.get_chained_records(tags[0], full_chain_dir, chain_tag=chain_tag)
+        direct_updated_records = get_direct_name_updates(taxa_versions[tags[0]], taxa_versions[new_tag], new_tag, full_chain_dir)
+        get_reachable_names(taxa_versions[tags[0]], [taxa_versions[tag] for tag in tags[1:]], new_tag, full_chain_dir, chain_tag=chain_tag)
+        # Also writes the result summary
+        compare_chained_and_direct_updates(full_chain, direct_updated_records, chain_tag, new_tag, full_chain_dir,
+                                           parquet_path=parquet_path, taxonomy=taxonomy, start_map=graph.maps[tags[0]])
+
+    register_release(outpath, new_tag, release_date, details)
+    return matrices
@@ -0,0 +1,116 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# State of each worker process, set by _init_worker
+_worker_blocks = []
+_worker_arrays = {}
+_worker_table_paths = {}
+_worker_tables = {}
+
+
+def publish_arrays(arrays: dict):
+    """
+    Copy arrays into shared memory once, so that worker processes can read them without pickling.
+
+    :param arrays: dict of key (e.g. version tag) -> dict of array name -> numpy array.
+    :return: manifest to pass to workers, and the shared memory blocks, which should be released with release_arrays when done.
+    """
+    manifest = {}
+    blocks = []
+    for key in arrays:
+        manifest[key] = {}
+        for name, array in arrays[key].items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            blocks.append(block)
+            manifest[key][name] = (block.name, array.shape, array.dtype.str)
+    return manifest, blocks
+
+
+def release_arrays(blocks: list):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def attach_arrays(manifest: dict):
+    """
+    Get read only views of arrays published with publish_arrays.
+
+    :return: dict of key -> dict of array name -> numpy array, and the attached blocks, which must be kept alive while the arrays are used.
+    """
+    arrays = {}
+    blocks = []
+    for key in manifest:
+        arrays[key] = {}
+        for name, (block_name, shape, dtype) in manifest[key].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            arrays[key][name] = array
+            blocks.append(block)
+    return arrays, blocks
+
+
+def publish_tables(taxa_versions: dict, columns: list, directory: str) -> dict:
+    """
+    Write the given columns of each version once as uncompressed Arrow (feather) files, which workers memory-map rather than
+    receiving pickled dataframes.
+
+    :return: dict of version tag -> file path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    table_paths = {}
+    for tag, taxa in taxa_versions.items():
+        path = os.path.join(directory, f'{tag}.arrow')
+        taxa[[c for c in columns if c in taxa.columns]].reset_index(drop=True).to_feather(path, compression='uncompressed')
+        table_paths[tag] = path
+    return table_paths
+
+
+def _init_worker(manifest: dict, table_paths: dict):
+    global _worker_arrays, _worker_blocks, _worker_table_paths
+    if manifest is not None:
+        _worker_arrays, _worker_blocks = attach_arrays(manifest)
+    if table_paths is not None:
+        _worker_table_paths = table_paths
+
+
+def get_worker_arrays() -> dict:
+    return _worker_arrays
+
+
+def get_worker_table(tag: str) -> pd.DataFrame:
+    # Each worker maps a version table at most once. Columns stay backed by the memory-mapped Arrow buffers rather than being copied
+    if tag not in _worker_tables:
+        import pyarrow.feather
+        _worker_tables[tag] = pyarrow.feather.read_table(_worker_table_paths[tag], memory_map=True).to_pandas(types_mapper=pd.ArrowDtype)
+    return _worker_tables[tag]
+
+
+def run_pairs(task, pairs: list, n_workers: int = None, manifest: dict = None, table_paths: dict = None):
+    """
+    Run task(pair) for each pair of version tags on a pool of worker processes.
+    Workers can access published arrays with get_worker_arrays and published tables with get_worker_table.
+
+    :param task: module level function taking an (old_tag, new_tag) pair.
+    :param n_workers: number of worker processes, defaults to the number of cpus.
+    :return: dict of pair -> result and dict of pair -> formatted traceback for pairs that failed.
+    """
+    results = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(manifest, table_paths)) as executor:
+        futures = {executor.submit(task, pair): pair for pair in pairs}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                results[pair] = future.result()
+            except Exception:
+                errors[pair] = traceback.format_exc()
+    return results, errors
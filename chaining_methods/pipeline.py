@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+from chaining_methods.version_cache import get_file_hash
+
+
+class Stage:
+    """
+    A step of a pipeline, e.g. parsing versions or comparing pairs of versions. Stages write their outputs to disk,
+    where the stages that depend on them read them.
+    """
+
+    def __init__(self, name: str, run, depends_on: list = None, params: dict = None, source: list = None, input_files=None, units=None,
+                 setup=None):
+        """
+        :param run: function running the stage, with no arguments, or run(unit, context) for each unit if units is given.
+        :param depends_on: names of stages that must be run first.
+        :param params: parameters of the stage, which are part of its key.
+        :param source: functions or modules whose source code the outputs depend on, as well as run.
+        :param input_files: function returning the paths of files the stage reads that no stage writes, e.g. raw releases.
+            Their contents are part of the key.
+        :param units: function returning ids of independent parts of the stage, e.g. pairs of versions. Each unit is recorded
+            when it completes, so an interrupted stage resumes at the first incomplete unit.
+        :param setup: function returning the context passed to run for each unit, only called if some units are incomplete.
+        """
+        self.name = name
+        self.run = run
+        self.depends_on = [] if depends_on is None else list(depends_on)
+        self.params = {} if params is None else params
+        self.source = [run] + ([] if source is None else list(source))
+        self.input_files = input_files
+        self.units = units
+        self.setup = setup
+
+
+class Pipeline:
+    """
+    Stages as a dependency graph. Each stage has a key hashing its parameters, source code, input files and the keys of the stages it
+    depends on, which is stored with its state when it completes. Stages whose key hasn't changed since they completed are skipped.
+    """
+
+    def __init__(self, stages: list, state_dir: str):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for upstream in stage.depends_on:
+                if upstream not in self.stages:
+                    raise ValueError(f'{stage.name} depends on unknown stage {upstream}')
+        self.state_dir = state_dir
+        self._keys = {}
+
+    def get_key(self, name: str) -> str:
+        if name not in self._keys:
+            stage = self.stages[name]
+            key = hashlib.sha256(name.encode())
+            key.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+            for source in stage.source:
+                key.update(inspect.getsource(source).encode())
+            if stage.input_files is not None:
+                for input_file in stage.input_files():
+                    # Hashes of input files are stored with the pipeline state, and only recomputed when the files change
+                    key.update(get_file_hash(input_file, os.path.join(self.state_dir, 'file_hashes')).encode()
+                               if os.path.isfile(input_file) else b'missing')
+            for upstream in stage.depends_on:
+                key.update(self.get_key(upstream).encode())
+            self._keys[name] = key.hexdigest()[:16]
+        return self._keys[name]
+
+    def _state_file(self, name: str) -> str:
+        return os.path.join(self.state_dir, f'{name}.json')
+
+    def _read_state(self, name: str) -> dict:
+        # State of the stage for its current key, empty if it hasn't been run with this key
+        if os.path.isfile(self._state_file(name)):
+            with open(self._state_file(name)) as f:
+                state = json.load(f)
+            if state['key'] == self.get_key(name):
+                return state
+        return {'key': self.get_key(name), 'complete': False, 'units': []}
+
+    def _write_state(self, name: str, state: dict):
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self._state_file(name) + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self._state_file(name) + '.tmp', self._state_file(name))
+
+    def get_order(self, targets: list = None) -> list:
+        # Targets and the stages they depend on, with each stage after the stages it depends on
+        if targets is None:
+            targets = list(self.stages)
+        order = []
+
+        def visit(name, path):
+            if name in path:
+                raise ValueError(f'Cycle in pipeline: {" -> ".join(path + [name])}')
+            if name not in order:
+                for upstream in self.stages[name].depends_on:
+                    visit(upstream, path + [name])
+                order.append(name)
+
+        for target in targets:
+            if target not in self.stages:
+                raise ValueError(f'Unknown stage {target}')
+            visit(target, [])
+        return order
+
+    def get_status(self) -> pd.DataFrame:
+        rows = []
+        for name in self.get_order():
+            state = self._read_state(name)
+            units = self.stages[name].units
+            rows.append([name, state['key'], state['complete'], len(state['units']) if units is not None else None])
+        return pd.DataFrame(rows, columns=['stage', 'key', 'complete', 'completed_units']).set_index('stage')
+
+    def run_stage(self, name: str, force: bool = False):
+        stage = self.stages[name]
+        state = self._read_state(name)
+        if force:
+            state = {'key': self.get_key(name), 'complete': False, 'units': []}
+        if state['complete']:
+            print(f'{name} is up to date')
+            return
+        if stage.units is None:
+            print(f'Running {name}')
+            stage.run()
+        else:
+            pending = [unit for unit in stage.units() if unit not in state['units']]
+            print(f'Running {name}: {len(pending)} of {len(pending) + len(state["units"])} units to do')
+            context = stage.setup() if stage.setup is not None and len(pending) > 0 else None
+            for unit in pending:
+                stage.run(unit, context)
+                state['units'].append(unit)
+                self._write_state(name, state)
+        state['complete'] = True
+        self._write_state(name, state)
+
+    def run(self, targets: list = None, force: list = None, only: bool = False):
+        """
+        Bring the targets up to date, running the stages they depend on first where those are out of date.
+
+        :param targets: stage names, defaults to all stages.
+        :param force: names of stages to rerun even if they are up to date.
+        :param only: only run the targets, without checking the stages they depend on.
+        """
+        if force is None:
+            force = []
+        for name in (self.get_order(targets) if not only else targets):
+            self.run_stage(name, force=name in force)
+
+
+def pipeline_main(pipeline: Pipeline, description: str, argv: list = None):
+    # Command line for a pipeline: 'status' lists the stages, 'run' runs the given stages (and the stages they depend on)
+    parser = argparse.ArgumentParser(description=description)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show the stages and whether they are up to date')
+    run_parser = subparsers.add_parser('run', help='Run stages that are out of date')
+    run_parser.add_argument('stages', nargs='*', help=f'Any of {", ".join(pipeline.stages)}. Defaults to all stages')
+    run_parser.add_argument('--force', action='store_true',
+                            help='Rerun the given stages even if they are up to date, or all stages if none are given')
+    run_parser.add_argument('--only', action='store_true', help='Only run the given stages, not the stages they depend on')
+
+    args = parser.parse_args(argv)
+    if args.command == 'status':
+        with pd.option_context('display.max_rows', None):
+            print(pipeline.get_status())
+    else:
+        if args.only and len(args.stages) == 0:
+            run_parser.error('--only needs the stages to run')
+        targets = args.stages if len(args.stages) > 0 else None
+        force = None
+        if args.force:
+            force = args.stages if len(args.stages) > 0 else list(pipeline.stages)
+        pipeline.run(targets, force=force, only=args.only)
@@ -0,0 +1,183 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import UNRESOLVED, AMBIGUOUS, ABSENT, _PADDING, _empty_resolution, get_chained_records, \
+    get_start_names, write_old_records_summary
+from chaining_methods.name_codes import decode_names, get_name_codes
+from chaining_methods.resolution_map import get_resolution_maps
+
+
+def get_resolution_csr(taxa_map) -> tuple:
+    """
+    Resolutions of a version in CSR form. The edges of the name with code i are indptr[i]:indptr[i + 1] of accepted and species,
+    one for each distinct (accepted name, accepted species) pair of its records. Records without an accepted name are edges to UNRESOLVED.
+
+    :param taxa_map: ResolutionMap of the version.
+    """
+    size = len(taxa_map.name_dictionary)
+    names = taxa_map.taxon_name_codes
+    accepted = get_name_codes(taxa_map.taxa, 'accepted_name_w_author', taxa_map.name_dictionary)
+    species = get_name_codes(taxa_map.taxa, 'accepted_species', taxa_map.name_dictionary)
+    keep = names >= 0
+    names, accepted, species = names[keep], accepted[keep], species[keep]
+
+    # Sort edges by name, then accepted name and species, and drop duplicate edges
+    order = np.lexsort((species, accepted, names))
+    names, accepted, species = names[order], accepted[order], species[order]
+    distinct = np.ones(len(names), dtype=bool)
+    distinct[1:] = (names[1:] != names[:-1]) | (accepted[1:] != accepted[:-1]) | (species[1:] != species[:-1])
+    names, accepted, species = names[distinct], accepted[distinct], species[distinct]
+
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(names, minlength=size))
+    return indptr, accepted, species
+
+
+def get_csr_resolutions(indptr: np.ndarray, accepted: np.ndarray, species: np.ndarray) -> dict:
+    """
+    Resolution arrays of a version from its CSR edges, the same as get_direct_resolution and get_chaining_resolution.
+    """
+    size = len(indptr) - 1
+    degree = np.diff(indptr)
+    rows = np.repeat(np.arange(size), degree)
+
+    # When chaining, a name resolves if it has a single edge
+    chaining_accepted = _empty_resolution(size)
+    chaining_species = _empty_resolution(size)
+    single = np.flatnonzero(degree == 1)
+    chaining_accepted[single] = accepted[indptr[single]]
+    chaining_species[single] = species[indptr[single]]
+    multiple = np.flatnonzero(degree > 1)
+    chaining_accepted[multiple] = AMBIGUOUS
+    chaining_species[multiple] = AMBIGUOUS
+
+    # Direct resolutions only use edges to accepted names
+    resolving = accepted >= 0
+    resolving_rows = rows[resolving]
+    resolving_accepted = accepted[resolving]
+    resolving_species = species[resolving]
+    resolving_edges = np.bincount(resolving_rows, minlength=size)
+    first = np.ones(len(resolving_rows), dtype=bool)
+    first[1:] = resolving_rows[1:] != resolving_rows[:-1]
+    # Edges are sorted by accepted name within each name
+    new_accepted = first.copy()
+    new_accepted[1:] |= resolving_accepted[1:] != resolving_accepted[:-1]
+    distinct_accepted = np.bincount(resolving_rows[new_accepted], minlength=size)
+
+    direct_accepted = _empty_resolution(size)
+    direct_species = _empty_resolution(size)
+    first_rows = resolving_rows[first]
+    direct_accepted[first_rows] = np.where(distinct_accepted[first_rows] == 1, resolving_accepted[first], AMBIGUOUS)
+    direct_species[first_rows] = np.where(resolving_edges[first_rows] == 1, resolving_species[first], AMBIGUOUS)
+    unresolved = np.flatnonzero((degree > 0) & (resolving_edges == 0))
+    direct_accepted[unresolved] = UNRESOLVED
+    direct_species[unresolved] = UNRESOLVED
+    return {'direct_accepted': direct_accepted, 'direct_species': direct_species,
+            'chaining_accepted': chaining_accepted, 'chaining_species': chaining_species}
+
+
+class ResolutionGraph:
+    """
+    Name resolution across a sequence of versions as a graph whose nodes are (version, name). The edges of a node are the name's
+    resolutions in that version (stored as CSR arrays for each version), which carry over to the accepted name's node in the next version.
+
+    The final accepted name of every node is found in one traversal from the last version back to the first, keeping the final name at
+    each node so that every path is only followed once. Chains from any start version then cost one lookup per name.
+    """
+
+    def __init__(self, tags: list, taxa_versions: dict, name_dictionary: pd.Index = None):
+        """
+        :param tags: version tags in chain order. A version may appear more than once.
+        :param taxa_versions: dict of tag -> taxa dataframe or ResolutionMap.
+        """
+        self.tags = list(tags)
+        unique_tags = list(dict.fromkeys(self.tags))
+        taxa_maps = get_resolution_maps([taxa_versions[tag] for tag in unique_tags], name_dictionary)
+        self.maps = dict(zip(unique_tags, taxa_maps))
+        self.name_dictionary = taxa_maps[0].name_dictionary
+        self.csr = {tag: get_resolution_csr(self.maps[tag]) for tag in unique_tags}
+        self.resolutions = {tag: get_csr_resolutions(*self.csr[tag]) for tag in unique_tags}
+        self._final = None
+
+    def get_final_resolution(self) -> list:
+        """
+        For each position in the chain after the first, the name that a name entering that version is carried into the last version as,
+        and its final accepted name and species, indexed by name code.
+        Names that don't resolve in an intermediate version are dropped from the chain, as in compose_chain.
+        """
+        if self._final is None:
+            size = len(self.name_dictionary)
+            last = self.resolutions[self.tags[-1]]
+            entering_last = np.append(np.arange(size, dtype=np.int32), np.full(_PADDING, ABSENT, dtype=np.int32))
+            final = [None] * len(self.tags)
+            final[-1] = (entering_last, last['chaining_accepted'], last['chaining_species'])
+            for position in range(len(self.tags) - 2, 0, -1):
+                accepted = self.resolutions[self.tags[position]]['chaining_accepted']
+                accepted = np.where(accepted == UNRESOLVED, ABSENT, accepted)
+                final[position] = tuple(a.take(accepted) for a in final[position + 1])
+            self._final = final
+        return self._final
+
+    def chain_from(self, start_tag: str):
+        """
+        Chain the names which resolve uniquely in start_tag to the last version, starting from the first position of start_tag in the chain.
+
+        :return: start name codes, and the codes of their accepted names in the penultimate version and their final accepted names and species,
+            as returned by compose_chain.
+        """
+        position = self.tags.index(start_tag)
+        if position == len(self.tags) - 1:
+            raise ValueError(f'{start_tag} is the last version of the chain')
+        start_map = self.maps[start_tag]
+        start_accepted = self.resolutions[start_tag]['direct_accepted']
+        taxon_name_codes = get_start_names(start_map.taxa, start_accepted, self.name_dictionary)
+        previous_accepted, chained_accepted, chained_species = [a.take(start_accepted.take(taxon_name_codes))
+                                                                for a in self.get_final_resolution()[position + 1]]
+        return taxon_name_codes, previous_accepted, chained_accepted, chained_species
+
+    def get_chained_records(self, start_tag: str, out_dir: str = None, chain_tag: str = None) -> pd.DataFrame:
+        """
+        The same output as chain_versions from start_tag through the rest of the chain.
+        """
+        if chain_tag is None:
+            chain_tag = start_tag
+        taxon_name_codes, previous_accepted, chained_accepted, chained_species = self.chain_from(start_tag)
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+            write_old_records_summary(taxon_name_codes, self.resolutions[start_tag]['direct_accepted'], self.name_dictionary, start_tag,
+                                      out_dir)
+        return get_chained_records(taxon_name_codes, previous_accepted, chained_accepted, chained_species, self.name_dictionary,
+                                   chain_tag, self.tags[-1])
+
+    def find_cycles(self) -> pd.DataFrame:
+        """
+        Names which resolve to a different name and are later resolved back to themselves, e.g. A -> B in one version and B -> A in a later one.
+
+        :return: dataframe with the version each name leaves in, the version it returns in and the path of names in between.
+        """
+        cycles = []
+        for start in range(len(self.tags) - 1):
+            indptr, _, _ = self.csr[self.tags[start]]
+            names = np.flatnonzero(np.diff(indptr) > 0).astype(np.int32)
+            current = self.resolutions[self.tags[start]]['chaining_accepted'].take(names)
+            moved = (current >= 0) & (current != names)
+            names, current = names[moved], current[moved]
+            for position in range(start + 1, len(self.tags)):
+                current = self.resolutions[self.tags[position]]['chaining_accepted'].take(current)
+                returned = current == names
+                for name in names[returned]:
+                    cycles.append([self.tags[start], name, self.tags[position], self._get_path(name, start, position)])
+                # Stop following names once they return or stop resolving
+                following = (current >= 0) & ~returned
+                names, current = names[following], current[following]
+        cycles = pd.DataFrame(cycles, columns=['version', 'taxon_name_code', 'returns_in_version', 'path'])
+        cycles.insert(1, 'taxon_name_w_authors', decode_names(cycles['taxon_name_code'].to_numpy(dtype=np.int32), self.name_dictionary))
+        return cycles.drop(columns=['taxon_name_code'])
+
+    def _get_path(self, name: int, start: int, end: int) -> str:
+        path = [name]
+        for position in range(start, end + 1):
+            path.append(self.resolutions[self.tags[position]]['chaining_accepted'][path[-1]])
+        return ' -> '.join(decode_names(path, self.name_dictionary))
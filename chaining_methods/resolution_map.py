@@ -0,0 +1,186 @@
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import AMBIGUOUS, get_chaining_resolution, get_direct_resolution, get_start_names
+from chaining_methods.name_cleaning import get_genera_from_full_names
+from chaining_methods.name_codes import MISSING_CODE, build_name_dictionary, decode_names, get_name_codes
+
+rank_column = 'taxon_rank'
+status_column = 'taxon_status'
+
+
+class ResolutionMap:
+    """
+    Everything derived from a version that is used to chain and compare it, computed on first use and then kept,
+    so a version that is used in several pairs is only deduplicated once.
+    Chaining functions and the helper analyses accept a ResolutionMap wherever they take a taxa dataframe.
+    """
+
+    def __init__(self, taxa: pd.DataFrame, name_dictionary: pd.Index = None, tag: str = None):
+        """
+        :param name_dictionary: shared by all versions that are compared, see build_name_dictionary.
+            Defaults to a dictionary of this version's names, which is only enough for the helper analyses.
+        """
+        self.taxa = taxa
+        self.tag = tag
+        self._name_dictionary = name_dictionary
+        self._record_masks = {}
+        self._unique_values = {}
+        self._value_codes = {}
+
+    @property
+    def name_dictionary(self) -> pd.Index:
+        if self._name_dictionary is None:
+            self._name_dictionary = build_name_dictionary([self.taxa])
+        return self._name_dictionary
+
+    @cached_property
+    def taxon_name_codes(self) -> np.ndarray:
+        return get_name_codes(self.taxa, 'taxon_name_w_authors', self.name_dictionary)
+
+    @cached_property
+    def direct_resolution(self):
+        # (accepted, species) arrays from get_direct_resolution
+        return get_direct_resolution(self.taxa, self.name_dictionary)
+
+    @cached_property
+    def chaining_resolution(self):
+        # (accepted, species) arrays from get_chaining_resolution
+        return get_chaining_resolution(self.taxa, self.name_dictionary)
+
+    @cached_property
+    def start_names(self) -> np.ndarray:
+        # Names which resolve to a single accepted name, in the order they first appear
+        return get_start_names(self.taxa, self.direct_resolution[0], self.name_dictionary)
+
+    @cached_property
+    def ambiguous_names(self) -> np.ndarray:
+        # Names with more than one accepted name
+        return np.flatnonzero(self.direct_resolution[0][:len(self.name_dictionary)] == AMBIGUOUS)
+
+    @cached_property
+    def unique_names(self) -> np.ndarray:
+        taxon_name_codes = pd.unique(self.taxon_name_codes)
+        return taxon_name_codes[taxon_name_codes != MISSING_CODE]
+
+    @cached_property
+    def direct_records(self):
+        """
+        Names with a single (accepted name, accepted species) pair, in the order they first appear with an accepted name,
+        and the position of that record, as kept by get_direct_name_updates.
+        """
+        accepted, species = self.direct_resolution
+        positions = np.flatnonzero((self.taxon_name_codes != MISSING_CODE) &
+                                   (get_name_codes(self.taxa, 'accepted_name_w_author', self.name_dictionary) != MISSING_CODE))
+        _, first = np.unique(self.taxon_name_codes[positions], return_index=True)
+        positions = positions[np.sort(first)]
+        names = self.taxon_name_codes[positions]
+        keep = (accepted.take(names) >= 0) & (species.take(names) != AMBIGUOUS)
+        return names[keep], positions[keep]
+
+    @cached_property
+    def accepted_genera(self):
+        """
+        Genus of each accepted name in the version as a genus id indexed by name code, and the genus of each id.
+        """
+        accepted_codes = get_name_codes(self.taxa, 'accepted_name_w_author', self.name_dictionary)
+        accepted_codes = np.unique(accepted_codes[accepted_codes >= 0])
+        genus_ids, genera = pd.factorize(get_genera_from_full_names(pd.Series(decode_names(accepted_codes, self.name_dictionary))))
+        genus_codes = np.full(len(self.name_dictionary), MISSING_CODE, dtype=np.int32)
+        genus_codes[accepted_codes] = genus_ids
+        return genus_codes, genera
+
+    def get_accepted_genera(self, accepted_codes: np.ndarray) -> np.ndarray:
+        genus_codes, genera = self.accepted_genera
+        genus_ids = np.where(accepted_codes >= 0, genus_codes.take(np.maximum(accepted_codes, 0)), MISSING_CODE)
+        return np.append(genera.to_numpy(dtype=object), np.nan).take(genus_ids)
+
+    @cached_property
+    def status_codes(self):
+        # Codes and categories of the status of each record
+        return pd.factorize(self.taxa[status_column])
+
+    @cached_property
+    def rank_codes(self):
+        # Codes and categories of the rank of each record
+        return pd.factorize(self.taxa[rank_column])
+
+    @cached_property
+    def name_ranks(self):
+        """
+        Rank code of each name, from its first record, indexed by name code, and the ranks of the codes as in rank_codes.
+        Names without a rank or not in the version are MISSING_CODE.
+        """
+        codes, ranks = self.rank_codes
+        name_ranks = np.full(len(self.name_dictionary), MISSING_CODE, dtype=np.int32)
+        positions = np.flatnonzero(self.taxon_name_codes != MISSING_CODE)
+        names, first = np.unique(self.taxon_name_codes[positions], return_index=True)
+        name_ranks[names] = codes[positions[first]]
+        return name_ranks, ranks
+
+    def get_record_mask(self, rank: str = None, exclude_statuses: list = None, notna_column: str = None) -> np.ndarray:
+        """
+        Records of the given rank, without the excluded statuses and with a value in notna_column. Masks are kept for reuse.
+        """
+        key = (rank, None if exclude_statuses is None else tuple(exclude_statuses), notna_column)
+        if key not in self._record_masks:
+            mask = np.ones(len(self.taxa), dtype=bool)
+            if rank is not None:
+                codes, categories = self.rank_codes
+                mask &= np.isin(codes, np.flatnonzero(categories == rank))
+            if exclude_statuses is not None:
+                codes, categories = self.status_codes
+                mask &= ~np.isin(codes, np.flatnonzero(categories.isin(exclude_statuses)))
+            if notna_column is not None:
+                mask &= self.taxa[notna_column].notna().to_numpy()
+            self._record_masks[key] = mask
+        return self._record_masks[key]
+
+    def get_unique_values(self, column: str, rank: str = None, exclude_statuses: list = None, notna_column: str = None,
+                          dropna: bool = True) -> np.ndarray:
+        """
+        Unique values of a column, for the records selected as in get_record_mask. Values are kept for reuse.
+        """
+        key = (column, rank, None if exclude_statuses is None else tuple(exclude_statuses), notna_column, dropna)
+        if key not in self._unique_values:
+            values = self.taxa[column]
+            if rank is not None or exclude_statuses is not None or notna_column is not None:
+                values = values[self.get_record_mask(rank, exclude_statuses, notna_column)]
+            if dropna:
+                values = values.dropna()
+            self._unique_values[key] = values.unique()
+        return self._unique_values[key]
+
+    def get_value_codes(self, columns: list):
+        """
+        Codes of the values of the given columns in one set of values, where missing values have the code len(values).
+        Codes are kept for reuse, and the values are an index so looking up other versions' values reuses its hash table.
+
+        :return: (columns x records array of codes, index of the values of the codes).
+        """
+        key = tuple(columns)
+        if key not in self._value_codes:
+            codes, values = pd.factorize(np.concatenate([self.taxa[column].to_numpy(dtype=object) for column in columns]))
+            codes[codes < 0] = len(values)
+            self._value_codes[key] = codes.reshape(len(columns), len(self.taxa)), pd.Index(values)
+        return self._value_codes[key]
+
+
+def get_resolution_maps(taxa_versions: list, name_dictionary: pd.Index = None) -> list:
+    """
+    Resolution maps sharing one name dictionary for the given versions, which may be taxa dataframes or resolution maps.
+    """
+    maps = [t for t in taxa_versions if isinstance(t, ResolutionMap)]
+    if name_dictionary is None:
+        if len(maps) == 0:
+            name_dictionary = build_name_dictionary(taxa_versions)
+        elif len(maps) == len(taxa_versions):
+            name_dictionary = maps[0].name_dictionary
+        else:
+            raise ValueError('A name dictionary is needed to use resolution maps with taxa dataframes')
+    for m in maps:
+        if m.name_dictionary is not name_dictionary:
+            raise ValueError('Resolution maps must share the same name dictionary')
+    return [t if isinstance(t, ResolutionMap) else ResolutionMap(t, name_dictionary) for t in taxa_versions]
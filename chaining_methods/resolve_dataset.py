@@ -0,0 +1,126 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.all_pairs import get_disagreements
+from chaining_methods.name_codes import decode_names
+from chaining_methods.transitivity_index import TransitivityIndex, get_statuses
+
+# Record counts reported for a resolved dataset
+dataset_summary_index = ['records', 'names', 'records_without_a_direct_resolution', 'records_without_a_chained_resolution',
+                         'total_disagreements', 'species_disagreements', 'genus_disagreements',
+                         'unresolved_via_chaining_despite_a_direct_resolution']
+
+
+def resolve_names(names: np.ndarray, index: TransitivityIndex, path: list) -> pd.DataFrame:
+    """
+    Direct resolutions of unique names in the last version of the path and chained resolutions along the path,
+    with disagreements flagged as in compare_and_output_chained_and_direct_updates.
+    """
+    new_tag = path[-1]
+    codes = index.encode(names)
+    direct_accepted, direct_species = [a.take(codes) for a in index.get_path_resolution((new_tag,))]
+    chained_accepted, chained_species = [a.take(codes) for a in index.get_path_resolution(tuple(path))]
+    disagreements = get_disagreements(chained_accepted, chained_species, direct_accepted, direct_species, index.genus_codes)
+    return pd.DataFrame({'taxon_name_w_authors': names,
+                         new_tag + '_direct_accepted_name_w_author': decode_names(direct_accepted, index.name_dictionary),
+                         new_tag + '_direct_accepted_species': decode_names(direct_species, index.name_dictionary),
+                         'direct_status': get_statuses(direct_accepted),
+                         new_tag + '_chained_accepted_name_w_author': decode_names(chained_accepted, index.name_dictionary),
+                         new_tag + '_chained_accepted_species': decode_names(chained_species, index.name_dictionary),
+                         'chained_status': get_statuses(chained_accepted),
+                         'unresolved_via_chaining': disagreements['unresolved_via_chaining'],
+                         'disagreement': disagreements['disagreements'],
+                         'species_disagreement': disagreements['species_disagreements'],
+                         'genus_disagreement': disagreements['genus_disagreements']})
+
+
+def resolve_dataset(input_csv: str, output_csv: str, index: TransitivityIndex, name_column: str = 'taxon_name_w_authors',
+                    path: list = None, chunk_size: int = 1000000) -> pd.Series:
+    """
+    Resolve the names in a (large) csv of records, e.g. specimens, reading it in chunks.
+    Each distinct name is resolved once, and written to output_csv the first time it is seen, so memory doesn't grow with the
+    number of records.
+
+    :param name_column: column of names with authors in the input.
+    :param path: version tags to chain through, defaults to all versions in the index. Direct resolutions are in the last version.
+    :return: counts of records (see dataset_summary_index), also written to output_csv with a _summary suffix.
+    """
+    if path is None:
+        path = index.tags
+    counts = pd.Series(0, index=dataset_summary_index)
+    # Names already written. Names in the index are tracked by code, other names by value
+    seen = np.zeros(len(index.name_dictionary), dtype=bool)
+    seen_unknown_names = set()
+    write_header = True
+    for chunk in pd.read_csv(input_csv, usecols=[name_column], dtype={name_column: str}, chunksize=chunk_size):
+        name_ids, names = pd.factorize(chunk[name_column])
+        names = names.to_numpy(dtype=object)
+        records_per_name = np.bincount(name_ids[name_ids >= 0], minlength=len(names))
+        resolved = resolve_names(names, index, path)
+
+        counts['records'] += len(chunk)
+        counts['records_without_a_direct_resolution'] += records_per_name[resolved['direct_status'].to_numpy() != 'resolved'].sum()
+        counts['records_without_a_chained_resolution'] += records_per_name[resolved['chained_status'].to_numpy() != 'resolved'].sum()
+        for count, flag in zip(dataset_summary_index[4:], ['disagreement', 'species_disagreement', 'genus_disagreement',
+                                                           'unresolved_via_chaining']):
+            counts[count] += records_per_name[resolved[flag].to_numpy()].sum()
+
+        codes = index.encode(names)
+        in_index = codes >= 0
+        new_names = np.zeros(len(names), dtype=bool)
+        new_names[in_index] = ~seen[codes[in_index]]
+        seen[codes[in_index]] = True
+        unknown_names = np.flatnonzero(~in_index)
+        new_names[unknown_names] = [n not in seen_unknown_names for n in names[unknown_names]]
+        seen_unknown_names.update(names[unknown_names])
+
+        counts['names'] += new_names.sum()
+        resolved[new_names].to_csv(output_csv, mode='w' if write_header else 'a', header=write_header, index=False)
+        write_header = False
+        print(f'Resolved {counts["records"]} records')
+
+    counts.to_frame(name='_'.join(path)).to_csv(os.path.splitext(output_csv)[0] + '_summary.csv')
+    return counts
+
+
+def build_index(taxonomy: str, index_dir: str = None) -> str:
+    # Taxonomy modules are only imported when building, as they load all versions
+    if taxonomy == 'wcvp':
+        from WCVP_versions.updating_wcvp import build_transitivity_index
+    elif taxonomy == 'wfo':
+        from WFO_versions.updating_wfo import build_transitivity_index
+    else:
+        raise ValueError(f'Unknown taxonomy: {taxonomy}')
+    return build_transitivity_index(index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve the names in a csv of records directly and via chaining.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build and save the index of all versions of a taxonomy')
+    build_parser.add_argument('taxonomy', choices=['wcvp', 'wfo'])
+    build_parser.add_argument('--index', help='Directory to save the index in, defaults to the taxonomy outputs')
+
+    resolve_parser = subparsers.add_parser('resolve', help='Resolve names in a csv with a saved index')
+    resolve_parser.add_argument('input_csv')
+    resolve_parser.add_argument('output_csv')
+    resolve_parser.add_argument('--index', required=True, help='Directory of a saved index')
+    resolve_parser.add_argument('--name-column', default='taxon_name_w_authors')
+    resolve_parser.add_argument('--path', nargs='+', help='Version tags to chain through, defaults to all versions in the index')
+    resolve_parser.add_argument('--chunk-size', type=int, default=1000000)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        print(f'Index saved to {build_index(args.taxonomy, args.index)}')
+    else:
+        index = TransitivityIndex.load(args.index)
+        print(resolve_dataset(args.input_csv, args.output_csv, index, name_column=args.name_column, path=args.path,
+                              chunk_size=args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import pandas as pd
+
+# Name of the parquet dataset of pair results, within an outputs directory
+pair_dataset_name = 'pair_results'
+# Each table in the dataset is partitioned into directories by these keys
+partition_columns = ['taxonomy', 'old', 'new']
+
+# Detail tables of a pair comparison and the csv files they are written to, where tag is the pair tag
+pair_result_files = {'unresolved_via_chaining': '{tag}_unresolved_via_chaining.csv',
+                     'resolved': '{tag}.csv',
+                     'all_results': 'all_results.csv',
+                     'species_results': 'species_results.csv',
+                     'genus_results': 'genus_results.csv'}
+
+
+def _get_partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    # Partition values are always strings, e.g. WFO tags like 202412 shouldn't be read as ints
+    return ds.partitioning(pa.schema([(c, pa.string()) for c in partition_columns]), flavor='hive')
+
+
+def write_pair_table(table: pd.DataFrame, dataset_path: str, table_name: str, taxonomy: str, old_tag: str, new_tag: str):
+    """
+    Write a table for a pair to dataset_path/table_name/taxonomy=../old=../new=../part-0.parquet, replacing any previous table for the pair.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    partition_dir = os.path.join(dataset_path, table_name, f'taxonomy={taxonomy}', f'old={old_tag}', f'new={new_tag}')
+    if os.path.isdir(partition_dir):
+        shutil.rmtree(partition_dir)
+    os.makedirs(partition_dir)
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    # Columns which are all nan have no type, store them as strings so that partitions have the same schema
+    arrow_table = arrow_table.cast(pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in arrow_table.schema],
+                                             metadata=arrow_table.schema.metadata))
+    pq.write_table(arrow_table, os.path.join(partition_dir, 'part-0.parquet'), compression='zstd')
+
+
+def read_pair_tables(dataset_path: str, table_name: str, columns: list = None, taxonomy: str = None, old_tag: str = None,
+                     new_tag: str = None, filters: list = None) -> pd.DataFrame:
+    """
+    Read a table for all pairs matching the given partition values, e.g. species_results for v10 -> any newer version with
+    read_pair_tables(path, 'species_results', taxonomy='wcvp', old_tag='v10').
+    Only the matching partitions and requested columns are read.
+
+    :param columns: columns to read, defaults to all columns including taxonomy, old and new.
+    :param filters: further (column, op, value) filters on the rows, as in pyarrow, e.g. [('v14_direct_accepted_genus', '==', 'Acacia')].
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    table_path = os.path.join(dataset_path, table_name)
+    if not os.path.isdir(table_path):
+        raise FileNotFoundError(f'No {table_name} table in {dataset_path}')
+    dataset = ds.dataset(table_path, format='parquet', partitioning=_get_partitioning())
+
+    conditions = [(c, '==', v) for c, v in zip(partition_columns, [taxonomy, old_tag, new_tag]) if v is not None]
+    if filters is not None:
+        conditions += filters
+    expression = None
+    for c, op, v in conditions:
+        condition = {'==': ds.field(c) == v, '!=': ds.field(c) != v, '<': ds.field(c) < v, '<=': ds.field(c) <= v,
+                     '>': ds.field(c) > v, '>=': ds.field(c) >= v, 'in': ds.field(c).isin(v)}[op]
+        expression = condition if expression is None else expression & condition
+
+    # Column names include the version tags of each pair, so read with the union of the matching pairs' columns
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments(filter=expression)]
+    if len(schemas) > 0:
+        dataset = ds.dataset(table_path, format='parquet', partitioning=_get_partitioning(),
+                             schema=pa.unify_schemas(schemas + [pa.schema([(c, pa.string()) for c in partition_columns])]))
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def load_pair_table(output_path: str, table_name: str, old_tag: str, new_tag: str, taxonomy: str = None,
+                    columns: list = None) -> pd.DataFrame:
+    """
+    A table for one pair, from the parquet dataset in output_path if it has been written, otherwise from the csv in the pair's directory.
+    """
+    dataset_path = os.path.join(output_path, pair_dataset_name)
+    if os.path.isdir(os.path.join(dataset_path, table_name)):
+        table = read_pair_tables(dataset_path, table_name, columns=columns, taxonomy=taxonomy, old_tag=old_tag, new_tag=new_tag)
+        if columns is None:
+            table = table.drop(columns=partition_columns)
+        return table
+    file_name = pair_result_files[table_name].format(tag=f'{old_tag}_{new_tag}')
+    table = pd.read_csv(os.path.join(output_path, f'{old_tag}_{new_tag}', file_name), index_col=0)
+    if columns is not None:
+        table = table[columns]
+    return table
@@ -0,0 +1,175 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from chaining_methods.name_codes import MISSING_CODE, decode_names
+from chaining_methods.resolution_graph import get_resolution_csr
+from chaining_methods.resolution_map import get_resolution_maps
+from chaining_methods.updating_taxonomies import get_result_summary
+
+
+def get_resolution_matrix(taxa_map, column: str = 'accepted_name_w_author', include_missing: bool = False) -> sparse.csr_matrix:
+    """
+    A version as a sparse name x name matrix with a 1 for every distinct (name, accepted name) pair of its records,
+    or (name, accepted species) pair if column is 'accepted_species'. Names with more than one resolution keep all of them.
+
+    :param taxa_map: ResolutionMap of the version.
+    :param include_missing: add an extra last column for records without an accepted name,
+        or for records with an accepted name but no accepted species.
+    """
+    size = len(taxa_map.name_dictionary)
+    indptr, accepted, species = get_resolution_csr(taxa_map)
+    names = np.repeat(np.arange(size), np.diff(indptr))
+    targets = species if column == 'accepted_species' else accepted
+    resolving = accepted >= 0
+    keep = resolving & (targets >= 0)
+    rows, cols = names[keep], targets[keep]
+    if include_missing:
+        missing = (targets == MISSING_CODE) & (resolving if column == 'accepted_species' else True)
+        rows = np.concatenate([rows, names[missing]])
+        cols = np.concatenate([cols, np.full(missing.sum(), size)])
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                               shape=(size, size + 1 if include_missing else size))
+    # The same species may come from more than one accepted name
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def chain_resolution_matrices(older_taxa, newer_versions: list, name_dictionary: pd.Index = None) -> dict:
+    """
+    Chain every name with an accepted name in older_taxa through newer_versions by sparse matrix multiplication.
+    Unlike chain_versions, names with several accepted names follow all of them, and the entries of the chained matrices are the number of
+    paths from each start name to each end name. As in chain_versions, branches that don't resolve in an intermediate version are dropped.
+
+    :param older_taxa: taxa dataframe or ResolutionMap.
+    :param newer_versions: taxa dataframes or ResolutionMaps, from oldest to newest.
+    :return: dict of the name dictionary, the start name codes, and matrices with a row for each start name of
+        'chained_accepted', 'chained_species', 'direct_accepted' and 'direct_species' in the last version, and the 'genus_matrix' of the
+        last version's accepted names. Chained matrices and species matrices have an extra last column for branches without an accepted name
+        or species (see get_resolution_matrix).
+    """
+    taxa_maps = get_resolution_maps([older_taxa] + list(newer_versions), name_dictionary)
+    start = get_resolution_matrix(taxa_maps[0])
+    start_names = np.flatnonzero(start.getnnz(axis=1) > 0).astype(np.int32)
+    paths = start[start_names]
+    for taxa_map in taxa_maps[1:-1]:
+        paths = paths @ get_resolution_matrix(taxa_map)
+    last = taxa_maps[-1]
+    size = len(last.name_dictionary)
+    last_accepted = get_resolution_matrix(last, include_missing=True)
+    last_species = get_resolution_matrix(last, 'accepted_species', include_missing=True)
+    return {'name_dictionary': last.name_dictionary, 'start_names': start_names,
+            'chained_accepted': paths @ last_accepted, 'chained_species': paths @ last_species,
+            'direct_accepted': last_accepted[start_names][:, :size], 'direct_species': last_species[start_names],
+            'genus_matrix': _get_genus_matrix(last)}
+
+
+def _get_genus_matrix(taxa_map) -> sparse.csr_matrix:
+    # Accepted name x genus id, with a last column for accepted names without a genus
+    genus_codes, genera = taxa_map.accepted_genera
+    genus_ids = np.where(genus_codes >= 0, genus_codes, len(genera))
+    return sparse.csr_matrix((np.ones(len(genus_ids), dtype=np.int64), (np.arange(len(genus_ids)), genus_ids)),
+                             shape=(len(genus_ids), len(genera) + 1))
+
+
+def _outside(reachable: sparse.csr_matrix, allowed: sparse.csr_matrix) -> np.ndarray:
+    # Rows with a reachable column that isn't allowed
+    reachable = reachable.astype(bool)
+    return (reachable.getnnz(axis=1) - reachable.multiply(allowed.astype(bool)).getnnz(axis=1)) > 0
+
+
+def get_sparse_disagreements(matrices: dict) -> dict:
+    """
+    Compare every chained branch with the direct resolutions of each start name, a pessimistic version of get_disagreements:
+    a name disagrees if any of its chained accepted names is not one of its direct accepted names.
+
+    :param matrices: from chain_resolution_matrices.
+    :return: dict of boolean arrays aligned with the start names, with the same keys as get_disagreements.
+    """
+    size = matrices['direct_accepted'].shape[1]
+    chained_accepted = matrices['chained_accepted'][:, :size]
+    direct = matrices['direct_accepted'].getnnz(axis=1) > 0
+    compared = direct & (matrices['chained_accepted'].getnnz(axis=1) > 0)
+    unresolved_via_chaining = compared & (matrices['chained_accepted'][:, size].toarray().ravel() > 0)
+    disagreements = compared & _outside(chained_accepted, matrices['direct_accepted'])
+
+    # Genera and species of the chained accepted names that aren't direct accepted names
+    other_accepted = chained_accepted.astype(bool) - chained_accepted.astype(bool).multiply(matrices['direct_accepted'].astype(bool))
+    genus_matrix = matrices['genus_matrix']
+    direct_genera = matrices['direct_accepted'] @ genus_matrix
+    other_genera = other_accepted @ genus_matrix
+    missing_genus = other_genera[:, -1].toarray().ravel() > 0
+    # Missing genera and species never compare as equal
+    genus_disagreements = _outside(other_genera[:, :-1], direct_genera[:, :-1]) | missing_genus
+    chained_species, direct_species = matrices['chained_species'], matrices['direct_species']
+    species_disagreements = (direct_genera[:, :-1].getnnz(axis=1) > 0) & (
+            _outside(chained_species[:, :size], direct_species[:, :size]) |
+            (chained_species[:, size].toarray().ravel() > 0) | (direct_species[:, size].toarray().ravel() > 0) |
+            genus_disagreements)
+    species_disagreements &= disagreements
+    genus_disagreements &= species_disagreements
+    return {'compared': compared, 'unresolved_via_chaining': unresolved_via_chaining, 'disagreements': disagreements,
+            'species_disagreements': species_disagreements, 'genus_disagreements': genus_disagreements}
+
+
+def _join_row_names(matrix: sparse.csr_matrix, name_dictionary: pd.Index) -> np.ndarray:
+    # Names of the non zero columns of each row, joined by '|'
+    counts = np.diff(matrix.indptr)
+    names = decode_names(matrix.indices.astype(np.int32), name_dictionary)
+    joined = np.full(matrix.shape[0], np.nan, dtype=object)
+    # Most names reach a single name, so only the others are joined
+    single = np.flatnonzero(counts == 1)
+    joined[single] = names[matrix.indptr[single]]
+    for row in np.flatnonzero(counts > 1):
+        joined[row] = '|'.join(names[matrix.indptr[row]:matrix.indptr[row + 1]])
+    return joined
+
+
+def get_reachable_names(older_taxa, newer_versions: list, new_tag: str, out_dir: str = None, chain_tag: str = None,
+                        name_dictionary: pd.Index = None) -> pd.DataFrame:
+    """
+    Chain the names of older_taxa through newer_versions keeping ambiguous names (see chain_resolution_matrices), and report the set of
+    accepted names reachable from each name in the last version alongside its direct accepted names.
+    Counts of names with any disagreement are a pessimistic bound on those of compare_chained_and_direct_updates, which only keeps names
+    that resolve uniquely.
+
+    :param out_dir: if given, the names are written to {chain_tag}_{new_tag}_reachable_names.csv, and the counts to
+        pessimistic_result_summary.csv.
+    :return: dataframe with a row for each name with an accepted name in older_taxa.
+    """
+    matrices = chain_resolution_matrices(older_taxa, newer_versions, name_dictionary)
+    size = matrices['direct_accepted'].shape[1]
+    name_dictionary = matrices['name_dictionary']
+    chained_accepted = matrices['chained_accepted']
+    disagreements = get_sparse_disagreements(matrices)
+
+    reachable_names = pd.DataFrame({
+        'taxon_name_w_authors': decode_names(matrices['start_names'], name_dictionary),
+        new_tag + '_reachable_accepted_names': _join_row_names(chained_accepted[:, :size], name_dictionary),
+        new_tag + '_direct_accepted_names': _join_row_names(matrices['direct_accepted'], name_dictionary),
+        'reachable_names': chained_accepted[:, :size].getnnz(axis=1),
+        'paths': np.asarray(chained_accepted.sum(axis=1)).ravel(),
+        'unresolved_via_chaining': disagreements['unresolved_via_chaining'],
+        'disagreement': disagreements['disagreements'],
+        'species_disagreement': disagreements['species_disagreements'],
+        'genus_disagreement': disagreements['genus_disagreements']})
+
+    if out_dir is not None:
+        if chain_tag is None:
+            chain_tag = 'chained'
+        os.makedirs(out_dir, exist_ok=True)
+        reachable_names.to_csv(os.path.join(out_dir, f'{chain_tag}_{new_tag}_reachable_names.csv'))
+        get_result_summary(get_sparse_counts(disagreements), f'{chain_tag}_{new_tag}').to_csv(
+            os.path.join(out_dir, 'pessimistic_result_summary.csv'))
+    return reachable_names
+
+
+def get_sparse_counts(disagreements: dict) -> list:
+    """
+    Counts of get_sparse_disagreements in the order of result_summary_index, where original names are all names with an accepted name.
+    """
+    return [len(disagreements['compared'])] + [int(disagreements[c].sum()) for c in
+                                               ['disagreements', 'species_disagreements', 'genus_disagreements', 'unresolved_via_chaining']]
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+# Number of HyperLogLog registers is 2 ** _hll_precision, giving a relative error of around 1%
+_hll_precision = 14
+
+
+def _is_categorical_column(column: pd.Series) -> bool:
+    # Columns which describe summarises with count, unique, top and freq
+    return not isinstance(column.dtype, pd.CategoricalDtype) and (
+            pd.api.types.is_object_dtype(column) or pd.api.types.is_bool_dtype(column) or pd.api.types.is_string_dtype(column))
+
+
+def _value_counts(column: pd.Series) -> pd.Series:
+    # Counts of non-nan values, in order of first appearance, from one hashing pass over the column
+    codes, uniques = pd.factorize(column)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return pd.Series(counts, index=uniques)
+
+
+def _categorical_summary(name, count: int, unique: int, value_counts: pd.Series) -> pd.Series:
+    # As in pandas' describe for object columns
+    if len(value_counts) > 0:
+        freq = value_counts.max()
+        if np.count_nonzero(value_counts.to_numpy() == freq) == 1:
+            top = value_counts.idxmax()
+        else:
+            # Break ties with the same (unstable) sort as value_counts
+            top = value_counts.sort_values(ascending=False).index[0]
+        return pd.Series([count, unique, top, freq], index=['count', 'unique', 'top', 'freq'], name=name)
+    return pd.Series([count, unique, np.nan, np.nan], index=['count', 'unique', 'top', 'freq'], name=name, dtype='object')
+
+
+def _combine_column_summaries(column_summaries: list, columns: pd.Index) -> pd.DataFrame:
+    # Rows are in order of first appearance in the column summaries, shortest first, as in DataFrame.describe
+    row_names = []
+    for summary in sorted(column_summaries, key=len):
+        for row_name in summary.index:
+            if row_name not in row_names:
+                row_names.append(row_name)
+    summary = pd.concat([s.reindex(row_names) for s in column_summaries], axis=1, sort=False)
+    summary.columns = columns.copy()
+    return summary
+
+
+def summarise_columns(df: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """
+    Same table as df.describe(include='all'), but each string column is counted in a single hashing pass rather than with value_counts.
+
+    :param columns: columns to summarise, defaults to all columns.
+    """
+    if columns is not None:
+        df = df[columns]
+    column_summaries = []
+    for c in df.columns:
+        column = df[c]
+        if _is_categorical_column(column):
+            value_counts = _value_counts(column)
+            column_summaries.append(_categorical_summary(c, int(value_counts.sum()), len(value_counts), value_counts))
+        else:
+            column_summaries.append(column.describe())
+    return _combine_column_summaries(column_summaries, df.columns)
+
+
+def _hll_update(registers: np.ndarray, values: pd.Series):
+    # Add values to HyperLogLog registers: the first bits of the hash pick a register, which keeps the largest position of the
+    # first set bit in the next 32 bits
+    hashes = pd.util.hash_array(values.to_numpy(dtype=object))
+    register_ids = (hashes >> np.uint64(64 - _hll_precision)).astype(np.int64)
+    remaining = ((hashes << np.uint64(_hll_precision)) >> np.uint64(32)).astype(np.float64)
+    bit_lengths = np.where(remaining > 0, np.floor(np.log2(np.maximum(remaining, 1))) + 1, 0)
+    np.maximum.at(registers, register_ids, (33 - bit_lengths).astype(np.uint8))
+
+
+def _hll_estimate(registers: np.ndarray) -> int:
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m ** 2 / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    empty_registers = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and empty_registers > 0:
+        # Small range correction
+        estimate = m * np.log(m / empty_registers)
+    return int(round(estimate))
+
+
+class StreamingSummary:
+    """
+    describe(include='all') style summary built up one chunk at a time, e.g. while a version is streamed from disk.
+
+    String columns get count, unique, top and freq. Numeric columns get count, mean, std, min and max, as quantiles can't be
+    combined over chunks.
+
+    With approximate_distinct, unique is a HyperLogLog estimate and only the max_tracked_values most frequent values of each
+    column are kept between chunks, so memory doesn't grow with the number of distinct values. top and freq are then approximate.
+    """
+
+    def __init__(self, columns: list = None, approximate_distinct: bool = False, max_tracked_values: int = 10000):
+        self.columns = columns
+        self.approximate_distinct = approximate_distinct
+        self.max_tracked_values = max_tracked_values
+        self.column_names = None
+        self.value_counts = {}
+        self.registers = {}
+        self.moments = {}
+
+    def update(self, chunk: pd.DataFrame):
+        if self.columns is not None:
+            chunk = chunk[self.columns]
+        if self.column_names is None:
+            self.column_names = chunk.columns
+        for c in chunk.columns:
+            column = chunk[c]
+            if _is_categorical_column(column):
+                self._update_categorical(c, column)
+            else:
+                self._update_numeric(c, column)
+        return self
+
+    def _update_categorical(self, c, column: pd.Series):
+        chunk_counts = _value_counts(column)
+        if c in self.value_counts:
+            # Keeps values in order of first appearance, so ties are broken as in describe
+            chunk_counts = pd.concat([self.value_counts[c], chunk_counts]).groupby(level=0, sort=False).sum()
+        if self.approximate_distinct:
+            _hll_update(self.registers.setdefault(c, np.zeros(2 ** _hll_precision, dtype=np.uint8)), column.dropna())
+            self.moments[c] = self.moments.get(c, 0) + int(column.count())
+            if len(chunk_counts) > self.max_tracked_values:
+                chunk_counts = chunk_counts.nlargest(self.max_tracked_values, keep='first')
+        self.value_counts[c] = chunk_counts
+
+    def _update_numeric(self, c, column: pd.Series):
+        # Count, mean and sum of squared deviations from the mean (M2) of the values so far, merged with those of the chunk with Chan's
+        # parallel update. Unlike summing squares this doesn't lose precision when the variance is small relative to the mean
+        values = column.dropna().to_numpy(dtype=np.float64)
+        count, mean, m2, minimum, maximum = self.moments.get(c, (0, 0.0, 0.0, np.nan, np.nan))
+        if len(values) > 0:
+            chunk_mean = values.mean()
+            chunk_m2 = np.square(values - chunk_mean).sum()
+            merged_count = count + len(values)
+            delta = chunk_mean - mean
+            mean = mean + delta * len(values) / merged_count
+            m2 = m2 + chunk_m2 + delta ** 2 * count * len(values) / merged_count
+            count = merged_count
+            minimum = np.nanmin([minimum, values.min()])
+            maximum = np.nanmax([maximum, values.max()])
+        self.moments[c] = (count, mean, m2, minimum, maximum)
+
+    def result(self) -> pd.DataFrame:
+        column_summaries = []
+        for c in self.column_names:
+            if c in self.value_counts:
+                value_counts = self.value_counts[c]
+                if self.approximate_distinct:
+                    column_summaries.append(_categorical_summary(c, self.moments[c], _hll_estimate(self.registers[c]), value_counts))
+                else:
+                    column_summaries.append(_categorical_summary(c, int(value_counts.sum()), len(value_counts), value_counts))
+            else:
+                count, mean, m2, minimum, maximum = self.moments[c]
+                if count == 0:
+                    mean = np.nan
+                std = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+                column_summaries.append(pd.Series([count, mean, std, minimum, maximum], index=['count', 'mean', 'std', 'min', 'max'], name=c))
+        return _combine_column_summaries(column_summaries, self.column_names)
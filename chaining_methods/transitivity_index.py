@@ -0,0 +1,158 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.all_pairs import get_genus_codes
+from chaining_methods.chain_engine import UNRESOLVED, AMBIGUOUS, ABSENT
+from chaining_methods.name_codes import MISSING_CODE, decode_names, encode_names
+from chaining_methods.resolution_map import get_resolution_maps
+
+# Status of each resolved name
+RESOLVED_STATUS = 'resolved'
+UNRESOLVED_STATUS = 'unresolved'  # name is in the version but has no accepted name
+AMBIGUOUS_STATUS = 'ambiguous'  # name has more than one resolution in the version
+ABSENT_STATUS = 'absent'  # name is not in the version
+resolution_statuses = {UNRESOLVED: UNRESOLVED_STATUS, AMBIGUOUS: AMBIGUOUS_STATUS, ABSENT: ABSENT_STATUS}
+
+
+def _propagate_sentinels(resolution: np.ndarray) -> np.ndarray:
+    # Resolution arrays from chain_engine are padded with ABSENT. Set the padding so that np.take with a sentinel returns the same
+    # sentinel, so the first step at which a name fails is kept along a path
+    resolution = resolution.copy()
+    resolution[[UNRESOLVED, AMBIGUOUS, ABSENT]] = [UNRESOLVED, AMBIGUOUS, ABSENT]
+    return resolution
+
+
+def get_statuses(accepted_codes: np.ndarray) -> pd.Categorical:
+    statuses = np.full(len(accepted_codes), RESOLVED_STATUS, dtype=object)
+    for sentinel, status in resolution_statuses.items():
+        statuses[accepted_codes == sentinel] = status
+    return pd.Categorical(statuses, categories=[RESOLVED_STATUS, UNRESOLVED_STATUS, AMBIGUOUS_STATUS, ABSENT_STATUS])
+
+
+class TransitivityIndex:
+    """
+    Index of the resolutions of every name in a set of versions, for resolving batches of names directly in one version or
+    chained along a path of versions with array lookups.
+
+    Names that don't resolve are given a status rather than raising errors. As in chain_versions, names without an accepted name
+    in an intermediate version are dropped from the chain (absent), while names that are ambiguous at any step stay ambiguous.
+    Compositions of resolutions along a path are cached, with the least recently used paths dropped when there are more than cache_size.
+    """
+
+    def __init__(self, taxa_versions: dict, name_dictionary: pd.Index = None, cache_size: int = 16):
+        """
+        :param taxa_versions: dict of version tag -> taxa dataframe or ResolutionMap.
+        """
+        self.tags = list(taxa_versions.keys())
+        taxa_maps = get_resolution_maps(list(taxa_versions.values()), name_dictionary)
+        self.name_dictionary = taxa_maps[0].name_dictionary
+        self.direct = {}
+        self.chaining = {}
+        for tag, taxa_map in zip(self.tags, taxa_maps):
+            self.direct[tag] = tuple(_propagate_sentinels(r) for r in taxa_map.direct_resolution)
+            self.chaining[tag] = tuple(_propagate_sentinels(r) for r in taxa_map.chaining_resolution)
+        self.genus_codes = get_genus_codes({tag: {'direct_accepted': self.direct[tag][0], 'chaining_accepted': self.chaining[tag][0]}
+                                            for tag in self.tags}, self.name_dictionary)
+        self.cache_size = cache_size
+        self._path_cache = OrderedDict()
+
+    def save(self, index_dir: str):
+        """
+        Write the index to index_dir, so it can be built once and loaded with TransitivityIndex.load.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        pd.DataFrame({'name': self.name_dictionary.to_numpy(dtype=object)}).to_parquet(os.path.join(index_dir, 'names.parquet'))
+        with open(os.path.join(index_dir, 'tags.json'), 'w') as f:
+            json.dump(self.tags, f)
+        for tag in self.tags:
+            for kind, arrays in [('direct', self.direct[tag]), ('chaining', self.chaining[tag])]:
+                np.save(os.path.join(index_dir, f'{tag}_{kind}_accepted.npy'), arrays[0])
+                np.save(os.path.join(index_dir, f'{tag}_{kind}_species.npy'), arrays[1])
+        np.save(os.path.join(index_dir, 'genus_codes.npy'), self.genus_codes)
+
+    @classmethod
+    def load(cls, index_dir: str, cache_size: int = 16, mmap_mode: str = 'r'):
+        """
+        Load an index written by save. Resolution arrays are memory mapped by default.
+        """
+        index = cls.__new__(cls)
+        index.name_dictionary = pd.Index(pd.read_parquet(os.path.join(index_dir, 'names.parquet'))['name'].to_numpy(dtype=object))
+        with open(os.path.join(index_dir, 'tags.json')) as f:
+            index.tags = json.load(f)
+        index.direct = {}
+        index.chaining = {}
+        for tag in index.tags:
+            for kind, arrays in [('direct', index.direct), ('chaining', index.chaining)]:
+                arrays[tag] = (np.load(os.path.join(index_dir, f'{tag}_{kind}_accepted.npy'), mmap_mode=mmap_mode),
+                               np.load(os.path.join(index_dir, f'{tag}_{kind}_species.npy'), mmap_mode=mmap_mode))
+        index.genus_codes = np.load(os.path.join(index_dir, 'genus_codes.npy'), mmap_mode=mmap_mode)
+        index.cache_size = cache_size
+        index._path_cache = OrderedDict()
+        return index
+
+    def encode(self, names) -> np.ndarray:
+        codes = encode_names(names, self.name_dictionary)
+        # Names not in any version
+        codes[codes == MISSING_CODE] = ABSENT
+        return codes
+
+    def get_path_resolution(self, path: tuple):
+        """
+        Accepted and species codes of every name chained along the path of version tags, indexed by name code.
+        The first version resolves names directly and later versions resolve the accepted name from the previous version.
+        """
+        path = tuple(path)
+        if path in self._path_cache:
+            self._path_cache.move_to_end(path)
+            return self._path_cache[path]
+        if len(path) == 1:
+            resolution = self.direct[path[0]]
+        else:
+            # Reuses the composition for the prefix of the path if it is cached
+            resolution = self.extend_resolution(self.get_path_resolution(path[:-1]), path[-1])
+        self._path_cache[path] = resolution
+        if len(self._path_cache) > self.cache_size:
+            self._path_cache.popitem(last=False)
+        return resolution
+
+    def extend_resolution(self, resolution: tuple, tag: str) -> tuple:
+        """
+        Chain a resolution, i.e. (accepted, species) codes, on to the next version.
+        Names without an accepted name in the previous version are dropped.
+        """
+        previous_accepted, _ = resolution
+        previous_accepted = np.where(previous_accepted == UNRESOLVED, ABSENT, previous_accepted).astype(np.int32)
+        accepted, species = self.chaining[tag]
+        return accepted.take(previous_accepted), species.take(previous_accepted)
+
+    def _resolve_codes(self, names, path: tuple) -> pd.DataFrame:
+        codes = self.encode(names)
+        accepted, species = self.get_path_resolution(path)
+        accepted_codes = accepted.take(codes)
+        species_codes = species.take(codes)
+        return pd.DataFrame({'taxon_name_w_authors': np.asarray(names, dtype=object),
+                             'accepted_name_w_author': decode_names(accepted_codes, self.name_dictionary),
+                             'accepted_species': decode_names(species_codes, self.name_dictionary),
+                             'status': get_statuses(accepted_codes),
+                             'accepted_name_code': accepted_codes,
+                             'accepted_species_code': species_codes})
+
+    def resolve_direct(self, names, tag: str) -> pd.DataFrame:
+        """
+        Resolve names in a single version.
+
+        :return: dataframe with a row for each name, giving the accepted name, accepted species and status.
+        """
+        return self._resolve_codes(names, (tag,))
+
+    def resolve_chained(self, names, path: list) -> pd.DataFrame:
+        """
+        Resolve names in the first version of the path, then resolve the accepted name in each following version in turn.
+        """
+        if len(path) < 2:
+            raise ValueError('A chain needs at least two versions')
+        return self._resolve_codes(names, tuple(path))
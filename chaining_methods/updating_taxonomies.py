@@ -1,7 +1,49 @@
 import os
+from dataclasses import dataclass, field
 
+import numpy as np
 import pandas as pd
-from wcvpy.wcvp_name_matching import get_genus_from_full_name
+
+from chaining_methods.chain_engine import chain_versions
+from chaining_methods.name_cleaning import get_genera_from_full_names
+from chaining_methods.name_codes import MISSING_CODE, decode_names, drop_code_columns
+from chaining_methods.resolution_map import ResolutionMap, get_resolution_maps, rank_column
+from chaining_methods.result_store import pair_result_files, partition_columns, write_pair_table, read_pair_tables
+from chaining_methods.summaries import summarise_columns
+
+result_summary_index = ['original_names', 'total_disagreements', 'species_disagreements', 'genus_disagreements',
+                        'unresolved_via_chaining_despite_a_direct_resolution']
+
+# Tables whose unique names are counted in result_summary_index, after original_names
+_counted_tables = ['all_results', 'species_results', 'genus_results', 'unresolved_via_chaining']
+
+
+@dataclass
+class PairResult:
+    """
+    Counts from comparing chained and direct resolutions for a pair of versions, with handles to the detail tables.
+    Tables are either dataframes or functions that load them, which are only called when the table is first used.
+    """
+    tag: str
+    counts: list  # in the order of result_summary_index
+    tables: dict = field(default_factory=dict)
+    rank_summary: pd.DataFrame = None  # counts by rank of the start names, see get_rank_summary
+
+    def get_table(self, name: str) -> pd.DataFrame:
+        table = self.tables[name]
+        if callable(table):
+            table = table()
+            self.tables[name] = table
+        return table
+
+    def get_count(self, measure: str) -> int:
+        return self.counts[result_summary_index.index(measure)]
+
+    def get_result_summary(self) -> pd.DataFrame:
+        return get_result_summary(self.counts, self.tag)
+
+    def get_percentage(self, measure: str) -> float:
+        return self.get_result_summary().at[measure, 'Percentages']
 
 
 def get_accepted_name_from_record(record: pd.DataFrame, reported_name: str):
@@ -22,138 +64,246 @@ def get_accepted_name_from_record(record: pd.DataFrame, reported_name: str):
             return None
 
 
-def chain_two_databases(older_taxa_version: pd.DataFrame, newer_taxa_version: pd.DataFrame, old_tag: str, new_tag: str, out_dir: str):
-    os.makedirs(out_dir, exist_ok=True)
-    # Pick non-duplicated names
-    unique_names = older_taxa_version['taxon_name_w_authors'].dropna().unique().tolist()
-
-    # Collect the records in the old and new database directly
-    # relevant records
-    v12_records = older_taxa_version[older_taxa_version['taxon_name_w_authors'].isin(unique_names)][
-        ['taxon_name_w_authors', 'accepted_name_w_author']]
-    v12_records = v12_records.dropna(subset=['accepted_name_w_author'])
-    v12_records = v12_records.drop_duplicates(keep='first')
-    v12_records = v12_records.drop_duplicates(subset=['taxon_name_w_authors'],
-                                              keep=False)  # Ignore cases with multiple resolutions, as these are ambiguous anyway
-    # I think Cubeba Raf. and Lamottea Pomel are examples but they are less interesting for this analysis
-    if out_dir is not None:
-        v12_records = v12_records.rename(
-            columns={'accepted_name_w_author': old_tag + '_accepted_name_w_author'})
-        v12_records.describe(include='all').to_csv(os.path.join(out_dir, old_tag + '_old_records_summary.csv'))
-
-    # accepted names in old database
-    relevant_v13_names_for_chaining = v12_records[old_tag + '_accepted_name_w_author'].dropna().unique().tolist()
-    # names in new database where taxon name is accepted name in old database
-    v13_records_for_chaining = newer_taxa_version[newer_taxa_version['taxon_name_w_authors'].isin(relevant_v13_names_for_chaining)][
-        ['taxon_name_w_authors', 'accepted_name_w_author', 'accepted_species']]
-    v13_records_for_chaining = v13_records_for_chaining.drop_duplicates(keep='first')
-    v13_records_for_chaining = v13_records_for_chaining.drop_duplicates(subset=['taxon_name_w_authors'],
-                                                                        keep=False)  # Ignore cases with multiple resolutions, as these are ambiguous anyway
-    v13_records_for_chaining = v13_records_for_chaining.rename(
-        columns={'taxon_name_w_authors': new_tag + '_taxon_name_w_authors', 'accepted_name_w_author': new_tag + '_chained_accepted_name_w_author',
-                 'accepted_species': new_tag + '_chained_accepted_species'})
-    # chained result where taxon_name_w_authors are resolved to v13_chained_accepted_name_w_author, mediated by old database
-    chained_updated_records = pd.merge(v12_records, v13_records_for_chaining, left_on=old_tag + '_accepted_name_w_author',
-                                       right_on=new_tag + '_taxon_name_w_authors')
-
-    return chained_updated_records
-
-
-def get_direct_name_updates(v12_taxa: pd.DataFrame, v13_taxa: pd.DataFrame, new_tag: str, out_dir: str):
-    # Pick non-duplicated names
-    unique_names = v12_taxa['taxon_name_w_authors'].dropna().unique().tolist()
+def chain_two_databases(older_taxa_version, newer_taxa_version, old_tag: str, new_tag: str, out_dir: str,
+                        name_dictionary: pd.Index = None):
+    """
+    Resolve names in the older version, then resolve their accepted names in the newer version.
+    Names with more than one resolution in either version are ignored, as these are ambiguous anyway.
+
+    :param older_taxa_version: taxa dataframe or ResolutionMap, as is newer_taxa_version.
+    """
+    # Deduplication is done once per version in its ResolutionMap, and the chain is composed on int32 name codes
+    return chain_versions(older_taxa_version, [newer_taxa_version], old_tag, new_tag, out_dir, name_dictionary=name_dictionary)
+
+
+def get_direct_name_updates(v12_taxa, v13_taxa, new_tag: str, out_dir: str, name_dictionary: pd.Index = None):
+    """
+    Resolutions in the newer version of names in the older version, ignoring names with more than one resolution.
+
+    :param v12_taxa: taxa dataframe or ResolutionMap, as is v13_taxa.
+    """
+    old_map, new_map = get_resolution_maps([v12_taxa, v13_taxa], name_dictionary)
+    name_dictionary = new_map.name_dictionary
+    accepted, species = new_map.direct_resolution
 
     # relevant names in new database where taxon name is taxon name in old database
-    v13_updated_records = v13_taxa[v13_taxa['taxon_name_w_authors'].isin(unique_names)][
-        ['taxon_name_w_authors', 'accepted_name_w_author', 'accepted_species']]
-    v13_updated_records = v13_updated_records.dropna(subset=['accepted_name_w_author'])
-    v13_updated_records = v13_updated_records.drop_duplicates(keep='first')
-    v13_updated_records = v13_updated_records.drop_duplicates(subset=['taxon_name_w_authors'],
-                                                              keep=False)  # Ignore cases with multiple resolutions, as these are ambiguous anyway
-    v13_updated_records = v13_updated_records.rename(
-        columns={'accepted_name_w_author': new_tag + '_direct_accepted_name_w_author',
-                 'accepted_species': new_tag + '_direct_accepted_species'})
-    v13_updated_records.describe(include='all').to_csv(os.path.join(out_dir, 'direct_updated_records_summary.csv'))
+    names, positions = new_map.direct_records
+    in_old = np.zeros(len(name_dictionary), dtype=bool)
+    in_old[old_map.unique_names] = True
+    names, positions = names[in_old[names]], positions[in_old[names]]
+    v13_updated_records = pd.DataFrame({'taxon_name_code': names,
+                                        new_tag + '_direct_accepted_name_code': accepted.take(names),
+                                        new_tag + '_direct_accepted_species_code': species.take(names)},
+                                       index=pd.Index(positions.astype(np.int64)))
+
+    v13_updated_records.insert(0, 'taxon_name_w_authors', decode_names(v13_updated_records['taxon_name_code'], name_dictionary))
+    v13_updated_records.insert(1, new_tag + '_direct_accepted_name_w_author',
+                               decode_names(v13_updated_records[new_tag + '_direct_accepted_name_code'], name_dictionary))
+    v13_updated_records.insert(2, new_tag + '_direct_accepted_species',
+                               decode_names(v13_updated_records[new_tag + '_direct_accepted_species_code'], name_dictionary))
+    if out_dir is not None:
+        summarise_columns(drop_code_columns(v13_updated_records)).to_csv(os.path.join(out_dir, 'direct_updated_records_summary.csv'))
 
     return v13_updated_records
 
 
-def compare_and_output_chained_and_direct_updates(chained_updated_records, direct_updated_records, old_tag: str, new_tag: str, out_dir: str):
-    merged_df = pd.merge(chained_updated_records, direct_updated_records, on='taxon_name_w_authors')
+def _count_names(table: pd.DataFrame) -> int:
+    return len(table['taxon_name_w_authors'].unique().tolist())
+
+
+def get_name_rank_groups(taxa_map, ranks: pd.Index = None) -> tuple:
+    """
+    Rank of each name in the map's name dictionary, from its first record (see ResolutionMap.name_ranks), as its position in ranks.
+    Names without a rank, or not in the version, are in a last group len(ranks).
+
+    :param ranks: defaults to the sorted ranks of the version.
+    :return: (groups indexed by name code, ranks).
+    """
+    if rank_column not in taxa_map.taxa.columns:
+        ranks = pd.Index([], dtype=object, name=rank_column) if ranks is None else ranks
+        return np.full(len(taxa_map.name_dictionary), len(ranks), dtype=np.int32), ranks
+    name_ranks, version_ranks = taxa_map.name_ranks
+    if ranks is None:
+        ranks = pd.Index(sorted(version_ranks), dtype=object, name=rank_column)
+    # Names without a rank take the MISSING_CODE at the end of the lookup
+    groups = np.append(ranks.get_indexer(version_ranks), MISSING_CODE).take(name_ranks)
+    return np.where(groups >= 0, groups, len(ranks)).astype(np.int32), ranks
+
+
+def count_by_rank(name_groups: np.ndarray, n_ranks: int, start_names: np.ndarray, tables: dict) -> np.ndarray:
+    """
+    Counts of result_summary_index by the rank group (see get_name_rank_groups) of each name: the start names,
+    then the names of each counted table of compare_chained_and_direct_updates.
+
+    :return: array with a row for each measure and a column for each rank, followed by a column for names without a rank.
+    """
+    counts = np.zeros((len(result_summary_index), n_ranks + 1), dtype=np.int64)
+    counts[0] = np.bincount(name_groups.take(start_names), minlength=n_ranks + 1)
+    for i, table in enumerate(_counted_tables):
+        names = pd.unique(tables[table]['taxon_name_code'].to_numpy(dtype=np.int32))
+        counts[i + 1] = np.bincount(name_groups.take(names), minlength=n_ranks + 1)
+    return counts
+
+
+def get_rank_summary(rank_counts: np.ndarray, ranks: pd.Index) -> pd.DataFrame:
+    """
+    Counts by rank (from count_by_rank or get_pair_rank_counts) as a dataframe with a row for each rank with start names
+    (nan for names without a rank), and the percent of the rank's original names for each disagreement count.
+    """
+    rank_summary = pd.DataFrame(rank_counts.T, columns=result_summary_index,
+                                index=pd.Index(list(ranks) + [np.nan], dtype=object, name=rank_column))
+    rank_summary = rank_summary[rank_summary['original_names'] > 0]
+    for measure in result_summary_index[1:]:
+        rank_summary[f'percent_{measure}'] = 100 * rank_summary[measure] / rank_summary['original_names']
+    return rank_summary
+
+
+def write_rank_summary(rank_summary: pd.DataFrame, out_dir: str, parquet_path: str, taxonomy: str, old_tag: str, new_tag: str):
+    # The summary by rank of a pair, to out_dir/rank_summary.csv and/or the rank_summary table of the parquet dataset
+    if out_dir is not None:
+        rank_summary.to_csv(os.path.join(out_dir, 'rank_summary.csv'))
+    if parquet_path is not None:
+        write_pair_table(rank_summary.reset_index(), parquet_path, 'rank_summary', taxonomy, old_tag, new_tag)
+
+
+def _write_pair_outputs(tables: dict, tag: str, out_dir: str, parquet_path: str, taxonomy: str, old_tag: str, new_tag: str):
+    # Write detail tables (without code columns) as csv with a summary, and/or to the parquet dataset
+    for table_name, table in tables.items():
+        table = drop_code_columns(table)
+        if out_dir is not None:
+            table.to_csv(os.path.join(out_dir, pair_result_files[table_name].format(tag=tag)))
+            if table_name in ['all_results', 'species_results', 'genus_results']:
+                summarise_columns(table).to_csv(os.path.join(out_dir, f'{table_name}_summary.csv'))
+        if parquet_path is not None:
+            write_pair_table(table, parquet_path, table_name, taxonomy, old_tag, new_tag)
+
+
+def compare_chained_and_direct_updates(chained_updated_records, direct_updated_records, old_tag: str, new_tag: str,
+                                       out_dir: str = None, parquet_path: str = None, taxonomy: str = None,
+                                       start_map: ResolutionMap = None) -> PairResult:
+    """
+    Compare chained and direct resolutions, keeping the detail tables in memory.
+
+    :param out_dir: if given, the detail tables, their summaries and result_summary.csv are written here.
+    :param parquet_path: if given, the detail tables and counts are written to this parquet dataset, partitioned by taxonomy,
+        old_tag and new_tag (see result_store).
+    :param start_map: ResolutionMap of the version the chained names start in, with the name dictionary of the records.
+        If given, the counts are also split by the rank of each start name (see get_rank_summary), and written to rank_summary.csv
+        and/or the rank_summary table of the parquet dataset.
+    :return: PairResult, whose tables keep the name code columns.
+    """
+    if parquet_path is not None and taxonomy is None:
+        raise ValueError('A taxonomy name is needed to write to a parquet dataset')
+    tag = '_'.join([old_tag, new_tag])
+    # Inputs come from chain_two_databases and get_direct_name_updates, so join and compare on their name codes
+    merged_df = pd.merge(chained_updated_records, direct_updated_records.drop(columns=['taxon_name_w_authors']), on='taxon_name_code')
 
     # remove cases with no direct accepted name in new version
-    results_df = merged_df.dropna(subset=[new_tag + '_direct_accepted_name_w_author'])
+    results_df = merged_df[merged_df[new_tag + '_direct_accepted_name_code'] != MISSING_CODE]
 
     # get results where chaining provides no results even though direct match does
-    unresolved_via_chaining = results_df[results_df[new_tag + '_chained_accepted_name_w_author'].isna()]
-    unresolved_via_chaining.to_csv(os.path.join(out_dir, '_'.join([old_tag, new_tag]) + '_unresolved_via_chaining.csv'))
+    unresolved_via_chaining = results_df[results_df[new_tag + '_chained_accepted_name_code'] == MISSING_CODE]
 
     # remove cases with no direct accepted name in new version
-    results_df = results_df.dropna(subset=[new_tag + '_chained_accepted_name_w_author'])
-    results_df.to_csv(os.path.join(out_dir, '_'.join([old_tag, new_tag]) + '.csv'))
-    results_df = results_df[results_df[new_tag + '_direct_accepted_name_w_author'] != results_df[new_tag + '_chained_accepted_name_w_author']]
+    resolved = results_df[results_df[new_tag + '_chained_accepted_name_code'] != MISSING_CODE]
+    results_df = resolved[resolved[new_tag + '_direct_accepted_name_code'] != resolved[new_tag + '_chained_accepted_name_code']]
 
     # Add longer chains
 
-    results_df.to_csv(os.path.join(out_dir, 'all_results.csv'))
-    results_df.describe(include='all').to_csv(os.path.join(out_dir, 'all_results_summary.csv'))
+    _write_pair_outputs({'unresolved_via_chaining': unresolved_via_chaining, 'resolved': resolved, 'all_results': results_df},
+                        tag, out_dir, parquet_path, taxonomy, old_tag, new_tag)
 
-    results_df[new_tag + '_chained_accepted_genus'] = results_df[new_tag + '_chained_accepted_name_w_author'].apply(
-        get_genus_from_full_name)
-    results_df[new_tag + '_direct_accepted_genus'] = results_df[new_tag + '_direct_accepted_name_w_author'].apply(
-        get_genus_from_full_name)
+    results_df[new_tag + '_chained_accepted_genus'] = get_genera_from_full_names(results_df[new_tag + '_chained_accepted_name_w_author'])
+    results_df[new_tag + '_direct_accepted_genus'] = get_genera_from_full_names(results_df[new_tag + '_direct_accepted_name_w_author'])
 
     species_ambiguity_results = results_df.dropna(subset=[new_tag + '_direct_accepted_genus'])
+    # Missing species never compare as equal (as with nan strings), so names resolving to genera are kept
     species_ambiguity_results = species_ambiguity_results[
-        (species_ambiguity_results[new_tag + '_direct_accepted_species'] != species_ambiguity_results[new_tag + '_chained_accepted_species']) |
+        (species_ambiguity_results[new_tag + '_direct_accepted_species_code'] != species_ambiguity_results[
+            new_tag + '_chained_accepted_species_code']) |
+        (species_ambiguity_results[new_tag + '_direct_accepted_species_code'] == MISSING_CODE) |
     (species_ambiguity_results[new_tag + '_direct_accepted_genus'] != species_ambiguity_results[new_tag + '_chained_accepted_genus'])]
 
-    species_ambiguity_results.to_csv(os.path.join(out_dir, 'species_results.csv'))
-    species_ambiguity_results.describe(include='all').to_csv(os.path.join(out_dir, 'species_results_summary.csv'))
-
-
     genus_ambiguity_results = species_ambiguity_results[
         species_ambiguity_results[new_tag + '_chained_accepted_genus'] != species_ambiguity_results[new_tag + '_direct_accepted_genus']]
-    genus_ambiguity_results.to_csv(os.path.join(out_dir, 'genus_results.csv'))
-    genus_ambiguity_results.describe(include='all').to_csv(os.path.join(out_dir, 'genus_results_summary.csv'))
+    _write_pair_outputs({'species_results': species_ambiguity_results, 'genus_results': genus_ambiguity_results},
+                        tag, out_dir, parquet_path, taxonomy, old_tag, new_tag)
     # cases_that_cant_update_df.to_csv(os.path.join(out_dir, 'v12_v13_cases_cant_update.csv'))
     # names_in_old_with_multiple_resolutions_df.to_csv(os.path.join(out_dir, 'v12_v13_names_in_old_with_multiple_resolutions.csv'))
 
+    tables = {'unresolved_via_chaining': unresolved_via_chaining, 'resolved': resolved, 'all_results': results_df,
+              'species_results': species_ambiguity_results, 'genus_results': genus_ambiguity_results,
+              'chained_updated_records': chained_updated_records, 'direct_updated_records': direct_updated_records}
+    # The number of original names is set by chain_two_databases and chain_versions
+    counts = [chained_updated_records.attrs.get('original_names', float('nan'))] + [_count_names(tables[t]) for t in _counted_tables]
+    result = PairResult(tag, counts, tables)
+    if start_map is not None:
+        name_groups, ranks = get_name_rank_groups(start_map)
+        result.rank_summary = get_rank_summary(count_by_rank(name_groups, len(ranks), start_map.start_names, tables), ranks)
+
     # do full summary
+    if out_dir is not None:
+        write_result_summary(counts, out_dir, tag)
+    if parquet_path is not None:
+        write_pair_counts(counts, parquet_path, taxonomy, old_tag, new_tag)
+    if result.rank_summary is not None:
+        write_rank_summary(result.rank_summary, out_dir, parquet_path, taxonomy, old_tag, new_tag)
+    return result
+
 
-    return results_df
+def write_pair_counts(counts: list, parquet_path: str, taxonomy: str, old_tag: str, new_tag: str):
+    # One row of counts for the pair, in the result_summary table of the parquet dataset
+    write_pair_table(pd.DataFrame([counts], columns=result_summary_index), parquet_path, 'result_summary', taxonomy, old_tag, new_tag)
 
 
-def compare_two_versions(v12_taxa: pd.DataFrame, v13_taxa: pd.DataFrame, old_tag: str, new_tag: str, outpath: str):
+def compare_and_output_chained_and_direct_updates(chained_updated_records, direct_updated_records, old_tag: str, new_tag: str, out_dir: str):
+    result = compare_chained_and_direct_updates(chained_updated_records, direct_updated_records, old_tag, new_tag, out_dir)
+    return result.get_table('all_results')
+
+
+def compare_two_versions(v12_taxa, v13_taxa, old_tag: str, new_tag: str, outpath: str = None,
+                         name_dictionary: pd.Index = None, parquet_path: str = None, taxonomy: str = None) -> PairResult:
     # For all taxa with unique names (inc. author strings) in old taxon database
     # If the name resolves uniquely to a non-nan accepted name in both the old and new database
     # Find the accepted name resolution when the name is resolved first to the old taxonomy then the new taxonomy
     # If no such name exists, ignore, if not check if this name is the same as the name when directly resolved using the new database.
-    out_dir = os.path.join(outpath,
-                           '_'.join([old_tag, new_tag]))
-    os.makedirs(out_dir, exist_ok=True)
+    # csv outputs are only written when outpath is given, and parquet outputs when parquet_path is given
+    out_dir = None
+    if outpath is not None:
+        out_dir = os.path.join(outpath,
+                               '_'.join([old_tag, new_tag]))
+        os.makedirs(out_dir, exist_ok=True)
+    # Versions may be given as taxa dataframes or resolution maps, each version is only deduplicated once
+    v12_taxa, v13_taxa = get_resolution_maps([v12_taxa, v13_taxa], name_dictionary)
 
     chained_updated_records = chain_two_databases(v12_taxa, v13_taxa, old_tag, new_tag, out_dir)
-    chained_updated_records.describe(include='all').to_csv(os.path.join(out_dir, 'chained_updated_records_summary.csv'))
+    if out_dir is not None:
+        summarise_columns(drop_code_columns(chained_updated_records)).to_csv(os.path.join(out_dir, 'chained_updated_records_summary.csv'))
 
     # relevant names in new database where taxon name is taxon name in old database
     v13_updated_records = get_direct_name_updates(v12_taxa, v13_taxa, new_tag, out_dir)
-    results_df = compare_and_output_chained_and_direct_updates(chained_updated_records, v13_updated_records, old_tag, new_tag, out_dir)
+    result = compare_chained_and_direct_updates(chained_updated_records, v13_updated_records, old_tag, new_tag, out_dir,
+                                                parquet_path=parquet_path, taxonomy=taxonomy, start_map=v12_taxa)
 
     # Add a check here that no accepted names in v12 are in output
-    problems = results_df[results_df['taxon_name_w_authors'] == results_df[f'{old_tag}_accepted_name_w_author']]
+    results_df = result.get_table('all_results')
+    problems = results_df[results_df['taxon_name_code'] == results_df[f'{old_tag}_accepted_name_code']]
     assert len(problems) == 0
-    return results_df
+    return result
 
 
-def get_overrepresented_genera(_output_path: str, old_tag, new_tag, older_taxa_version):
-    dir_path = os.path.join(_output_path, f'{old_tag}_{new_tag}')
-    species_results = pd.read_csv(os.path.join(dir_path, 'species_results.csv'))
+def get_overrepresented_genera(_output_path: str, old_tag, new_tag, older_taxa_version, pair_result: PairResult = None):
+    # Species results are taken from pair_result if given, otherwise loaded from the pair's outputs
+    if pair_result is None:
+        pair_result = read_pair_result(os.path.join(_output_path, f'{old_tag}_{new_tag}'))
+    species_results = pair_result.get_table('species_results')
 
-    species_results['Genus'] = species_results['taxon_name_w_authors'].apply(get_genus_from_full_name)
-    genus_count = pd.DataFrame(species_results['Genus'].value_counts()).reset_index()
+    genera = get_genera_from_full_names(species_results['taxon_name_w_authors']).rename('Genus')
+    genus_count = pd.DataFrame(genera.value_counts()).reset_index()
     genus_count = genus_count.rename(columns={'count':'Num_names_for_genus_with_species_discrepancy'})
 
+    if isinstance(older_taxa_version, ResolutionMap):
+        older_taxa_version = older_taxa_version.taxa
     older_taxa_version = older_taxa_version[['genus','taxon_name_w_authors']].dropna().drop_duplicates(keep='first')
     older_taxa_version = older_taxa_version.rename(columns={'genus':'Genus'})
     genus_total_count = pd.DataFrame(older_taxa_version['Genus'].value_counts()).reset_index()
@@ -166,26 +316,58 @@ def get_overrepresented_genera(_output_path: str, old_tag, new_tag, older_taxa_v
     return results
 
 
-def summarise_results(dir_path: str, tag: str, old_tag='v10'):
+def _get_table_loaders(dir_path: str, tag: str) -> dict:
+    return {name: (lambda file_path=os.path.join(dir_path, file_name.format(tag=tag)): pd.read_csv(file_path, index_col=0))
+            for name, file_name in pair_result_files.items()}
+
+
+def read_pair_result(dir_path: str) -> PairResult:
+    """
+    PairResult for a pair whose outputs have been written to dir_path, with counts from result_summary.csv.
+    Detail tables are loaded from their csv files when first used.
+    """
+    result_summary = pd.read_csv(os.path.join(dir_path, 'result_summary.csv'), index_col=0)
+    tag = result_summary.columns[0]
+    counts = result_summary[tag].reindex(result_summary_index).tolist()
+    return PairResult(tag, counts, _get_table_loaders(dir_path, tag))
+
+
+def read_pair_result_from_dataset(parquet_path: str, taxonomy: str, old_tag: str, new_tag: str) -> PairResult:
+    """
+    PairResult for a pair written to a parquet dataset by compare_chained_and_direct_updates.
+    Detail tables are read from the dataset when first used.
+    """
+    counts = read_pair_tables(parquet_path, 'result_summary', columns=result_summary_index, taxonomy=taxonomy, old_tag=old_tag,
+                              new_tag=new_tag)
+    if len(counts) != 1:
+        raise ValueError(f'No unique result summary for {taxonomy} {old_tag} {new_tag} in {parquet_path}')
+    tables = {name: (lambda name=name: read_pair_tables(parquet_path, name, taxonomy=taxonomy, old_tag=old_tag, new_tag=new_tag).drop(
+        columns=partition_columns)) for name in pair_result_files}
+    return PairResult(f'{old_tag}_{new_tag}', counts.iloc[0].tolist(), tables)
+
+
+def summarise_results(dir_path: str, tag: str, old_tag='v10') -> PairResult:
+    # Recount a pair from the csv files written by compare_and_output_chained_and_direct_updates
     old_record_summary = pd.read_csv(os.path.join(dir_path, f'{old_tag}_old_records_summary.csv'), index_col=0)
     num_of_original_names = int(old_record_summary.at['unique', 'taxon_name_w_authors'])
 
-    total_results = pd.read_csv(os.path.join(dir_path, 'all_results.csv'))
-    num_total_results = len(total_results['taxon_name_w_authors'].unique().tolist())
+    result = PairResult(tag, [], _get_table_loaders(dir_path, tag))
+    result.counts = [num_of_original_names] + [_count_names(result.get_table(t)) for t in _counted_tables]
+    write_result_summary(result.counts, dir_path, tag)
+    return result
 
-    species_results = pd.read_csv(os.path.join(dir_path, 'species_results.csv'))
-    num_species_results = len(species_results['taxon_name_w_authors'].unique().tolist())
 
-    genus_results = pd.read_csv(os.path.join(dir_path, 'genus_results.csv'))
-    num_genus_results = len(genus_results['taxon_name_w_authors'].unique().tolist())
+def get_result_summary(counts: list, tag: str) -> pd.DataFrame:
+    # counts are given in the order of result_summary_index
+    out_df = pd.DataFrame(counts)
+    out_df.columns = [tag]
+    out_df.index = result_summary_index
 
-    unresolved_via_chaining = pd.read_csv(os.path.join(dir_path, f'{tag}_unresolved_via_chaining.csv'))
-    num_unresolved_via_chaining = len(unresolved_via_chaining['taxon_name_w_authors'].unique().tolist())
+    out_df['Percentages'] = 100 * out_df[tag] / counts[0]
+    return out_df
 
-    out_df = pd.DataFrame([num_of_original_names, num_total_results, num_species_results, num_genus_results, num_unresolved_via_chaining])
-    out_df.columns = [tag]
-    out_df.index = ['original_names', 'total_disagreements', 'species_disagreements', 'genus_disagreements',
-                    'unresolved_via_chaining_despite_a_direct_resolution']
 
-    out_df['Percentages'] = 100 * out_df[tag] / num_of_original_names
+def write_result_summary(counts: list, dir_path: str, tag: str):
+    out_df = get_result_summary(counts, tag)
     out_df.to_csv(os.path.join(dir_path, 'result_summary.csv'))
+    return out_df
@@ -0,0 +1,120 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+_cache_path = os.path.join(Path.home(), '.taxodrift_cache')
+
+
+def hash_file(file_path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_file_hash(file_path: str, hash_dir: str = None) -> str:
+    """
+    hash_file(file_path), which is stored in hash_dir with the size and modification time of the file, so the file is only read again
+    when either of those change.
+
+    :param hash_dir: defaults to file_hashes in ~/.taxodrift_cache
+    """
+    if hash_dir is None:
+        hash_dir = os.path.join(_cache_path, 'file_hashes')
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    record_file = os.path.join(hash_dir, hashlib.sha256(file_path.encode()).hexdigest()[:16] + '.json')
+    if os.path.isfile(record_file):
+        with open(record_file) as f:
+            record = json.load(f)
+        if record['path'] == file_path and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+            return record['sha256']
+
+    record = {'path': file_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': hash_file(file_path)}
+    os.makedirs(hash_dir, exist_ok=True)
+    # Written under a temporary name first, so that concurrent runs never read a partial record
+    with open(f'{record_file}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(f'{record_file}.{os.getpid()}.tmp', record_file)
+    return record['sha256']
+
+
+def get_cache_key(source_path: str, parsing_functions: list, cache_dir: str = None) -> str:
+    """
+    Key for a parsed version, which changes when the source file or the source code of any of the parsing functions changes.
+    """
+    if cache_dir is None:
+        cache_dir = _cache_path
+    key = hashlib.sha256(get_file_hash(source_path, os.path.join(cache_dir, 'file_hashes')).encode())
+    for function in parsing_functions:
+        key.update(inspect.getsource(function).encode())
+    return key.hexdigest()[:16]
+
+
+def get_cache_file(tag: str, source_path: str, parsing_functions: list, cache_dir: str = None) -> str:
+    """
+    Path of the cached parquet file for a version. The file may not exist yet.
+    """
+    if cache_dir is None:
+        cache_dir = _cache_path
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f'{tag}_{get_cache_key(source_path, parsing_functions, cache_dir)}.parquet')
+
+
+def remove_stale_cache_files(tag: str, cache_dir: str = None):
+    if cache_dir is None:
+        cache_dir = _cache_path
+    for old_file in glob.glob(os.path.join(cache_dir, f'{tag}_*.parquet')):
+        os.remove(old_file)
+
+
+def load_cached_version(tag: str, source_path: str, parse, parsing_functions: list, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Load a parsed taxonomy version from the on disk cache, or parse it with parse() and cache the result as parquet.
+
+    :param tag: version tag, e.g. 'v10' or '202412'.
+    :param source_path: the raw file the version is parsed from.
+    :param parse: function with no arguments returning the parsed dataframe.
+    :param parsing_functions: functions whose source code determines the parsed output, so that changes to them invalidate the cache.
+    :param cache_dir: defaults to ~/.taxodrift_cache
+    """
+    cache_file = get_cache_file(tag, source_path, parsing_functions, cache_dir)
+    if os.path.isfile(cache_file):
+        return pd.read_parquet(cache_file)
+
+    parsed = parse()
+    remove_stale_cache_files(tag, os.path.dirname(cache_file))
+    try:
+        parsed.to_parquet(cache_file + '.tmp', compression='zstd')
+        os.replace(cache_file + '.tmp', cache_file)
+    except (ValueError, TypeError) as e:
+        # e.g. columns with mixed types can't be written to parquet
+        print(f'Could not cache {tag}: {e}')
+        if os.path.isfile(cache_file + '.tmp'):
+            os.remove(cache_file + '.tmp')
+    return parsed
+
+
+def write_cached_version(tag: str, source_path: str, write, parsing_functions: list, cache_dir: str = None) -> str:
+    """
+    As load_cached_version, but for versions too large to hold in memory while parsing. write(path) should write the parsed
+    version to the given parquet path.
+
+    :return: path of the cached parquet file.
+    """
+    cache_file = get_cache_file(tag, source_path, parsing_functions, cache_dir)
+    if not os.path.isfile(cache_file):
+        remove_stale_cache_files(tag, os.path.dirname(cache_file))
+        try:
+            write(cache_file + '.tmp')
+            os.replace(cache_file + '.tmp', cache_file)
+        finally:
+            if os.path.isfile(cache_file + '.tmp'):
+                os.remove(cache_file + '.tmp')
+    return cache_file
@@ -0,0 +1,149 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from chaining_methods.chain_engine import get_chaining_resolution, get_direct_resolution
+from chaining_methods.name_codes import get_name_codes
+
+# Kinds of name change in a delta
+name_change_types = ['added', 'removed', 'repointed']
+
+_store_file = 'versions.json'
+
+
+def get_row_keys(taxa: pd.DataFrame, columns: list) -> np.ndarray:
+    """
+    A uint64 key for each record from the values of the given columns. Repeats of the same record get different keys,
+    so records are matched between versions as a multiset.
+    """
+    row_hashes = pd.util.hash_pandas_object(taxa[columns], index=False).to_numpy()
+    occurrence = pd.Series(row_hashes).groupby(row_hashes, sort=False).cumcount().to_numpy(dtype=np.uint64)
+    return row_hashes ^ (occurrence * np.uint64(0x9E3779B97F4A7C15))
+
+
+def get_version_delta(older_taxa: pd.DataFrame, newer_taxa: pd.DataFrame, columns: list = None) -> dict:
+    """
+    Records removed from and added to older_taxa to give newer_taxa, and the names whose records changed.
+
+    :param columns: columns stored for each record, defaults to the columns of newer_taxa which must also be in older_taxa.
+    :return: dict with 'added' (the added records), 'removed' (keys of the removed records with their names and accepted names)
+        and 'name_changes' (each name that was added, removed or repointed, i.e. whose records changed).
+    """
+    if columns is None:
+        columns = list(newer_taxa.columns)
+    missing_columns = [c for c in columns if c not in older_taxa.columns]
+    if len(missing_columns) > 0:
+        raise ValueError(f'Columns missing from the older version: {missing_columns}')
+    older_keys = get_row_keys(older_taxa, columns)
+    newer_keys = get_row_keys(newer_taxa, columns)
+    removed = ~np.isin(older_keys, newer_keys)
+    added = ~np.isin(newer_keys, older_keys)
+
+    removed_records = older_taxa.loc[removed, ['taxon_name_w_authors', 'accepted_name_w_author']].reset_index(drop=True)
+    removed_records.insert(0, 'row_key', older_keys[removed])
+    added_records = newer_taxa.loc[added, columns].reset_index(drop=True)
+
+    # A name whose records changed is added or removed if it only has records in one version, otherwise its resolutions were repointed
+    changed_names = pd.unique(pd.concat([removed_records['taxon_name_w_authors'], added_records['taxon_name_w_authors']]).dropna())
+    in_older = pd.Index(changed_names).isin(older_taxa['taxon_name_w_authors'])
+    in_newer = pd.Index(changed_names).isin(newer_taxa['taxon_name_w_authors'])
+    name_changes = pd.DataFrame({'taxon_name_w_authors': changed_names,
+                                 'change': pd.Categorical(np.where(~in_older, 'added', np.where(~in_newer, 'removed', 'repointed')),
+                                                          categories=name_change_types)})
+    return {'added': added_records, 'removed': removed_records, 'name_changes': name_changes}
+
+
+def apply_version_delta(older_taxa: pd.DataFrame, delta: dict) -> pd.DataFrame:
+    """
+    Rebuild the newer version from older_taxa and the delta from get_version_delta.
+    Records keep their order in older_taxa, and added records come after them.
+    """
+    columns = list(delta['added'].columns)
+    kept = ~np.isin(get_row_keys(older_taxa, columns), delta['removed']['row_key'].to_numpy())
+    return pd.concat([older_taxa.loc[kept, columns], delta['added']], ignore_index=True)
+
+
+def summarise_delta(delta: dict) -> pd.Series:
+    # Number of added, removed and repointed names, and the number of records added and removed
+    counts = delta['name_changes']['change'].value_counts().reindex(name_change_types, fill_value=0)
+    counts.index = [c + '_names' for c in counts.index]
+    return pd.concat([counts, pd.Series({'added_records': len(delta['added']), 'removed_records': len(delta['removed'])})])
+
+
+def update_resolutions(direct_resolution: tuple, chaining_resolution: tuple, newer_taxa: pd.DataFrame, delta: dict,
+                       name_dictionary: pd.Index) -> tuple:
+    """
+    Resolution arrays of the newer version (see get_direct_resolution and get_chaining_resolution) from those of the older version,
+    only resolving the names that changed in the delta.
+
+    :param newer_taxa: the newer version, only the records of changed names are used.
+    :return: (direct_resolution, chaining_resolution) of the newer version.
+    """
+    changed_names = get_name_codes(delta['name_changes'], 'taxon_name_w_authors', name_dictionary)
+    changed_names = changed_names[changed_names >= 0]
+    changed_taxa = newer_taxa[newer_taxa['taxon_name_w_authors'].isin(delta['name_changes']['taxon_name_w_authors'])]
+    updated = []
+    for resolution, resolve in [(direct_resolution, get_direct_resolution), (chaining_resolution, get_chaining_resolution)]:
+        changed_resolution = resolve(changed_taxa, name_dictionary)
+        updated_arrays = []
+        for previous, changed in zip(resolution, changed_resolution):
+            previous = previous.copy()
+            previous[changed_names] = changed[changed_names]
+            updated_arrays.append(previous)
+        updated.append(tuple(updated_arrays))
+    return tuple(updated)
+
+
+def write_version_store(taxa_versions: dict, store_dir: str, columns: list = None):
+    """
+    Store the first version in full and each later version as its delta from the previous one, as zstd parquet files.
+
+    :param taxa_versions: dict of tag -> taxa dataframe, ordered from oldest to newest.
+    :param columns: columns to store, defaults to the columns shared by all versions.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    tags = list(taxa_versions.keys())
+    base = taxa_versions[tags[0]]
+    if columns is None:
+        columns = [c for c in base.columns if all(c in taxa.columns for taxa in taxa_versions.values())]
+    base[columns].to_parquet(os.path.join(store_dir, f'{tags[0]}_base.parquet'), compression='zstd')
+    for older_tag, newer_tag in zip(tags[:-1], tags[1:]):
+        delta = get_version_delta(taxa_versions[older_tag], taxa_versions[newer_tag], columns)
+        for part in ['added', 'removed', 'name_changes']:
+            delta[part].to_parquet(os.path.join(store_dir, f'{newer_tag}_{part}.parquet'), compression='zstd')
+        print(f'{older_tag} -> {newer_tag}: {summarise_delta(delta).to_dict()}')
+    with open(os.path.join(store_dir, _store_file), 'w') as f:
+        json.dump({'tags': tags, 'columns': columns}, f)
+
+
+def get_store_tags(store_dir: str) -> list:
+    with open(os.path.join(store_dir, _store_file)) as f:
+        return json.load(f)['tags']
+
+
+def read_version_delta(store_dir: str, tag: str) -> dict:
+    return {part: pd.read_parquet(os.path.join(store_dir, f'{tag}_{part}.parquet')) for part in ['added', 'removed', 'name_changes']}
+
+
+def iter_stored_versions(store_dir: str, until_tag: str = None):
+    """
+    Rebuild versions from a store written by write_version_store, yielding (tag, taxa) from oldest to newest, up to and including until_tag.
+    Only one rebuilt version is held at a time.
+    """
+    tags = get_store_tags(store_dir)
+    if until_tag is not None:
+        tags = tags[:tags.index(until_tag) + 1]
+    taxa = pd.read_parquet(os.path.join(store_dir, f'{tags[0]}_base.parquet'))
+    yield tags[0], taxa
+    for tag in tags[1:]:
+        taxa = apply_version_delta(taxa, read_version_delta(store_dir, tag))
+        yield tag, taxa
+
+
+def load_stored_version(store_dir: str, tag: str) -> pd.DataFrame:
+    # Rebuild a single version from the base and the deltas before it
+    for _, taxa in iter_stored_versions(store_dir, tag):
+        pass
+    return taxa
@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Modules of the analyses read KEWSCRATCHPATH when imported, and write their outputs under it
+if 'KEWSCRATCHPATH' not in os.environ:
+    os.environ['KEWSCRATCHPATH'] = tempfile.mkdtemp()
+    for taxonomy_dir in ['WCVP_versions', 'WFO_versions']:
+        os.makedirs(os.path.join(os.environ['KEWSCRATCHPATH'], 'TaxoDrift', taxonomy_dir))
+
+
+def _get_pool(n_names: int, rng) -> list:
+    # (genus, species, name with authors, rank) of each name that may appear in a version
+    genera = [f'Genus{i}' for i in range(max(3, n_names // 20))]
+    pool = []
+    for i in range(n_names):
+        genus = genera[rng.integers(len(genera))]
+        kind = rng.random()
+        if kind < 0.1:
+            pool.append((genus, np.nan, f'{genus} Auth{i % 3}', 'Genus'))
+        elif kind < 0.8:
+            species = f'{genus} sp{i}'
+            pool.append((genus, species, f'{species} Auth{i % 5}', 'Species'))
+        else:
+            species = f'{genus} sp{i // 2}'
+            pool.append((genus, species, f'{species} var. v{i} Auth{i % 4}', 'Variety'))
+    return pool
+
+
+def _get_version(pool: list, rng) -> pd.DataFrame:
+    # A version with some of the names of the pool, a third of them accepted, with unresolved names, duplicated records and names with
+    # more than one resolution
+    present = np.flatnonzero(rng.random(len(pool)) < 0.85)
+    accepted = np.sort(rng.choice(present, size=max(1, len(present) // 3), replace=False))
+
+    def get_accepted_columns(a):
+        if a is None:
+            return {'accepted_name_w_author': np.nan, 'accepted_name': np.nan, 'accepted_species': np.nan,
+                    'accepted_species_w_author': np.nan}
+        genus, species, full_name, rank = pool[a]
+        return {'accepted_name_w_author': full_name, 'accepted_name': full_name.rsplit(' ', 1)[0],
+                'accepted_species': species,
+                'accepted_species_w_author': full_name if rank == 'Species' else species + ' Auth0' if isinstance(species, str) else np.nan}
+
+    records = []
+    for i in present:
+        genus, species, full_name, rank = pool[i]
+        if i in accepted:
+            a = i
+        elif rng.random() < 0.08:
+            a = None
+        else:
+            a = accepted[rng.integers(len(accepted))]
+        status = 'Accepted' if a == i else ('Synonym' if a is not None else 'Unplaced')
+        records.append({'taxon_name': full_name.rsplit(' ', 1)[0], 'taxon_name_w_authors': full_name, 'taxon_rank': rank,
+                        'taxon_status': status, 'genus': genus, 'family': f'Family{len(genus) % 3}',
+                        'homotypic_synonym': 'T' if rng.random() < 0.3 else np.nan, **get_accepted_columns(a)})
+        duplicate = rng.random()
+        if duplicate < 0.05:
+            records.append(dict(records[-1]))
+        elif duplicate < 0.08:
+            records.append({**records[-1], **get_accepted_columns(accepted[rng.integers(len(accepted))])})
+    return pd.DataFrame(records).sample(frac=1, random_state=int(rng.integers(1e6))).reset_index(drop=True)
+
+
+def make_versions(n_names: int = 400, n_versions: int = 4, seed: int = 0) -> list:
+    """
+    Small synthetic taxonomy versions with the columns of parsed WCVP versions, sharing a pool of names.
+    """
+    rng = np.random.default_rng(seed)
+    pool = _get_pool(n_names, rng)
+    return [_get_version(pool, rng) for _ in range(n_versions)]
+
+
+@pytest.fixture
+def taxa_versions() -> dict:
+    return dict(zip(['v0', 'v1', 'v2', 'v3'], make_versions()))
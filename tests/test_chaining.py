@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+import chaining_methods as cm
+from chaining_methods.name_codes import get_name_codes
+
+
+def _get_version(records: list) -> pd.DataFrame:
+    # Species records of (name with authors, accepted name with authors)
+    rows = []
+    for name, accepted in records:
+        species = accepted.rsplit(' ', 1)[0] if isinstance(accepted, str) else np.nan
+        rows.append({'taxon_name': name.rsplit(' ', 1)[0], 'taxon_name_w_authors': name, 'taxon_rank': 'Species',
+                     'taxon_status': 'Accepted' if name == accepted else 'Synonym', 'genus': name.split(' ')[0],
+                     'accepted_name_w_author': accepted, 'accepted_name': species, 'accepted_species': species,
+                     'accepted_species_w_author': accepted})
+    return pd.DataFrame(rows)
+
+
+# Dd d has two resolutions in the old version and Ee e has none, so neither is compared. Bb b and Gg g resolve differently when
+# chained through the old version than directly in the new version
+_old = _get_version([('Aa a L.', 'Aa a L.'), ('Bb b L.', 'Aa a L.'), ('Cc c L.', 'Cc c L.'), ('Dd d L.', 'Cc c L.'),
+                     ('Dd d L.', 'Aa a L.'), ('Ee e L.', np.nan), ('Gg g L.', 'Cc c L.')])
+_new = _get_version([('Aa a L.', 'Ff f L.'), ('Ff f L.', 'Ff f L.'), ('Cc c L.', 'Cc c L.'), ('Bb b L.', 'Cc c L.'), ('Dd d L.', 'Dd d L.'),
+                     ('Ee e L.', 'Cc c L.'), ('Gg g L.', 'Fa x L.'), ('Fa x L.', 'Fa x L.')])
+
+
+def _drop_codes(df: pd.DataFrame) -> pd.DataFrame:
+    return df[[c for c in df.columns if not c.endswith('_code')]]
+
+
+def test_chain_two_databases():
+    chained = cm.chain_two_databases(_old, _new, 'v0', 'v1', None)
+    chained = dict(zip(chained['taxon_name_w_authors'], chained['v1_chained_accepted_name_w_author']))
+    assert chained == {'Aa a L.': 'Ff f L.', 'Bb b L.': 'Ff f L.', 'Cc c L.': 'Cc c L.', 'Gg g L.': 'Cc c L.'}
+
+    direct = cm.get_direct_name_updates(_old, _new, 'v1', None)
+    direct = dict(zip(direct['taxon_name_w_authors'], direct['v1_direct_accepted_name_w_author']))
+    assert direct == {'Aa a L.': 'Ff f L.', 'Bb b L.': 'Cc c L.', 'Cc c L.': 'Cc c L.', 'Dd d L.': 'Dd d L.', 'Ee e L.': 'Cc c L.',
+                      'Gg g L.': 'Fa x L.'}
+
+
+def test_compare_two_versions(tmp_path):
+    result = cm.compare_two_versions(_old, _new, 'v0', 'v1', str(tmp_path))
+    assert result.counts == [4, 2, 2, 2, 0]
+    assert sorted(result.get_table('all_results')['taxon_name_w_authors']) == ['Bb b L.', 'Gg g L.']
+    assert cm.read_pair_result(str(tmp_path / 'v0_v1')).counts == result.counts
+
+
+def test_shared_name_dictionary(taxa_versions):
+    # Codes stored on the versions by encode_all_versions give the same results as a dictionary built for the pair
+    versions = list(taxa_versions.values())
+    fresh = [v.copy() for v in versions]
+    name_dictionary = cm.encode_all_versions(versions)
+    shared = cm.compare_two_versions(versions[1], versions[3], 'v1', 'v3', name_dictionary=name_dictionary)
+    assert shared.counts == cm.compare_two_versions(fresh[1], fresh[3], 'v1', 'v3').counts
+
+    names = versions[0]['taxon_name_w_authors']
+    assert (cm.decode_names(cm.encode_names(names, name_dictionary), name_dictionary)[names.notna()] == names[names.notna()]).all()
+    # Stored codes are only used with the dictionary they were built from
+    other_dictionary = cm.build_name_dictionary(versions[2:])
+    assert (get_name_codes(versions[2], 'taxon_name_w_authors', other_dictionary) ==
+            cm.encode_names(versions[2]['taxon_name_w_authors'], other_dictionary)).all()
+
+
+def test_chain_versions_matches_successive_pairs(taxa_versions):
+    versions = list(taxa_versions.values())
+    # Chain one pair at a time, as full_chain_results used to
+    chained = cm.chain_two_databases(versions[0], versions[1], 'v0', 'v1', None)
+    chain_tag = 'v0'
+    for i in range(2, len(versions)):
+        chain_tag += f'_{i - 1}'
+        previous = chained.rename(columns={f'v{i - 1}_chained_accepted_name_w_author': 'accepted_name_w_author',
+                                           f'v{i - 1}_chained_accepted_species': 'accepted_species'})
+        previous = previous[['taxon_name_w_authors', 'accepted_name_w_author', 'accepted_species']]
+        chained = cm.chain_two_databases(previous, versions[i], chain_tag, f'v{i}', None)
+
+    composed = cm.chain_versions(versions[0], versions[1:], 'v0', 'v3', None, chain_tag=chain_tag)
+    pd.testing.assert_frame_equal(_drop_codes(chained), _drop_codes(composed), check_dtype=False)
+
+    graph = cm.ResolutionGraph(list(taxa_versions), taxa_versions)
+    pd.testing.assert_frame_equal(_drop_codes(graph.get_chained_records('v0', chain_tag=chain_tag)), _drop_codes(composed),
+                                  check_dtype=False)
+
+
+def test_wfo_versions_are_unique():
+    from WFO_versions.get_WFO import all_wfo_version_strings, wfo_version_strings_after_v10
+
+    assert len(set(all_wfo_version_strings)) == len(all_wfo_version_strings)
+    assert set(wfo_version_strings_after_v10) <= set(all_wfo_version_strings)
+
+
+def test_all_pairs_match_two_versions(tmp_path, taxa_versions):
+    matrices = cm.compare_all_version_pairs(taxa_versions, str(tmp_path), detail_pairs=[('v0', 'v2')])
+    tags = list(taxa_versions)
+    rank_summaries = pd.read_csv(tmp_path / 'all_pairs_by_rank.csv')
+    for i, old_tag in enumerate(tags):
+        for new_tag in tags[i + 1:]:
+            counts = cm.compare_two_versions(taxa_versions[old_tag], taxa_versions[new_tag], old_tag, new_tag).counts
+            assert [matrices[measure].at[old_tag, new_tag] for measure in matrices] == counts
+            assert cm.read_pair_result(str(tmp_path / f'{old_tag}_{new_tag}')).counts == counts
+
+            rank_summary = pd.read_csv(tmp_path / f'{old_tag}_{new_tag}' / 'rank_summary.csv', index_col=0)
+            pair_rank_summaries = rank_summaries[(rank_summaries['old'] == old_tag) & (rank_summaries['new'] == new_tag)]
+            pd.testing.assert_frame_equal(rank_summary, pair_rank_summaries.drop(columns=['old', 'new']).set_index(rank_summary.index.name),
+                                          check_dtype=False)
+            assert rank_summary['original_names'].sum() == counts[0]
+    assert (tmp_path / 'v0_v2' / 'all_results.csv').is_file()
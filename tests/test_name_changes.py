@@ -0,0 +1,43 @@
+import filecmp
+import os
+
+import numpy as np
+import pytest
+
+from analysis.analyse_number_of_changes import helper_functions
+
+
+def _analyse_separately(old_taxa, new_taxa, old_tag: str, new_tag: str):
+    # Each analysis on its own, as do_all_analyses_for_a_pair used to run them
+    helper_functions.get_species_differences(old_taxa, new_taxa, old_tag, new_tag)
+    helper_functions.get_species_differences(old_taxa, new_taxa, old_tag, new_tag, with_authorship=True)
+    helper_functions.get_accepted_species_that_become_unaccepted(old_taxa, new_taxa, old_tag, new_tag)
+    helper_functions.get_unaccepted_species_that_become_accepted(old_taxa, new_taxa, old_tag, new_tag)
+    helper_functions.get_names_that_resolve_in_old_but_not_in_new(old_taxa, new_taxa, old_tag, new_tag)
+
+
+@pytest.mark.parametrize('with_homotypic_synonyms', [True, False])
+def test_fused_analyses_match_separate_analyses(tmp_path, monkeypatch, taxa_versions, with_homotypic_synonyms):
+    rng = np.random.default_rng(1)
+    for tag, taxa in taxa_versions.items():
+        # Records without a status, or with statuses other than accepted and synonym
+        taxa.loc[rng.random(len(taxa)) < 0.05, 'taxon_status'] = np.nan
+        taxa.loc[rng.random(len(taxa)) < 0.05, 'taxon_status'] = 'Illegitimate'
+        if not with_homotypic_synonyms:
+            taxa_versions[tag] = taxa.drop(columns=['homotypic_synonym'])
+
+    out_dirs = {}
+    for name, analyse in [('separate', _analyse_separately), ('fused', helper_functions.do_all_analyses_for_a_pair)]:
+        monkeypatch.setattr(helper_functions, '_output_path', str(tmp_path / name))
+        for old_tag, new_tag in [('v0', 'v1'), ('v0', 'v3'), ('v2', 'v1')]:
+            analyse(taxa_versions[old_tag].copy(), taxa_versions[new_tag].copy(), old_tag, new_tag)
+        out_dirs[name] = str(tmp_path / name)
+
+    compared = 0
+    for dir_path, _, files in os.walk(out_dirs['separate']):
+        for file_name in files:
+            separate_file = os.path.join(dir_path, file_name)
+            fused_file = separate_file.replace(out_dirs['separate'], out_dirs['fused'])
+            assert filecmp.cmp(separate_file, fused_file, shallow=False), separate_file
+            compared += 1
+    assert compared == 3 * 5
@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from chaining_methods.pipeline import Pipeline, Stage, pipeline_main
+
+# Stages run by the tests, in the order they ran
+runs = []
+# Units which fail when run, to interrupt a stage
+failing_units = set()
+
+
+def parse():
+    runs.append('parse')
+
+
+def compare(unit: str, context: dict):
+    if unit in failing_units:
+        raise RuntimeError(f'{unit} failed')
+    runs.append(f'compare {unit} {context["setup"]}')
+
+
+def setup_compare():
+    runs.append('setup')
+    return {'setup': 'done'}
+
+
+def plot():
+    runs.append('plot')
+
+
+@pytest.fixture(autouse=True)
+def clear_runs():
+    runs.clear()
+    failing_units.clear()
+
+
+def _get_pipeline(state_dir, input_file=None, params: dict = None) -> Pipeline:
+    return Pipeline([
+        Stage('parse', parse, params=params, input_files=(lambda: [str(input_file)]) if input_file is not None else None),
+        Stage('compare', compare, ['parse'], units=lambda: ['a_b', 'a_c', 'b_c'], setup=setup_compare),
+        Stage('plot', plot, ['compare']),
+    ], str(state_dir))
+
+
+def test_run_skips_stages_that_are_up_to_date(tmp_path):
+    pipeline = _get_pipeline(tmp_path)
+    pipeline.run()
+    assert runs == ['parse', 'setup', 'compare a_b done', 'compare a_c done', 'compare b_c done', 'plot']
+
+    runs.clear()
+    _get_pipeline(tmp_path).run()
+    assert runs == []
+    assert _get_pipeline(tmp_path).get_status()['complete'].all()
+
+
+def test_stages_after_a_changed_stage_are_rerun(tmp_path):
+    _get_pipeline(tmp_path, params={'ranks': 'all'}).run()
+    runs.clear()
+    # The key of each stage includes the keys of the stages it depends on
+    _get_pipeline(tmp_path, params={'ranks': 'species'}).run(['plot'])
+    assert runs == ['parse', 'setup', 'compare a_b done', 'compare a_c done', 'compare b_c done', 'plot']
+
+
+def test_key_changes_with_input_files(tmp_path):
+    input_file = tmp_path / 'release.csv'
+    input_file.write_text('a,b')
+    key = _get_pipeline(tmp_path / 'state', input_file).get_key('parse')
+    assert _get_pipeline(tmp_path / 'state', input_file).get_key('parse') == key
+    # Hashes of input files are stored with the state of the pipeline
+    assert len(list((tmp_path / 'state' / 'file_hashes').iterdir())) == 1
+
+    input_file.write_text('a,b,c')
+    changed_key = _get_pipeline(tmp_path / 'state', input_file).get_key('parse')
+    assert changed_key != key
+    assert _get_pipeline(tmp_path / 'state', input_file).get_key('compare') != _get_pipeline(tmp_path / 'state').get_key('compare')
+
+    input_file.unlink()
+    assert _get_pipeline(tmp_path / 'state', input_file).get_key('parse') not in [key, changed_key]
+
+
+def test_interrupted_stage_resumes_at_the_first_incomplete_unit(tmp_path):
+    failing_units.add('a_c')
+    with pytest.raises(RuntimeError):
+        _get_pipeline(tmp_path).run()
+    assert runs == ['parse', 'setup', 'compare a_b done']
+    with open(tmp_path / 'compare.json') as f:
+        state = json.load(f)
+    assert state['units'] == ['a_b'] and not state['complete']
+
+    runs.clear()
+    failing_units.clear()
+    _get_pipeline(tmp_path).run()
+    assert runs == ['setup', 'compare a_c done', 'compare b_c done', 'plot']
+
+
+def test_setup_is_skipped_when_no_units_are_left(tmp_path):
+    _get_pipeline(tmp_path).run()
+    with open(tmp_path / 'compare.json') as f:
+        state = json.load(f)
+    # A stage whose units all completed, but which was stopped before it was recorded as complete
+    state['complete'] = False
+    with open(tmp_path / 'compare.json', 'w') as f:
+        json.dump(state, f)
+
+    runs.clear()
+    _get_pipeline(tmp_path).run(['compare'])
+    assert runs == []
+    assert _get_pipeline(tmp_path).get_status().at['compare', 'complete']
+
+
+def test_force(tmp_path):
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['run'])
+    runs.clear()
+    # Only the given stage is rerun, as the stages it depends on are up to date
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['run', '--force', 'compare'])
+    assert runs == ['setup', 'compare a_b done', 'compare a_c done', 'compare b_c done']
+
+    runs.clear()
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['run', '--force'])
+    assert runs == ['parse', 'setup', 'compare a_b done', 'compare a_c done', 'compare b_c done', 'plot']
+
+
+def test_only(tmp_path):
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['run', '--only', 'plot'])
+    assert runs == ['plot']
+
+    runs.clear()
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['run', 'plot'])
+    assert runs == ['parse', 'setup', 'compare a_b done', 'compare a_c done', 'compare b_c done']
+
+    with pytest.raises(SystemExit):
+        pipeline_main(_get_pipeline(tmp_path), 'test', ['run', '--only'])
+
+
+def test_status_runs_nothing(tmp_path, capsys):
+    pipeline_main(_get_pipeline(tmp_path), 'test', ['status'])
+    assert runs == []
+    assert 'compare' in capsys.readouterr().out
+
+
+def test_invalid_pipelines(tmp_path):
+    with pytest.raises(ValueError):
+        Pipeline([Stage('plot', plot, ['compare'])], str(tmp_path))
+    pipeline = Pipeline([Stage('parse', parse, ['plot']), Stage('plot', plot, ['parse'])], str(tmp_path))
+    with pytest.raises(ValueError):
+        pipeline.run()
+
+
+def test_analysis_stages_only_hash_the_chaining_modules_they_use():
+    pytest.importorskip('seaborn')
+    from analysis.pipeline import get_pipeline
+
+    stages = get_pipeline().stages
+
+    def get_chaining_modules(name: str) -> set:
+        return {source.__name__ for source in stages[name].source if getattr(source, '__name__', '').startswith('chaining_methods.')}
+
+    assert get_chaining_modules('wcvp_parse') == {'chaining_methods.version_cache'}
+    assert {'chaining_methods.all_pairs', 'chaining_methods.chain_engine', 'chaining_methods.resolution_map'} <= \
+        get_chaining_modules('wcvp_pairs')
+    assert 'chaining_methods.all_paths' in get_chaining_modules('wcvp_summaries')
+    assert 'chaining_methods.all_paths' not in get_chaining_modules('wcvp_pairs')
+    # Modules no stage uses
+    assert not any('chaining_methods.name_history' in get_chaining_modules(name) for name in stages)